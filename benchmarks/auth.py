@@ -0,0 +1,122 @@
+#what @jwt_required() costs per request, with every token fully verified (how it used to be) & with the claims cache,
+#next to a route without auth. Also times POST /api/token & shows its rate limit kicking in
+#run from the project folder:  python -m benchmarks.auth --requests 5000 --tokens 100
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+os.environ.setdefault('IMAGE_CACHE_PATH', '')
+
+from flask_jwt_extended import jwt_required, verify_jwt_in_request
+
+from rangers_shop import app, jwt
+from rangers_shop.api_tokens import issue_tokens, get_token_limiter
+from rangers_shop.cache import LRUCache
+from rangers_shop.models import ApiClient, db
+
+
+
+#two bare routes so we only measure auth, not a database query
+@app.route('/benchmark/open')
+def open_route():
+    return ''
+
+
+@app.route('/benchmark/auth')
+@jwt_required()
+def auth_route():
+    return ''
+
+
+def make_clients(count):
+
+    clients = []
+    for number in range(count):
+        client = ApiClient(f"benchmark {number}")
+        secret = client.new_secret()
+        db.session.add(client)
+        clients.append((client.client_id, secret))
+    db.session.commit()
+
+    return clients
+
+
+#microseconds per request, median & p95
+def per_request(function, count):
+
+    times = []
+    for number in range(count):
+        start = time.perf_counter()
+        function(number)
+        times.append(time.perf_counter() - start)
+
+    cuts = statistics.quantiles(times, n = 100, method = 'inclusive')
+    return cuts[49] * 1e6, cuts[94] * 1e6
+
+
+def measure(label, client, headers, count, baseline = None):
+
+    request_median, request_p95 = per_request(lambda number: client.get('/benchmark/auth', headers = headers[number % len(headers)]), count)
+
+    #just verify_jwt_in_request(), the request context is set up outside the timing
+    times = []
+    for number in range(count):
+        with app.test_request_context(headers = headers[number % len(headers)]):
+            start = time.perf_counter()
+            verify_jwt_in_request()
+            times.append(time.perf_counter() - start)
+    verify_median = statistics.median(times) * 1e6
+
+    overhead = f"{request_median - baseline:9.1f}" if baseline is not None else f"{'':>9}"
+    print(f"  {label:<28} {verify_median:9.1f} {request_median:9.1f} {request_p95:9.1f} {overhead}")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Per request cost of JWT auth, with & without the claims cache.')
+    parser.add_argument('--requests', type = int, default = 5000)
+    parser.add_argument('--tokens', type = int, default = 100, help = 'Different clients/tokens taking turns (at least 2).')
+    args = parser.parse_args()
+
+    client = app.test_client()
+
+    with app.app_context():
+        db.create_all()
+        clients = make_clients(args.tokens)
+        headers = [{'Authorization': f"Bearer {issue_tokens(client_id)['access_token']}"} for client_id, _ in clients]
+
+        cache = jwt.claims_cache
+
+        print(f"{args.requests} requests over {args.tokens} tokens, microseconds")
+        print(f"  {'':<28} {'verify':>9} {'request':>9} {'p95':>9} {'overhead':>9}")
+
+        open_median, open_p95 = per_request(lambda number: client.get('/benchmark/open'), args.requests)
+        print(f"  {'no auth':<28} {'':>9} {open_median:9.1f} {open_p95:9.1f}")
+
+        jwt.claims_cache = None
+        measure('full verify every request', client, headers, args.requests, open_median)
+
+        jwt.claims_cache = cache or LRUCache(maxsize = 10000, ttl = 300)
+        measure('cached claims', client, headers, args.requests, open_median)
+        print(f"  claims cache: {jwt.cache_stats()}")
+
+        #the token endpoint, spread over clients & ips so it stays under the rate limit while we time it
+        def token(number):
+            client_id, secret = clients[1 + number % (len(clients) - 1)]
+            response = client.post('/api/token', json = {'client_id': client_id, 'client_secret': secret}, environ_base = {'REMOTE_ADDR': f"10.0.{number // 250}.{number % 250}"})
+            assert response.status_code == 200, response.get_data(as_text = True)
+        token_median, token_p95 = per_request(token, min(args.requests, 5 * (len(clients) - 1)))
+        print(f"  {'POST /api/token':<28} {'':>9} {token_median:9.1f} {token_p95:9.1f}")
+
+        #one client hammering it
+        client_id, secret = clients[0]
+        codes = [client.post('/api/token', json = {'client_id': client_id, 'client_secret': secret}).status_code for _ in range(app.config['TOKEN_RATE_LIMIT'] * 2)]
+        print(f"  {len(codes)} token requests in a row from one client: {codes.count(200)} ok, {codes.count(429)} rate limited ({get_token_limiter().stats()})")
+
+
+if __name__ == '__main__':
+    main()
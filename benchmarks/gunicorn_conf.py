@@ -0,0 +1,3 @@
+#gunicorn settings for python -m benchmarks.load --target gunicorn (it passes the workers & port itself)
+accesslog = None
+loglevel = 'warning'
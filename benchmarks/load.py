@@ -0,0 +1,324 @@
+#mixed api workload against a seeded database: p50/p95/p99 latency, throughput & sql queries per endpoint
+#run from the project folder:
+#  python -m benchmarks.load                                  (flask test client, in this process)
+#  python -m benchmarks.load --target gunicorn --workers 4    (a real local gunicorn)
+#add --save-baseline to store the numbers in benchmarks/baselines/<target>.json, every run after that
+#fails (exit code 1) if an endpoint got slower or runs more queries than the baseline
+#baselines are only fair on the machine that saved them
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCHMARK_DATABASE_URL') or 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+os.environ.setdefault('IMAGE_CACHE_PATH', '')
+os.environ.setdefault('IMAGE_FETCHER', 'rangers_shop.helpers:stub_image')
+os.environ.setdefault('TOKEN_RATE_LIMIT', '1000000') #we're one client on one ip, time the endpoint not its 429s
+os.environ.setdefault('INSTRUMENTATION_ENABLED', 'true') #the sql statement count per request comes from its Server-Timing header
+os.environ.setdefault('PROFILE_SLOW_MS', '60000') #no slow request warnings in the middle of the numbers
+
+from flask_jwt_extended import create_access_token
+
+from rangers_shop import app
+from rangers_shop.models import ApiClient, db
+from benchmarks.seed import seed, add_arguments
+
+
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines')
+
+#roughly what our traffic looks like: mostly browsing, some checkouts, a few cart edits
+MIX = {
+    'token': 5,
+    'shop': 55,
+    'create_order': 20,
+    'update_order': 15,
+    'delete_order': 5
+}
+
+
+
+#everything a worker thread needs to make up the next request
+class Workload():
+
+    def __init__(self, data, token, client):
+        self.data = data
+        self.client = client #{'client_id', 'client_secret'} of an ApiClient for POST /api/token
+        self.headers = {'Authorization': f"Bearer {token}"}
+        self.lines = list(data['lines']) #delete_order uses these up
+        self._lock = threading.Lock()
+
+
+    def next_request(self, rng):
+
+        name = rng.choices(list(MIX), weights = list(MIX.values()))[0]
+
+        if name == 'delete_order':
+            with self._lock:
+                line = self.lines.pop(rng.randrange(len(self.lines))) if self.lines else None
+            if line is None: #nothing left to delete, edit something instead
+                name = 'update_order'
+            else:
+                return name, 'DELETE', f"/api/order/delete/{line[0]}", {'prod_id': line[1]}
+
+        if name == 'token':
+            return name, 'POST', '/api/token', self.client
+
+        if name == 'shop':
+            params = rng.choice(['', '&in_stock=true', '&min_price=10&max_price=50', '&name=Product%201', '&fields=name,price,prod_id'])
+            return name, 'GET', f"/api/shop?limit={rng.choice([20, 50, 100])}{params}", None
+
+        if name == 'create_order':
+            order = [{'prod_id': prod_id, 'quantity': rng.randint(1, 3)} for prod_id in rng.sample(self.data['prod_ids'], rng.randint(1, 3))]
+            return name, 'POST', f"/api/order/create/{rng.choice(self.data['cust_ids'])}", {'order': order}
+
+        with self._lock:
+            order_id, prod_id = rng.choice(self.lines)
+        return 'update_order', 'PUT', f"/api/order/update/{order_id}", {'prod_id': prod_id, 'quantity': rng.randint(1, 5)}
+
+
+
+#instrumentation.py tells us how many statements a request ran: Server-Timing: db;dur=1.2;desc="5 queries"
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+def query_count(server_timing):
+    match = QUERY_COUNT.search(server_timing or '')
+    return match.group(1) if match else None
+
+
+#the two ways we send requests, both hand back (status code, sql statements it ran)
+def test_client_sender():
+
+    client = app.test_client()
+
+    def send(method, path, body, headers):
+        response = client.open(path, method = method, json = body, headers = headers)
+        return response.status_code, query_count(', '.join(response.headers.getlist('Server-Timing')))
+
+    return send
+
+
+def http_sender(base_url):
+
+    import requests
+    session = requests.Session()
+
+    def send(method, path, body, headers):
+        response = session.request(method, base_url + path, json = body, headers = headers)
+        return response.status_code, query_count(response.headers.get('Server-Timing')) #requests joins them with ', '
+
+    return send
+
+
+def run(workload, make_sender, requests, concurrency, warmup, seed_value):
+
+    results = {name: {'latencies': [], 'queries': [], 'errors': 0} for name in MIX}
+    counter = {'next': 0}
+    lock = threading.Lock()
+
+    def worker(number):
+        rng = random.Random(seed_value + number)
+        send = make_sender()
+
+        while True:
+            with lock:
+                index = counter['next']
+                counter['next'] += 1
+            if index >= warmup + requests:
+                return
+
+            name, method, path, body = workload.next_request(rng)
+            start = time.perf_counter()
+            status, queries = send(method, path, body, workload.headers)
+            elapsed = time.perf_counter() - start
+
+            if index < warmup:
+                continue
+
+            with lock:
+                result = results[name]
+                result['latencies'].append(elapsed)
+                if queries is not None:
+                    result['queries'].append(int(queries))
+                if status >= 400:
+                    result['errors'] += 1
+
+    threads = [threading.Thread(target = worker, args = (number,)) for number in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, time.perf_counter() - start
+
+
+def summarize(results, seconds):
+
+    summary = {'throughput': round(sum(len(result['latencies']) for result in results.values()) / seconds, 1), 'endpoints': {}}
+
+    for name, result in results.items():
+        latencies = result['latencies']
+        if len(latencies) < 2:
+            continue
+
+        cuts = statistics.quantiles(latencies, n = 100, method = 'inclusive')
+        summary['endpoints'][name] = {
+            'requests': len(latencies),
+            'errors': result['errors'],
+            'p50_ms': round(cuts[49] * 1000, 3),
+            'p95_ms': round(cuts[94] * 1000, 3),
+            'p99_ms': round(cuts[98] * 1000, 3),
+            'throughput': round(len(latencies) / seconds, 1),
+            'queries': round(statistics.mean(result['queries']), 2) if result['queries'] else None
+        }
+
+    return summary
+
+
+def report(summary):
+
+    print(f"{'endpoint':<14} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'queries':>8}")
+    for name, stats in summary['endpoints'].items():
+        print(f"{name:<14} {stats['requests']:>8} {stats['errors']:>6} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['throughput']:>8.1f} {stats['queries'] if stats['queries'] is not None else '-':>8}")
+    print(f"overall throughput: {summary['throughput']:.1f} req/s")
+
+
+#what got worse than the baseline, an empty list means we passed
+def regressions(summary, baseline, tolerance):
+
+    problems = []
+
+    if summary['throughput'] < baseline['throughput'] * (1 - tolerance):
+        problems.append(f"throughput {summary['throughput']:.1f} req/s, baseline {baseline['throughput']:.1f}")
+
+    for name, stats in summary['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+
+        if stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {stats['p95_ms']:.2f} ms, baseline {old['p95_ms']:.2f} ms")
+
+        #query counts don't depend on the machine, so these get a lot less slack
+        if stats['queries'] is not None and old['queries'] is not None and stats['queries'] > old['queries'] + max(0.5, old['queries'] * 0.1):
+            problems.append(f"{name}: {stats['queries']} queries per request, baseline {old['queries']}")
+
+        if stats['errors'] > stats['requests'] * 0.01:
+            problems.append(f"{name}: {stats['errors']} of {stats['requests']} requests failed")
+
+    return problems
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+#start gunicorn on the seeded database & wait until it answers
+def start_gunicorn(workers):
+
+    port = free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(root, 'benchmarks', 'gunicorn_conf.py'), '-w', str(workers), '-b', f"127.0.0.1:{port}", 'rangers_shop:app'],
+        cwd = root, env = os.environ.copy()
+    )
+
+    import requests
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics/pool", timeout = 5)
+            return server, f"http://127.0.0.1:{port}"
+        except requests.RequestException: #not listening yet or the workers are still importing the app
+            if server.poll() is not None:
+                raise SystemExit("gunicorn didn't start")
+            time.sleep(0.2)
+
+    server.terminate()
+    server.wait()
+    raise SystemExit("gunicorn didn't answer in time")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Mixed workload benchmark for the api.')
+    parser.add_argument('--target', choices = ['client', 'gunicorn'], default = 'client')
+    parser.add_argument('--requests', type = int, default = 2000)
+    parser.add_argument('--warmup', type = int, default = 100)
+    parser.add_argument('--concurrency', type = int, default = None, help = 'Threads sending requests (1 for client, 4 for gunicorn).')
+    parser.add_argument('--workers', type = int, default = 2, help = 'gunicorn workers.')
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--tolerance', type = float, default = 0.3, help = 'How much slower than the baseline still passes (0.3 = 30%%).')
+    parser.add_argument('--save-baseline', action = 'store_true')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    concurrency = args.concurrency or (1 if args.target == 'client' else 4)
+
+    with app.app_context():
+        data = seed(args.products, args.customers, args.orders, args.lines_per_order)
+        token = create_access_token(identity = 'benchmark')
+        api_client = ApiClient('benchmark')
+        client = {'client_id': api_client.client_id, 'client_secret': api_client.new_secret()}
+        db.session.add(api_client)
+        db.session.commit()
+
+    workload = Workload(data, token, client)
+    server = None
+
+    try:
+        if args.target == 'client':
+            make_sender = test_client_sender
+        else:
+            server, base_url = start_gunicorn(args.workers)
+            make_sender = lambda: http_sender(base_url)
+
+        results, seconds = run(workload, make_sender, args.requests, concurrency, args.warmup, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(results, seconds)
+    report(summary)
+
+    path = os.path.join(BASELINES, f"{args.target}.json")
+
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok = True)
+        with open(path, 'w') as file:
+            json.dump(summary, file, indent = 2)
+        print(f"saved baseline to {path}")
+        return
+
+    if not os.path.exists(path):
+        print(f"no baseline at {path} yet (run with --save-baseline)")
+        return
+
+    with open(path) as file:
+        problems = regressions(summary, json.load(file), args.tolerance)
+
+    if problems:
+        print("REGRESSIONS:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    print("no regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#logins per second through POST /signin for a few password hashing policies (PASSWORD_HASH_METHOD)
+#run from the project folder:  python -m benchmarks.passwords --logins 40 --threads 4 pbkdf2:sha256:600000 scrypt:32768:8:1
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+os.environ.setdefault('IMAGE_CACHE_PATH', '')
+
+from rangers_shop import app
+from rangers_shop.models import User, db
+
+
+
+PASSWORD = 'correct horse battery staple'
+
+
+def make_users(count, method):
+
+    app.config['PASSWORD_HASH_METHOD'] = method
+    db.session.execute(db.delete(User))
+    db.session.add_all([User(f"bench{i}", f"bench{i}@example.com", PASSWORD) for i in range(count)])
+    db.session.commit()
+
+
+def login_rate(users, logins, threads):
+
+    latencies = []
+    lock = threading.Lock()
+    counter = {'next': 0}
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                number = counter['next']
+                counter['next'] += 1
+            if number >= logins:
+                return
+
+            start = time.perf_counter()
+            response = client.post('/signin', data = {'email': f"bench{number % users}@example.com", 'password': PASSWORD})
+            elapsed = time.perf_counter() - start
+            assert response.headers['Location'] == '/', "login failed"
+            client.get('/logout')
+
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target = worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    return logins / seconds, statistics.median(latencies), max(latencies)
+
+
+def report(label, rate, median, worst):
+    print(f"  {label:<42} {rate:7.1f} logins/s   median {median * 1000:7.1f} ms   max {worst * 1000:7.1f} ms")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Login throughput per password hashing policy.')
+    parser.add_argument('policies', nargs = '*', default = ['pbkdf2:sha256:600000', 'pbkdf2:sha256:260000', 'scrypt:32768:8:1'])
+    parser.add_argument('--users', type = int, default = 8)
+    parser.add_argument('--logins', type = int, default = 40)
+    parser.add_argument('--threads', type = int, default = 4)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        db.create_all()
+
+        print(f"{args.logins} logins, {args.threads} threads, {app.config['PASSWORD_VERIFY_WORKERS']} verify workers")
+        for policy in args.policies:
+            make_users(args.users, policy)
+            report(policy, *login_rate(args.users, args.logins, args.threads))
+
+        #hashes made under the first policy, logging in under the last one: the first login per user also rehashes
+        if len(args.policies) > 1:
+            make_users(args.users, args.policies[0])
+            app.config['PASSWORD_HASH_METHOD'] = args.policies[-1]
+            report(f"upgrade {args.policies[0]} -> {args.policies[-1]}", *login_rate(args.users, args.users, args.threads))
+
+            db.session.expire_all()
+            upgraded = sum(1 for user in User.query.all() if user.password.startswith(args.policies[-1] + '$'))
+            print(f"  {upgraded}/{args.users} hashes upgraded")
+
+
+if __name__ == '__main__':
+    main()
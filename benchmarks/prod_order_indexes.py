@@ -0,0 +1,119 @@
+#query plans & timings for the prod_order lookups our order routes make, without & with the
+#(order_id, prod_id) and (cust_id) indexes, on a made up table of millions of line items
+#run from the project folder:  python -m benchmarks.prod_order_indexes 2000000
+#uses a throwaway sqlite file unless BENCHMARK_DATABASE_URL points at a scratch postgres database (it gets wiped!)
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCHMARK_DATABASE_URL') or 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('CATALOG_CACHE_ENABLED', 'false')
+os.environ.setdefault('IMAGE_CACHE_PATH', '')
+
+from rangers_shop import app
+from rangers_shop.models import Customer, Order, ProdOrder, Product, db
+from rangers_shop.orders import order_lines
+
+
+
+INDEXES = [index for index in ProdOrder.__table__.indexes if index.name in ('ix_prod_order_order_id_prod_id', 'ix_prod_order_cust_id')]
+
+
+def seed(count, batch_size = 50000):
+
+    products = [str(uuid.uuid4()) for _ in range(10000)]
+    customers = [str(uuid.uuid4()) for _ in range(max(count // 20, 1))] #about 20 lines per customer
+    orders = [str(uuid.uuid4()) for _ in range(max(count // 5, 1))] #& 5 per order
+
+    db.session.execute(db.insert(Product), [
+        {'prod_id': prod_id, 'name': f"Product {i}", 'image': 'https://placehold.co/400x400', 'description': 'A very nice product', 'price': Decimal('9.99'), 'quantity': 100}
+        for i, prod_id in enumerate(products)
+    ])
+    db.session.execute(db.insert(Customer), [{'cust_id': cust_id} for cust_id in customers])
+    db.session.execute(db.insert(Order), [{'order_id': order_id, 'order_total': Decimal('49.95')} for order_id in orders])
+
+    order_customer = {order_id: random.choice(customers) for order_id in orders}
+    start = time.perf_counter()
+
+    for offset in range(0, count, batch_size):
+        rows = []
+        for _ in range(min(batch_size, count - offset)):
+            order_id = random.choice(orders)
+            rows.append({
+                'prodorder_id': str(uuid.uuid4()), 'prod_id': random.choice(products), 'quantity': 1,
+                'price': Decimal('9.99'), 'order_id': order_id, 'cust_id': order_customer[order_id]
+            })
+        db.session.execute(db.insert(ProdOrder.__table__), rows)
+        db.session.commit()
+        print(f"  {offset + len(rows):,} line items ({(offset + len(rows)) / (time.perf_counter() - start):,.0f}/s)", end = "\r")
+
+    print()
+    return order_customer
+
+
+#the queries our routes run against prod_order, each takes one sample (order_id, cust_id, prod_id)
+QUERIES = {
+    'cart line (update/delete)': lambda sample: db.select(ProdOrder.prodorder_id).where(ProdOrder.order_id == sample['order_id'], ProdOrder.prod_id == sample['prod_id']),
+    'order lines (batch edit)': lambda sample: order_lines(ProdOrder.order_id == sample['order_id']),
+    'customer lines (get_order)': lambda sample: order_lines(ProdOrder.cust_id == sample['cust_id']),
+}
+
+
+def explain(query):
+
+    connection = db.session.connection()
+    sql = query.compile(connection, compile_kwargs = {'literal_binds': True})
+
+    if connection.dialect.name == 'postgresql':
+        return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")]
+    return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def measure(samples):
+
+    for label, build in QUERIES.items():
+        times = []
+        for sample in samples:
+            start = time.perf_counter()
+            db.session.execute(build(sample)).all()
+            times.append(time.perf_counter() - start)
+
+        print(f"  {label:<28} median {statistics.median(times) * 1000:9.3f} ms   max {max(times) * 1000:9.3f} ms")
+        for line in explain(build(samples[0])):
+            print(f"      {line}")
+
+
+def main(count, sample_size = 50):
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for index in INDEXES:
+            index.drop(db.engine) #start with the table the way it used to be
+
+        print(f"seeding {count:,} prod_order rows")
+        order_customer = seed(count)
+
+        lines = db.session.execute(db.select(ProdOrder.order_id, ProdOrder.prod_id).limit(10000)).all()
+        samples = [{'order_id': order_id, 'prod_id': prod_id, 'cust_id': order_customer[order_id]} for order_id, prod_id in random.sample(lines, min(sample_size, len(lines)))]
+
+        print("before (no indexes)")
+        measure(samples[:5]) #full scans, a handful is plenty
+
+        db.session.commit() #let go of our read so sqlite lets us build the indexes
+        start = time.perf_counter()
+        for index in INDEXES:
+            index.create(db.engine)
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+        print(f"after (indexes built in {time.perf_counter() - start:.1f}s)")
+        measure(samples)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
@@ -0,0 +1,184 @@
+#GET /api/reports/... latency as the order history grows (100k -> 1M -> 10M order lines by default), next to the
+#same top sellers report added up straight from prod_order, plus what a rebuild & an incremental refresh cost
+#run from the project folder:  python -m benchmarks.reports --lines 100000 1000000 10000000
+#uses a throwaway sqlite file unless BENCHMARK_DATABASE_URL points at a scratch postgres database (it gets wiped!)
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCHMARK_DATABASE_URL') or 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+os.environ.setdefault('IMAGE_CACHE_PATH', '')
+
+from flask_jwt_extended import create_access_token
+
+from rangers_shop import app
+from rangers_shop.models import Customer, CustomerSummary, Order, OrderSummary, ProdOrder, Product, db
+from rangers_shop.orders import place_order
+from rangers_shop import sales_reports
+from rangers_shop.order_history import rebuild_history
+
+
+
+def seed_catalog(products, customers, rng):
+
+    prod_ids = [str(uuid.uuid4()) for _ in range(products)]
+    db.session.execute(db.insert(Product), [
+        {'prod_id': prod_id, 'name': f"Product {i}", 'image': 'https://placehold.co/400x400', 'price': Decimal('9.99'), 'quantity': rng.randint(0, 500) if i % 10 == 0 else 1000000}
+        for i, prod_id in enumerate(prod_ids)
+    ])
+
+    cust_ids = [f"bench-customer-{i}" for i in range(customers)]
+    db.session.execute(db.insert(Customer), [{'cust_id': cust_id} for cust_id in cust_ids])
+    db.session.commit()
+
+    return prod_ids, cust_ids #every 10th product is running low, the low stock report has something to find
+
+
+#add order lines (3 per order) spread over the `days` days before today until there are `target` of them
+def seed_lines(have, target, prod_ids, cust_ids, days, rng, batch_size = 30000):
+
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    start = time.perf_counter()
+    added = 0
+
+    while have + added < target:
+        orders, lines = [], []
+        for _ in range(min(batch_size, target - have - added) // 3 or 1):
+            order_id = str(uuid.uuid4())
+            cust_id = rng.choice(cust_ids)
+            orders.append({'order_id': order_id, 'order_total': Decimal('29.97'), 'date_created': today - timedelta(seconds = rng.randrange(days * 86400))})
+            for prod_id in rng.sample(prod_ids, 3):
+                lines.append({'prodorder_id': str(uuid.uuid4()), 'prod_id': prod_id, 'quantity': 1, 'price': Decimal('9.99'), 'order_id': order_id, 'cust_id': cust_id})
+
+        db.session.execute(db.insert(Order), orders)
+        db.session.execute(db.insert(ProdOrder.__table__), lines)
+        db.session.commit()
+
+        added += len(lines)
+        print(f"  {have + added:,} order lines ({added / (time.perf_counter() - start):,.0f}/s)", end = "\r")
+
+    print()
+    return have + added
+
+
+#the order history summaries for the seeded orders, last touched back when the order was placed (like real old orders)
+def history():
+
+    rebuild_history()
+    db.session.execute(db.update(OrderSummary).values(date_updated = OrderSummary.date_created).execution_options(synchronize_session = False))
+    db.session.execute(db.update(CustomerSummary).values(date_updated = CustomerSummary.last_order_at).execution_options(synchronize_session = False))
+    db.session.commit()
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+#today's orders going through the real checkout code, then the refresh that picks them up
+def refresh_after_orders(count, prod_ids, cust_ids, rng):
+
+    for _ in range(count):
+        place_order(rng.choice(cust_ids), [(prod_id, 1) for prod_id in rng.sample(prod_ids[1::10], 3)]) #ones with plenty of stock
+    db.session.commit()
+
+    return timed(sales_reports.refresh_rollups)
+
+
+#the report without rollups: top sellers for the last 30 days added up from every order line in that window
+def direct_top_sellers():
+
+    since = datetime.utcnow() - timedelta(days = 30)
+    return db.session.execute(
+        db.select(ProdOrder.prod_id, db.func.sum(ProdOrder.quantity).label('units'))
+        .join(Order, Order.order_id == ProdOrder.order_id)
+        .where(Order.date_created >= since)
+        .group_by(ProdOrder.prod_id)
+        .order_by(db.desc('units'))
+        .limit(20)
+    ).all()
+
+
+REPORTS = {
+    'revenue by day (1y)': lambda end: f"/api/reports/revenue?group=day&start={end - timedelta(days = 364)}&end={end}",
+    'revenue by product': lambda end: f"/api/reports/revenue?group=product&end={end}",
+    'revenue by customer': lambda end: f"/api/reports/revenue?group=customer&end={end}",
+    'top sellers (30d)': lambda end: f"/api/reports/top-sellers?end={end}",
+    'low stock': lambda end: "/api/reports/low-stock",
+}
+
+
+def measure(client, headers, samples):
+
+    end = datetime.utcnow().date()
+    results = {}
+
+    for label, url in REPORTS.items():
+        times = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            response = client.get(url(end), headers = headers)
+            times.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text = True)
+        results[label] = statistics.median(times)
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Sales report latency as the order history grows.')
+    parser.add_argument('--lines', type = int, nargs = '+', default = [100000, 1000000, 10000000], help = 'Order line counts to measure at.')
+    parser.add_argument('--products', type = int, default = 10000)
+    parser.add_argument('--customers', type = int, default = 50000)
+    parser.add_argument('--days', type = int, default = 365, help = 'How far back the seeded orders go.')
+    parser.add_argument('--samples', type = int, default = 20, help = 'Requests per report.')
+    parser.add_argument('--direct-samples', type = int, default = 3, help = 'Runs of the report without rollups.')
+    parser.add_argument('--seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    rows = []
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        prod_ids, cust_ids = seed_catalog(args.products, args.customers, rng)
+        headers = {'Authorization': f"Bearer {create_access_token(identity = 'benchmark')}"}
+
+        have = 0
+        for target in sorted(args.lines):
+            print(f"seeding up to {target:,} order lines")
+            have = seed_lines(have, target, prod_ids, cust_ids, args.days, rng)
+            history()
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+
+            _, rebuild = timed(sales_reports.rebuild_rollups) #the seeded lines skip the write paths, so recount all of it
+            (days, refresh) = refresh_after_orders(200, prod_ids, cust_ids, rng)
+            direct = statistics.median(timed(direct_top_sellers)[1] for _ in range(args.direct_samples))
+
+            rows.append((have, rebuild, refresh, days, direct, measure(client, headers, args.samples)))
+
+    print()
+    print(f"{'order lines':>12} {'rebuild s':>10} {'refresh ms':>11}  " + "  ".join(f"{label:>19}" for label in REPORTS) + f"  {'top sellers direct':>19}")
+    for have, rebuild, refresh, days, direct, results in rows:
+        print(
+            f"{have:>12,} {rebuild:>10.1f} {refresh * 1000:>8.1f} ({days}d)  "
+            + "  ".join(f"{results[label] * 1000:>16.2f} ms" for label in REPORTS)
+            + f"  {direct * 1000:>16.2f} ms"
+        )
+    print("report columns are the median ms per request through the test client, refresh is 200 new orders' worth")
+
+
+if __name__ == '__main__':
+    main()
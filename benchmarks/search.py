@@ -0,0 +1,148 @@
+#GET /api/search latency on a big made up catalog (1M products by default), for searches of common, rare & several words
+#run from the project folder:  python -m benchmarks.search --products 1000000
+#uses a throwaway sqlite file (our search_term index) unless BENCHMARK_DATABASE_URL points at a scratch postgres
+#database (full text + pg_trgm, it gets wiped!)
+import argparse
+import itertools
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCHMARK_DATABASE_URL') or 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+os.environ.setdefault('CATALOG_CACHE_ENABLED', 'false') #we want the query every time, not the cached page
+os.environ.setdefault('IMAGE_CACHE_PATH', '')
+
+from flask_jwt_extended import create_access_token
+
+from rangers_shop import app
+from rangers_shop.models import Product, db
+from rangers_shop.search import index_products, using_postgres
+from rangers_shop.stats import rebuild_shop_stats
+
+
+
+#made up words, a few show up everywhere & most are rare (roughly how words in real catalogs are spread out)
+def make_vocabulary(size, rng):
+    return [''.join(rng.choices(string.ascii_lowercase, k = rng.randint(4, 9))) for _ in range(size)]
+
+
+def seed(count, vocabulary, rng, batch_size = 20000):
+
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary)))) #zipf, cumulative so choices() doesn't add them up every call
+    start = time.perf_counter()
+
+    for offset in range(0, count, batch_size):
+        rows = []
+        for _ in range(min(batch_size, count - offset)):
+            rows.append({
+                'prod_id': str(uuid.uuid4()),
+                'name': ' '.join(rng.choices(vocabulary, cum_weights = weights, k = 3)).title(),
+                'description': ' '.join(rng.choices(vocabulary, cum_weights = weights, k = 10)),
+                'image': 'https://placehold.co/400x400', 'price': Decimal('9.99'), 'quantity': 100
+            })
+
+        db.session.execute(db.insert(Product), rows)
+        index_products((row['prod_id'], row['name'], row['description']) for row in rows) #bulk inserts skip the session events, same call products_io makes
+        db.session.commit()
+
+        done = offset + len(rows)
+        print(f"  {done:,} products ({done / (time.perf_counter() - start):,.0f}/s with the search index)", end = "\r")
+
+    rebuild_shop_stats()
+    db.session.commit()
+    print()
+
+
+#what people type, from the same vocabulary so there is something to find
+def make_searches(vocabulary, rng, samples):
+    common, middle, rare = vocabulary[:20], vocabulary[100:1000], vocabulary[5000:]
+    return {
+        'common word': [rng.choice(common) for _ in range(samples)],
+        'uncommon word': [rng.choice(middle) for _ in range(samples)],
+        'rare word': [rng.choice(rare) for _ in range(samples)],
+        'two words': [f"{rng.choice(common)} {rng.choice(middle)}" for _ in range(samples)],
+        'three words': [f"{rng.choice(common)} {rng.choice(common)} {rng.choice(middle)}" for _ in range(samples)],
+        'no match': ['zzzzzz' for _ in range(samples)],
+    }
+
+
+def measure(client, headers, searches):
+
+    print(f"  {'search':<16} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'page 2 p50':>11} {'results':>8}")
+    for label, texts in searches.items():
+        first, second, results = [], [], []
+
+        for text in texts:
+            start = time.perf_counter()
+            response = client.get('/api/search', query_string = {'q': text, 'fields': 'name,prod_id,price'}, headers = headers)
+            first.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text = True)
+            results.append(len(response.json))
+
+            if response.headers.get('X-Next-Cursor'):
+                start = time.perf_counter()
+                client.get('/api/search', query_string = {'q': text, 'fields': 'name,prod_id,price', 'cursor': response.headers['X-Next-Cursor']}, headers = headers)
+                second.append(time.perf_counter() - start)
+
+        cuts = statistics.quantiles(first, n = 100, method = 'inclusive')
+        page_two = f"{statistics.median(second) * 1000:11.2f}" if second else f"{'-':>11}"
+        print(f"  {label:<16} {cuts[49] * 1000:9.2f} {cuts[94] * 1000:9.2f} {max(first) * 1000:9.2f} {page_two} {statistics.mean(results):8.1f}")
+
+
+#what searching would cost without an index: name/description LIKE '%word%', a rare word means reading nearly every row
+def measure_scan(words):
+
+    times = []
+    for word in words:
+        start = time.perf_counter()
+        db.session.execute(
+            db.select(Product.name).where(db.or_(Product.name.ilike(f"%{word}%"), Product.description.ilike(f"%{word}%"))).limit(21)
+        ).all()
+        times.append(time.perf_counter() - start)
+
+    print(f"  {'LIKE scan':<16} {statistics.median(times) * 1000:9.2f} {'':>9} {max(times) * 1000:9.2f}   (no index, for comparison)")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'GET /api/search latency on a big catalog.')
+    parser.add_argument('--products', type = int, default = 1000000)
+    parser.add_argument('--vocabulary', type = int, default = 50000, help = 'Distinct made up words.')
+    parser.add_argument('--samples', type = int, default = 50, help = 'Searches per kind.')
+    parser.add_argument('--seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+
+    with app.app_context():
+        db.drop_all()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            db.session.commit()
+        db.create_all()
+
+        print(f"seeding {args.products:,} products ({'postgres full text' if using_postgres() else 'search_term index'})")
+        start = time.perf_counter()
+        seed(args.products, vocabulary, rng)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        print(f"  took {time.perf_counter() - start:.1f}s")
+
+        headers = {'Authorization': f"Bearer {create_access_token(identity = 'benchmark')}"}
+
+    client = app.test_client()
+    measure(client, headers, make_searches(vocabulary, rng, args.samples))
+
+    with app.app_context():
+        measure_scan([rng.choice(vocabulary[5000:]) for _ in range(3)]) #full scans, a few is plenty
+
+
+if __name__ == '__main__':
+    main()
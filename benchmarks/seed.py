@@ -0,0 +1,78 @@
+#fill a database with made up products, customers & orders (through our models, the same way the routes build them)
+#run from the project folder:  DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.seed --products 1000 --customers 200 --orders 1000
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from rangers_shop.models import Customer, Order, ProdOrder, Product, db
+from rangers_shop.stats import rebuild_shop_stats
+from rangers_shop.order_history import rebuild_history
+
+
+
+#returns what the load generator needs to pick from: product ids, customer ids & (order_id, prod_id) line items
+def seed(products = 1000, customers = 200, orders = 1000, lines_per_order = 3, stock = 1000000, batch_size = 1000):
+
+    start = time.perf_counter()
+    db.drop_all()
+    db.create_all()
+
+    catalog = []
+    for i in range(products):
+        price = Decimal(random.randint(100, 10000)) / 100
+        product = Product(f"Product {i}", price, stock, image = 'https://placehold.co/400x400', description = f"Benchmark product number {i}")
+        db.session.add(product)
+        catalog.append((product.prod_id, price))
+
+        if len(db.session.new) >= batch_size:
+            db.session.commit()
+
+    cust_ids = [f"bench-customer-{i}" for i in range(customers)]
+    db.session.add_all([Customer(cust_id) for cust_id in cust_ids])
+    db.session.commit()
+
+    lines = []
+    for _ in range(orders):
+        cust_id = random.choice(cust_ids)
+        order = Order()
+        db.session.add(order)
+
+        for prod_id, price in random.sample(catalog, min(lines_per_order, len(catalog))):
+            prodorder = ProdOrder(prod_id, 1, price, order.order_id, cust_id)
+            db.session.add(prodorder)
+            order.increment_order_total(prodorder.price)
+            lines.append((order.order_id, prod_id))
+
+        if len(db.session.new) >= batch_size:
+            db.session.commit()
+
+    rebuild_shop_stats()
+    rebuild_history()
+    db.session.commit()
+
+    print(f"seeded {products} products, {customers} customers, {orders} orders ({len(lines)} line items) in {time.perf_counter() - start:.1f}s")
+
+    return {
+        'prod_ids': [prod_id for prod_id, _ in catalog],
+        'cust_ids': cust_ids,
+        'lines': lines
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument('--products', type = int, default = 1000)
+    parser.add_argument('--customers', type = int, default = 200)
+    parser.add_argument('--orders', type = int, default = 1000)
+    parser.add_argument('--lines-per-order', type = int, default = 3)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Seed the database in DATABASE_URL (it gets wiped!) with benchmark data.')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    from rangers_shop import app
+
+    with app.app_context():
+        seed(args.products, args.customers, args.orders, args.lines_per_order)
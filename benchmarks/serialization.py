@@ -0,0 +1,77 @@
+#compare the old marshmallow + jsonify path with our tuple serializers for a big catalog
+#run from the project folder:  python -m benchmarks.serialization 10000 100000
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ.setdefault('CATALOG_CACHE_ENABLED', 'false')
+
+from flask import jsonify
+
+from rangers_shop import app
+from rangers_shop.models import Product, db, products_schema
+from rangers_shop.serializers import PRODUCT_FIELDS, dump_rows, stream_rows
+
+
+
+def seed(count):
+
+    db.session.execute(db.delete(Product))
+    db.session.execute(db.insert(Product), [
+        {
+            'prod_id': f"{i:08d}", 'name': f"Product {i}", 'image': 'https://placehold.co/400x400',
+            'description': 'A very nice product', 'price': Decimal(i % 10000) / 100, 'quantity': i % 50
+        }
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def timed(label, func, repeat = 3):
+
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all() #no cheating with objects left over from the last run
+        start = time.perf_counter()
+        size = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"  {label:<30} {best * 1000:9.1f} ms  ({size / 1024 / 1024:.1f} MB)")
+    return best
+
+
+def marshmallow_path():
+    with app.test_request_context():
+        return len(jsonify(products_schema.dump(Product.query.all())).get_data())
+
+
+def tuple_path():
+    rows = db.session.execute(db.select(*[getattr(Product, field) for field in PRODUCT_FIELDS])).all()
+    return len(dump_rows(rows, PRODUCT_FIELDS))
+
+
+def streaming_path():
+    rows = db.session.execute(db.select(*[getattr(Product, field) for field in PRODUCT_FIELDS]).execution_options(yield_per = 1000))
+    return sum(len(chunk) for chunk in stream_rows(rows, PRODUCT_FIELDS))
+
+
+def main(sizes):
+
+    with app.app_context():
+        db.create_all()
+
+        for count in sizes:
+            seed(count)
+            print(f"{count} products")
+            old = timed('marshmallow + jsonify', marshmallow_path)
+            new = timed('tuples + dump_rows', tuple_path)
+            timed('tuples + stream_rows', streaming_path)
+            print(f"  speedup: {old / new:.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
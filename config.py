@@ -21,9 +21,122 @@ class Config():
 
     FLASK_APP = os.environ.get('FLASK_APP') #looking for the key of Flask_APP in our .env file 
     FLASK_ENV = os.environ.get('FLASK_ENV')
-    FLASK_DEBUG = True 
+    FLASK_DEBUG = False #DevelopmentConfig turns this on
     SECRET_KEY = os.environ.get('SECRET_KEY') or "Nana nana boo boo, you'll never guess this" #just needs to be present 
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False #hide update messages 
+    #read replicas, comma separated. Only routes marked @read_only (& reports/exports) read from them, see RoutingSession
+    SQLALCHEMY_BINDS = {f'replica{number}': url.strip() for number, url in enumerate(os.environ.get('DATABASE_REPLICA_URLS', '').split(','), start = 1) if url.strip()}
+    REPLICA_BINDS = list(SQLALCHEMY_BINDS)
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
-    JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=365)
\ No newline at end of file
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes = int(os.environ.get('JWT_ACCESS_MINUTES', 15))) #short, POST /api/token/refresh gets a new one
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days = int(os.environ.get('JWT_REFRESH_DAYS', 30)))
+    JWT_CLAIMS_CACHE_SIZE = int(os.environ.get('JWT_CLAIMS_CACHE_SIZE', 10000)) #verified tokens each worker remembers, 0 checks every token in full
+    JWT_CLAIMS_CACHE_TTL = int(os.environ.get('JWT_CLAIMS_CACHE_TTL', 300)) #seconds, never longer than the token itself is valid
+    REVOCATION_REFRESH_SECONDS = int(os.environ.get('REVOCATION_REFRESH_SECONDS', 5)) #how long a token revoked in another worker can keep working there
+    TOKEN_RATE_LIMIT = int(os.environ.get('TOKEN_RATE_LIMIT', 10)) #POST /api/token tries per ip & per client id...
+    TOKEN_RATE_WINDOW = int(os.environ.get('TOKEN_RATE_WINDOW', 60)) #...every this many seconds, per worker
+    RESERVATION_MINUTES = int(os.environ.get('RESERVATION_MINUTES', 15)) #how long a cart can hold onto stock before it goes back in the shop
+    IMAGE_FETCHER = os.environ.get('IMAGE_FETCHER') or 'rangers_shop.helpers:get_image' #swap for rangers_shop.helpers:stub_image to work offline
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2)) #0 looks the image up right away inside the request
+    IMAGE_TIMEOUT = float(os.environ.get('IMAGE_TIMEOUT', 5)) #seconds
+    IMAGE_RETRIES = int(os.environ.get('IMAGE_RETRIES', 3))
+    IMAGE_BACKOFF = float(os.environ.get('IMAGE_BACKOFF', 0.5)) #seconds, doubles after every failed try
+    IMAGE_CACHE_SIZE = int(os.environ.get('IMAGE_CACHE_SIZE', 1024)) #how many lookups each worker keeps in memory
+    IMAGE_CACHE_TTL = int(os.environ.get('IMAGE_CACHE_TTL', 86400)) #seconds
+    IMAGE_CACHE_NEGATIVE_TTL = int(os.environ.get('IMAGE_CACHE_NEGATIVE_TTL', 900)) #seconds to remember "no image found"
+    IMAGE_CACHE_PATH = os.environ.get('IMAGE_CACHE_PATH', os.path.join(basedir, 'image_cache.sqlite')) #shared between workers, empty turns it off
+    SHOP_PAGE_SIZE = int(os.environ.get('SHOP_PAGE_SIZE', 50)) #products per page in GET /api/shop
+    SHOP_MAX_PAGE_SIZE = int(os.environ.get('SHOP_MAX_PAGE_SIZE', 200))
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20)) #results per page in GET /api/search
+    SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 100))
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20)) #orders per page in GET /api/order/<cust_id>/history
+    HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 100))
+    REPORT_DEFAULT_DAYS = int(os.environ.get('REPORT_DEFAULT_DAYS', 30)) #GET /api/reports/... without start/end
+    REPORT_MAX_DAYS = int(os.environ.get('REPORT_MAX_DAYS', 366))
+    REPORT_PAGE_SIZE = int(os.environ.get('REPORT_PAGE_SIZE', 20)) #products/customers per report
+    REPORT_MAX_PAGE_SIZE = int(os.environ.get('REPORT_MAX_PAGE_SIZE', 500))
+    LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 10)) #this many left or fewer is low stock
+    LOW_STOCK_SALES_DAYS = int(os.environ.get('LOW_STOCK_SALES_DAYS', 14)) #how far back we look for how fast something sells
+    LOW_STOCK_COVER_DAYS = int(os.environ.get('LOW_STOCK_COVER_DAYS', 7)) #also low when it will sell out sooner than this
+    REPORT_REFRESH_SECONDS = int(os.environ.get('REPORT_REFRESH_SECONDS', 60)) #`flask reports refresh --every` default
+    ASYNC_CHECKOUT = os.environ.get('ASYNC_CHECKOUT', 'false').lower() == 'true' #orders wait in queued_order for `flask orders work`, for flash sales
+    CHECKOUT_BATCH_SIZE = int(os.environ.get('CHECKOUT_BATCH_SIZE', 100)) #queued orders per worker transaction
+    CHECKOUT_POLL_SECONDS = float(os.environ.get('CHECKOUT_POLL_SECONDS', 0.5)) #how long an idle worker waits before looking again
+    CATALOG_CACHE_ENABLED = os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 60)) #seconds, also how stale other workers can get without CATALOG_CACHE_SHARED
+    CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 512)) #pages per worker
+    CATALOG_CACHE_MAX_BYTES = int(os.environ.get('CATALOG_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    CATALOG_CACHE_SHARED = os.environ.get('CATALOG_CACHE_SHARED') #path to a sqlite file all workers (& `flask orders work`) share, off when empty
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000') #write out every number, ex: scrypt:32768:8:1. Old hashes get upgraded when people log in
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_VERIFY_WORKERS = int(os.environ.get('PASSWORD_VERIFY_WORKERS', 2)) #password checks running at once in each worker
+    PASSWORD_VERIFY_QUEUE = int(os.environ.get('PASSWORD_VERIFY_QUEUE', 8)) #how many more can wait their turn
+    PASSWORD_VERIFY_WAIT = float(os.environ.get('PASSWORD_VERIFY_WAIT', 2)) #seconds to wait for a turn before telling them to try again
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000)) #logged in users each worker remembers
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60)) #seconds, also how long other workers can show an old name/email
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'false').lower() == 'true' #request/sql timings, Server-Timing headers & GET /metrics counters
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0)) #0.01 runs 1 in 100 requests under cProfile
+    PROFILE_SLOW_MS = int(os.environ.get('PROFILE_SLOW_MS', 500)) #slower than this gets logged (& its profile saved if it had one)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(basedir, 'profiles'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') #when set, /metrics/... wants "Authorization: Bearer <token>", without it only localhost gets in
+
+
+
+#our laptops: sqlite (or a local postgres) & the debugger on
+class DevelopmentConfig(Config):
+
+    FLASK_DEBUG = os.environ.get('FLASK_DEBUG', 'true').lower() == 'true'
+
+
+
+#{bind: url} -> {bind: {'url': url, **engine options}} (a function, a loop in the class body leaves its variable behind as config)
+def bind_options(binds, options):
+    return {key: {'url': url, **options} for key, url in binds.items()}
+
+
+#gunicorn in front of postgres. Every worker gets its own pool so the most connections we can open is
+#workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW), keep that under postgres' max_connections
+class ProductionConfig(Config):
+
+    FLASK_DEBUG = False
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5)) #connections each worker keeps open
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5)) #extra connections a worker can open when it's busy, closed again after
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10)) #seconds to wait for a free connection before giving up
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800)) #seconds, swap out connections before the server/load balancer drops them
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000)) #milliseconds, postgres cancels anything slower. 0 turns it off
+    DB_QUERY_CACHE_SIZE = int(os.environ.get('DB_QUERY_CACHE_SIZE', 0)) #how many compiled statements sqlalchemy keeps, 0 keeps its default (500)
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True #checks the connection is still alive before handing it out, costs a tiny round trip
+    }
+
+    if DB_QUERY_CACHE_SIZE:
+        SQLALCHEMY_ENGINE_OPTIONS['query_cache_size'] = DB_QUERY_CACHE_SIZE
+
+    if Config.SQLALCHEMY_DATABASE_URI.startswith('postgres') and DB_STATEMENT_TIMEOUT:
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'}
+
+    #flask-sqlalchemy doesn't hand SQLALCHEMY_ENGINE_OPTIONS to the other binds, so the replicas get the same pool settings here
+    SQLALCHEMY_BINDS = bind_options(Config.SQLALCHEMY_BINDS, SQLALCHEMY_ENGINE_OPTIONS)
+
+
+
+#pick one with APP_CONFIG (development or production)
+configs = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig
+}
+
+
+def get_config(name = None):
+
+    name = name or os.environ.get('APP_CONFIG') or 'development'
+    if name not in configs:
+        raise ValueError(f"APP_CONFIG should be one of {', '.join(configs)}, not {name!r}")
+    return configs[name]
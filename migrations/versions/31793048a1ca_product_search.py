@@ -0,0 +1,54 @@
+"""product search
+
+Revision ID: 31793048a1ca
+Revises: 5dcefaf5c181
+Create Date: 2026-10-18 09:56:46.137328
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '31793048a1ca'
+down_revision = '5dcefaf5c181'
+branch_labels = None
+depends_on = None
+
+
+#has to match models.product_document exactly or postgres won't use the index
+PRODUCT_DOCUMENT = "setweight(to_tsvector('english', name), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+
+
+#postgres searches the product table itself (full text + pg_trgm), everything else gets the search_term table.
+#on sqlite run `flask products reindex` after upgrading so the products we already have show up in searches
+def upgrade():
+    op.create_table('search_term',
+    sa.Column('term', sa.String(length=40), nullable=False),
+    sa.Column('prod_id', sa.String().with_variant(postgresql.UUID(as_uuid=False), 'postgresql'), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['prod_id'], ['product.prod_id'], ),
+    sa.PrimaryKeyConstraint('term', 'prod_id'),
+    sqlite_with_rowid=False
+    )
+    with op.batch_alter_table('search_term', schema=None) as batch_op:
+        batch_op.create_index('ix_search_term_prod_id', ['prod_id'], unique=False)
+        batch_op.create_index('ix_search_term_term_weight', ['term', sa.text('weight DESC'), 'prod_id'], unique=False)
+
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_product_search', 'product', [sa.text(f'({PRODUCT_DOCUMENT})')], postgresql_using='gin')
+        op.create_index('ix_product_name_trgm', 'product', ['name'], postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        op.drop_index('ix_product_name_trgm', table_name='product')
+        op.drop_index('ix_product_search', table_name='product')
+
+    with op.batch_alter_table('search_term', schema=None) as batch_op:
+        batch_op.drop_index('ix_search_term_term_weight')
+        batch_op.drop_index('ix_search_term_prod_id')
+
+    op.drop_table('search_term')
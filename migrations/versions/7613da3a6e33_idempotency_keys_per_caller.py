@@ -0,0 +1,57 @@
+"""idempotency keys per caller
+
+Revision ID: 7613da3a6e33
+Revises: e5ab7f62830a
+Create Date: 2026-10-18 11:47:15.119857
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7613da3a6e33'
+down_revision = 'e5ab7f62830a'
+branch_labels = None
+depends_on = None
+
+
+#the saved answers only live for a day & the old ones don't know whose key they were or which body they
+#answered, so the table starts over with (identity, key) as its primary key instead of being converted
+
+def upgrade():
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotency_key_date_created'))
+
+    op.drop_table('idempotency_key')
+
+    op.create_table('idempotency_key',
+    sa.Column('identity', sa.String(), nullable=False),
+    sa.Column('key', sa.String(length=200), nullable=False),
+    sa.Column('order_id', sa.String(), nullable=False),
+    sa.Column('request_hash', sa.String(length=64), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('identity', 'key')
+    )
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotency_key_date_created'), ['date_created'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotency_key_date_created'))
+
+    op.drop_table('idempotency_key')
+
+    op.create_table('idempotency_key',
+    sa.Column('key', sa.String(length=200), nullable=False),
+    sa.Column('order_id', sa.String(), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotency_key_date_created'), ['date_created'], unique=False)
@@ -1,24 +1,36 @@
 #external imports
+import logging
 from flask import Flask 
 from flask_migrate import Migrate 
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
 
 
 #internal imports
-from config import Config
+from config import get_config
 from .blueprints.site.routes import site
 from .blueprints.auth.routes import auth
 from .blueprints.api.routes import api 
+from .blueprints.metrics.routes import metrics
 from .models import login_manager, db
-from .helpers import JSONENcoder
+from .serializers import ShopJSONProvider
+from .commands import inventory_cli, stats_cli, orders_cli, products_cli, reports_cli, clients_cli
+from .api_tokens import ClaimsCachingJWTManager, revocations
+from .catalog_cache import catalog_cache
+from . import pool_metrics
+from .instrumentation import instrumentation
 
 
 
 app = Flask(__name__)
-app.config.from_object(Config)
-app.json_encoder = JSONENcoder  #were not instantiating an object of this class, we are just pointing to this class
-jwt = JWTManager(app) #anywhere in our app we can use this @jwt decorator to protect our routes 
+app.config.from_object(get_config()) #APP_CONFIG=production on the servers, development otherwise
+logging.basicConfig(level = app.config['LOG_LEVEL'], format = '%(asctime)s %(levelname)s %(name)s: %(message)s') #instead of print()
+app.json = ShopJSONProvider(app) #jsonify() uses this to turn Decimals (our prices) into exact strings
+jwt = ClaimsCachingJWTManager(app) #anywhere in our app we can use this @jwt decorator to protect our routes 
+
+
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    return revocations.is_revoked(jwt_payload) #a set lookup, the list is refreshed every REVOCATION_REFRESH_SECONDS
 
 
 login_manager.init_app(app)
@@ -30,12 +42,24 @@ login_manager.login_message_category = "warning"
 app.register_blueprint(site)
 app.register_blueprint(auth)
 app.register_blueprint(api)
+app.register_blueprint(metrics)
+
+app.cli.add_command(inventory_cli) #flask inventory ...
+app.cli.add_command(stats_cli) #flask stats ...
+app.cli.add_command(orders_cli) #flask orders ...
+app.cli.add_command(products_cli) #flask products import/export
+app.cli.add_command(reports_cli) #flask reports refresh/rebuild
+app.cli.add_command(clients_cli) #flask clients create/list/revoke
 
 
 # @app.route('/') #this is a route decorator 
 # def hello_world():
 #     return 'Hello, World!'
 
+pool_metrics.use_timed_pool(app) #has to happen before the engine gets built
 db.init_app(app)
+pool_metrics.init_app(app)
+instrumentation.init_app(app, db) #only does anything with INSTRUMENTATION_ENABLED=true
+catalog_cache.init_app(app)
 migrate = Migrate(app, db)
 CORS(app) #allows other apps to talk to our application 
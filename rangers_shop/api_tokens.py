@@ -0,0 +1,214 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token
+
+#internal imports
+from .models import ApiClient, RevokedToken, db
+from .cache import LRUCache
+from .rate_limit import RateLimiter
+
+
+
+#/api/token: apps we registered (ApiClient, `flask clients create`) trade their client id & secret for a short lived
+#access token (JWT_ACCESS_TOKEN_EXPIRES) plus a refresh token (JWT_REFRESH_TOKEN_EXPIRES) that gets them new ones.
+#checking a token on every @jwt_required() route is the hot path, so:
+#  - ClaimsCachingJWTManager remembers the claims of tokens it already verified (keyed by a sha256 of the token,
+#    never longer than the token is valid), a repeat request skips the base64/json/hmac work
+#  - revocations (logout, a disabled client) sit in a set in every worker, refreshed from the revoked_token table
+#    every REVOCATION_REFRESH_SECONDS, so the revocation check is a set lookup & not a query
+
+
+def epoch(moment):
+    return moment.replace(tzinfo = timezone.utc).timestamp() #our datetimes are naive utc
+
+
+class ClaimsCachingJWTManager(JWTManager):
+
+    def init_app(self, app, add_context_processor = False):
+        super().init_app(app, add_context_processor)
+
+        size = app.config['JWT_CLAIMS_CACHE_SIZE']
+        self.claims_cache = LRUCache(maxsize = size, ttl = app.config['JWT_CLAIMS_CACHE_TTL']) if size else None
+
+
+    #flask-jwt-extended sends every token through here (verify_jwt_in_request, decode_token)
+    def _decode_jwt_from_config(self, encoded_token, csrf_value = None, allow_expired = False):
+
+        if self.claims_cache is None or csrf_value is not None or allow_expired: #cookies & expired ones get the full check
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.sha256(encoded_token.encode()).digest()
+        claims = self.claims_cache.get(key)
+
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired) #raises for bad/expired tokens
+            left = claims['exp'] - time.time() if 'exp' in claims else self.claims_cache.ttl
+            if left > 0:
+                self.claims_cache.set(key, claims, ttl = min(left, self.claims_cache.ttl))
+
+        return dict(claims) #callers get their own copy
+
+
+    def cache_stats(self):
+        return self.claims_cache.stats() if self.claims_cache is not None else None
+
+
+
+#for /metrics, the manager lives on the app (our blueprints get imported before rangers_shop.jwt exists)
+def claims_cache_stats():
+    return current_app.extensions['flask-jwt-extended'].cache_stats()
+
+
+
+#every revoked token (by jti) & every client that got cut off (all tokens issued to it until then), for this worker
+class RevocationList():
+
+    OVERLAP = timedelta(seconds = 30) #re-read a bit, a revocation can commit a moment after its revoked_at
+
+    def __init__(self):
+        self._jtis = {} #jti -> when the token expires anyway (epoch)
+        self._clients = {} #client_id -> revoked_at (epoch), tokens issued at or before this are dead
+        self._loaded_to = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+
+    def is_revoked(self, claims):
+
+        self.refresh()
+
+        if claims.get('jti') in self._jtis:
+            return True
+
+        revoked_at = self._clients.get(claims.get('sub'))
+        return revoked_at is not None and claims.get('iat', 0) <= revoked_at
+
+
+    #pick up what other workers revoked, at most once every REVOCATION_REFRESH_SECONDS (one small query)
+    def refresh(self, force = False):
+
+        every = current_app.config['REVOCATION_REFRESH_SECONDS']
+        if not force and self._checked is not None and time.monotonic() - self._checked < every:
+            return
+
+        with self._lock:
+            if not force and self._checked is not None and time.monotonic() - self._checked < every:
+                return #another thread just did it
+
+            now = datetime.utcnow()
+            query = db.select(RevokedToken.jti, RevokedToken.client_id, RevokedToken.revoked_at, RevokedToken.expires_at) \
+                .where(RevokedToken.expires_at > now)
+            if self._loaded_to is not None:
+                query = query.where(RevokedToken.revoked_at >= self._loaded_to - self.OVERLAP)
+
+            for jti, client_id, revoked_at, expires_at in db.session.execute(query):
+                self._add(jti, client_id, revoked_at, expires_at)
+
+            #forget the ones that expired, an expired token fails on its own
+            self._jtis = {jti: expires for jti, expires in self._jtis.items() if expires > epoch(now)}
+
+            self._loaded_to = now
+            self._checked = time.monotonic()
+
+
+    def add(self, revoked):
+        with self._lock:
+            self._add(revoked.jti, revoked.client_id, revoked.revoked_at, revoked.expires_at)
+
+
+    def _add(self, jti, client_id, revoked_at, expires_at):
+
+        if jti:
+            self._jtis[jti] = epoch(expires_at)
+        if client_id:
+            self._clients[client_id] = max(self._clients.get(client_id, 0), epoch(revoked_at))
+
+
+    def clear(self):
+        with self._lock:
+            self._jtis.clear()
+            self._clients.clear()
+            self._loaded_to = None
+            self._checked = None
+
+
+    def __len__(self):
+        return len(self._jtis) + len(self._clients)
+
+
+revocations = RevocationList()
+
+
+
+_token_limiter = None
+_token_limiter_lock = threading.Lock()
+
+
+#TOKEN_RATE_LIMIT tries per TOKEN_RATE_WINDOW seconds, per ip & per client id (guessing secrets, token floods)
+def get_token_limiter():
+    global _token_limiter
+
+    with _token_limiter_lock:
+        if _token_limiter is None:
+            _token_limiter = RateLimiter(current_app.config['TOKEN_RATE_LIMIT'], current_app.config['TOKEN_RATE_WINDOW'])
+
+    return _token_limiter
+
+
+
+#the active client with this id & secret, None otherwise
+def authenticate(client_id, secret):
+
+    if not client_id or not secret:
+        return None
+
+    client = db.session.get(ApiClient, client_id)
+    if client is None or not client.active or not client.check_secret(secret):
+        return None
+
+    return client
+
+
+def issue_tokens(client_id):
+
+    return {
+        'access_token': create_access_token(identity = client_id),
+        'refresh_token': create_refresh_token(identity = client_id),
+        'token_type': 'Bearer',
+        'expires_in': int(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+    }
+
+
+#one token (logout, a refresh token that was just swapped for a new one). Call before the commit
+def revoke_token(claims):
+
+    revoked = RevokedToken(jti = claims['jti'], expires_at = datetime.utcfromtimestamp(claims['exp']))
+    db.session.add(revoked)
+
+    return revoked
+
+
+#everything a client was ever given, & it can't get new tokens (disabled). Call before the commit
+def revoke_client(client):
+
+    client.active = False
+
+    #the longest any token of theirs can still be valid
+    lifetime = max(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'], current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+    revoked = RevokedToken(client_id = client.client_id, expires_at = datetime.utcnow() + lifetime)
+    db.session.add(revoked)
+
+    return revoked
+
+
+#revoked_token rows for tokens that expired since, they can't be used anyway
+def purge_revocations():
+
+    result = db.session.execute(
+        db.delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()).execution_options(synchronize_session = False)
+    )
+
+    return result.rowcount
@@ -1,8 +1,25 @@
-from flask import Blueprint, request, jsonify 
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity 
+from flask import Blueprint, request, jsonify, current_app, url_for, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity 
+from werkzeug.http import http_date
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import json
+import math
 
 #internal imports 
-from rangers_shop.models import Customer, Product, ProdOrder, Order, db, product_schema, products_schema 
+from rangers_shop.models import ApiClient, Customer, Product, ProdOrder, Order, ShopStats, IdempotencyKey, QueuedOrder, OrderSummary, CustomerSummary, OutOfStock, db, read_only
+from rangers_shop.helpers import make_etag, not_modified, set_validators, to_money
+from rangers_shop.pagination import BadCursor, encode_cursor, decode_cursor, get_limit
+from rangers_shop.catalog_cache import catalog_cache
+from rangers_shop.serializers import PRODUCT_FIELDS, dump_rows, stream_rows
+from rangers_shop.orders import ORDER_LINE_FIELDS, UnknownProducts, order_lines, apply_cart_changes, clean_cart_changes, clean_order_lines, check_products_exist, place_order
+from rangers_shop import inventory, checkout_queue, order_history, sales_reports
+from rangers_shop.stats import adjust_shop_stats
+from rangers_shop.search import search_products
+from rangers_shop.order_history import HISTORY_FIELDS
+from rangers_shop.sales_reports import REVENUE_FIELDS, LOW_STOCK_FIELDS
+from rangers_shop.api_tokens import authenticate, issue_tokens, revoke_token, revocations, get_token_limiter
 
 
 
@@ -10,166 +27,670 @@ from rangers_shop.models import Customer, Product, ProdOrder, Order, db, product
 api = Blueprint('api', __name__, url_prefix = '/api') #all of our endpoints need to be prefixed with /api
 
 
-@api.route('/token', methods = ['GET', 'POST'])
+#apps trade their client id & secret (`flask clients create`) for a short lived access token & a refresh token
+@api.route('/token', methods = ['POST'])
 def token():
 
-    data = request.json
+    data = request.get_json(silent = True) or {}
+    client_id, secret = data.get('client_id'), data.get('client_secret')
 
-    if data:
-        client_id = data['client_id'] #looking for the key of client_id on the dictionary passed to us
-        access_token = create_access_token(identity=client_id) 
-        return {
-            'status' : 200,
-            'access_token' : access_token 
-        }
-    
-    else:
+    if not client_id or not secret:
         return {
             'status': 400,
-            'message': 'Missing Client Id. Try Again'
-        }
-    
+            'message': 'Missing client_id and/or client_secret. Try Again'
+        }, 400
+
+    limiter = get_token_limiter()
+
+    #guesses only cost the ip they come from, a client's own tries are only taken once we know it's really them
+    #(otherwise anyone who knows a client_id could use up that app's tokens)
+    wait = limiter.hit(f"ip:{request.remote_addr}")
+    if wait:
+        return too_many_token_requests(wait)
+
+    client = authenticate(client_id, secret)
+    if client is None:
+        return {
+            'status': 401,
+            'message': 'Unknown client or wrong secret'
+        }, 401
+
+    wait = limiter.hit(f"client:{client.client_id}")
+    if wait:
+        return too_many_token_requests(wait)
+
+    return {
+        'status': 200,
+        **issue_tokens(client.client_id)
+    }
+
+
+def too_many_token_requests(wait):
+    return {
+        'status': 429,
+        'message': 'Too many token requests, slow down!'
+    }, 429, {'Retry-After': str(math.ceil(wait))}
+
+
+#a refresh token gets a new pair, the old refresh token stops working (so a stolen one is only good once)
+@api.route('/token/refresh', methods = ['POST'])
+@jwt_required(refresh = True)
+def refresh_token():
+
+    client = db.session.get(ApiClient, get_jwt_identity())
+    if client is None or not client.active:
+        return {
+            'status': 401,
+            'message': 'This client was revoked'
+        }, 401
+
+    revoked = revoke_token(get_jwt())
+    try:
+        db.session.commit()
+    except IntegrityError: #the same refresh token came in twice at the same time & the other one got the new pair
+        db.session.rollback()
+        return {
+            'status': 401,
+            'message': 'That refresh token was already used'
+        }, 401
+    revocations.add(revoked)
+
+    return {
+        'status': 200,
+        **issue_tokens(client.client_id)
+    }
+
+
+#log out: the token sent (access or refresh) stops working
+@api.route('/token/revoke', methods = ['POST'])
+@jwt_required(verify_type = False)
+def revoke():
+
+    revoked = revoke_token(get_jwt())
+    db.session.commit()
+    revocations.add(revoked)
+
+    return {
+        'status': 200,
+        'message': 'Token revoked'
+    }
+
+
+#what we send back when a customer asks for more than we have
+def out_of_stock(error):
+    return {
+        'status': 409,
+        'message': 'Sorry, we do not have enough of that product in stock!',
+        'prod_ids': error.prod_ids
+    }, 409
+
+
+#an update/delete for a product that isn't on that order (or an order/product that doesn't exist)
+def not_on_order():
+    return {
+        'status': 404,
+        'message': 'That product is not on that order.'
+    }, 404
+
+
+#cheap "has anything changed?" checks for our conditional GETs, one small query each
+def catalog_version():
+
+    #the stats row changes when a product is deleted, which the max() below can't see
+    stats_updated = db.select(ShopStats.date_updated).where(ShopStats.stats_id == 1).scalar_subquery()
+
+    count, products_updated, stats_updated = db.session.execute(
+        db.select(db.func.count(Product.prod_id), db.func.max(db.func.coalesce(Product.date_updated, Product.date_added)), stats_updated)
+    ).one()
+
+    return count, max([stamp for stamp in (products_updated, stats_updated) if stamp], default = None)
+
+
+def order_version(cust_id):
+
+    row = db.session.execute(
+        db.select(Customer.date_updated, db.func.count(ProdOrder.prodorder_id), db.func.max(db.func.coalesce(Product.date_updated, Product.date_added)))
+        .select_from(Customer)
+        .outerjoin(ProdOrder, ProdOrder.cust_id == Customer.cust_id)
+        .outerjoin(Product, Product.prod_id == ProdOrder.prod_id)
+        .where(Customer.cust_id == cust_id)
+        .group_by(Customer.date_updated)
+    ).first()
+
+    if row is None: #no orders yet
+        return 0, None
+
+    customer_updated, count, products_updated = row
+    return count, max([stamp for stamp in (customer_updated, products_updated) if stamp], default = None)
+
+
+def not_modified_response(etag, last_modified):
+    return set_validators(current_app.response_class(status = 304), etag, last_modified)
+
+
+#?min_price= & ?max_price=, Decimal() takes "nan" & "inf" too & those would quietly filter out everything (or nothing)
+def price_arg(value):
+
+    price = Decimal(value)
+    if not price.is_finite():
+        raise InvalidOperation(value)
+
+    return price
+
 
 #creating our READ data request for shop
 @api.route('/shop')
 @jwt_required()
+@read_only #the catalog can be a second behind, so it comes from a read replica when we have one
 def get_shop():
 
-    shop = Product.query.all() #list of objects, we can't send a list of objects through api calls 
+    #one page at a time, oldest products first. Optional query params:
+    #  limit, cursor (from the X-Next-Cursor header of the last page), min_price, max_price,
+    #  in_stock=true, name (prefix), fields=prod_id,name,price (only send back these)
+    args = request.args
+
+    try:
+        limit = get_limit(args, current_app.config['SHOP_PAGE_SIZE'], current_app.config['SHOP_MAX_PAGE_SIZE'])
 
-    response = products_schema.dump(shop) #takes our list of objects and turns it into a list of dictionaries 
-    return jsonify(response) #jsonify essentially stringifies the list to send to our frontend 
+        query = Product.query
+
+        if args.get('cursor'):
+            date_added, prod_id = decode_cursor(args['cursor'], datetime, str)
+            #rows after the last one we sent, same as (date_added, prod_id) > (:date_added, :prod_id)
+            query = query.filter(db.or_(
+                Product.date_added > date_added,
+                db.and_(Product.date_added == date_added, Product.prod_id > prod_id)
+            ))
+
+        if args.get('min_price'):
+            query = query.filter(Product.price >= price_arg(args['min_price']))
+        if args.get('max_price'):
+            query = query.filter(Product.price <= price_arg(args['max_price']))
+        if args.get('in_stock', '').lower() in ('1', 'true', 'yes'):
+            query = query.filter(Product.quantity > 0)
+        if args.get('name'):
+            query = query.filter(Product.name.startswith(args['name'], autoescape = True))
+
+        fields = requested_fields(args)
+
+    except InvalidOperation:
+        return {
+            'status': 400,
+            'message': 'min_price and max_price need to be numbers. Please try again!'
+        }, 400
+
+    except (BadCursor, ValueError) as error: #bad cursor/limit or a field that isn't on ProductSchema
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
+
+    #the serialized page might already be in our catalog cache (no database at all)
+    generation = catalog_cache.generation()
+    page = catalog_cache.get(request.full_path, generation)
+
+    if page is None:
+        #nothing changed since the last time this client asked for this page? skip the query & the json
+        count, last_modified = catalog_version()
+        etag = make_etag(count, last_modified)
+        if not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        page = shop_page(query, fields, limit, etag, last_modified)
+        catalog_cache.set(request.full_path, page, generation, size = len(page['body']))
+
+    elif not_modified(page['etag'], page['last_modified']):
+        return not_modified_response(page['etag'], page['last_modified'])
+
+    response = current_app.response_class(page['body'], mimetype = 'application/json')
+
+    if page['next_cursor']:
+        response.headers['X-Next-Cursor'] = page['next_cursor']
+        response.headers['Link'] = f'<{url_for("api.get_shop", **{**args.to_dict(), "cursor": page["next_cursor"]})}>; rel="next"'
+
+    return set_validators(response, page['etag'], page['last_modified'])
+
+
+#?fields=prod_id,name,price, every product field when they don't say
+def requested_fields(args):
+
+    fields = sorted({field for field in args.get('fields', '').split(',') if field}) or PRODUCT_FIELDS
+    if not set(fields) <= set(PRODUCT_FIELDS):
+        raise ValueError(f"fields can only be: {', '.join(PRODUCT_FIELDS)}")
+
+    return fields
+
+
+#run the query for one page of /api/shop & serialize it, this is what goes in the catalog cache
+def shop_page(query, fields, limit, etag, last_modified):
+
+    #just the columns we need as plain tuples (plus date_added & prod_id at the end for the cursor)
+    columns = [getattr(Product, field) for field in fields] + [Product.date_added, Product.prod_id]
+
+    #grab one extra row so we know if there is another page
+    rows = query.with_entities(*columns).order_by(Product.date_added, Product.prod_id).limit(limit + 1).all()
+    next_page = rows[limit:]
+    rows = rows[:limit]
+
+    return {
+        'body': dump_rows(rows, fields), #zip() stops at the last field so the cursor columns never show up in the json
+        'etag': etag,
+        'last_modified': http_date(last_modified) if last_modified else None,
+        'next_cursor': encode_cursor(rows[-1][-2], rows[-1][-1]) if next_page else None
+    }
+
+
+#search the catalog instead of downloading all of it, best matches first (see rangers_shop/search.py)
+#query params: q (the words), limit, cursor (from X-Next-Cursor), fields (same as /api/shop)
+@api.route('/search')
+@jwt_required()
+@read_only
+def search():
+
+    args = request.args
+    text = args.get('q', '').strip()
+
+    if not text:
+        return {
+            'status': 400,
+            'message': 'Missing q, what are we searching for?'
+        }, 400
+
+    try:
+        limit = get_limit(args, current_app.config['SEARCH_PAGE_SIZE'], current_app.config['SEARCH_MAX_PAGE_SIZE'])
+        after = decode_cursor(args['cursor'], float, str) if args.get('cursor') else None
+        fields = requested_fields(args)
+
+    except (BadCursor, ValueError) as error:
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
+
+    #popular searches come straight out of the catalog cache, any product change clears it
+    generation = catalog_cache.generation()
+    page = catalog_cache.get(request.full_path, generation)
+
+    if page is None:
+        rows = search_products(text, [getattr(Product, field) for field in fields], limit + 1, after)
+        next_page = rows[limit:]
+        rows = rows[:limit]
+
+        page = {
+            'body': dump_rows(rows, fields), #rank & prod_id ride along at the end for the cursor
+            'next_cursor': encode_cursor(rows[-1][-2], rows[-1][-1]) if next_page else None
+        }
+        catalog_cache.set(request.full_path, page, generation, size = len(page['body']))
+
+    response = current_app.response_class(page['body'], mimetype = 'application/json')
+
+    if page['next_cursor']:
+        response.headers['X-Next-Cursor'] = page['next_cursor']
+        response.headers['Link'] = f'<{url_for("api.search", **{**args.to_dict(), "cursor": page["next_cursor"]})}>; rel="next"'
+
+    return response
 
 
 #creating our READ data request for orders READ associated with 'GET' 
 @api.route('/order/<cust_id>')
 @jwt_required()
-def get_order(cust_id):
+def get_order(cust_id): #stays on the primary, a customer who just checked out has to see their order
 
 
+    count, last_modified = order_version(cust_id)
+    etag = make_etag(count, last_modified)
+    if not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
     #We need to grab all the order_ids associated with the customer
     #Grab all the products on that particular order 
 
-    prodorder = ProdOrder.query.filter(ProdOrder.cust_id == cust_id).all()
+    #one SELECT joining each line item to its product, streamed from the database instead of loaded all at once
+    rows = db.session.execute(order_lines(ProdOrder.cust_id == cust_id).execution_options(yield_per = 1000))
+
+    #stream the json array out as we go so a customer with thousands of lines doesn't build one giant string
+    response = current_app.response_class(stream_with_context(stream_rows(rows, ORDER_LINE_FIELDS)), mimetype = 'application/json')
+    return set_validators(response, etag, last_modified)
+
+
+
+#everything a customer ever ordered in one row: how many orders, lines & items & what they spent (CustomerSummary)
+@api.route('/order/<cust_id>/summary')
+@jwt_required()
+def get_order_summary(cust_id):
 
+    summary = db.session.get(CustomerSummary, cust_id)
 
-    data = []
+    if summary is None:
+        if db.session.get(Customer, cust_id) is None:
+            return {
+                'status': 404,
+                'message': 'We have no customer with that id.'
+            }, 404
+        summary = CustomerSummary(cust_id) #a customer without any orders (yet)
 
+    etag = make_etag(summary.order_count, summary.date_updated)
+    if not_modified(etag, summary.date_updated):
+        return not_modified_response(etag, summary.date_updated)
 
-    #need to traverse to grab all the products from each order 
-    for order in prodorder: 
+    response = jsonify({
+        'status': 200,
+        'cust_id': cust_id,
+        'order_count': summary.order_count,
+        'line_count': summary.line_count,
+        'item_count': summary.item_count,
+        'total_spent': to_money(summary.total_spent),
+        'last_order_at': summary.last_order_at
+    })
+    return set_validators(response, etag, summary.date_updated)
+
+
+#a customer's orders newest first, one page at a time, each with its totals already added up (OrderSummary)
+#query params: limit, cursor (from the X-Next-Cursor header of the last page). The lines of one order are at
+#/api/order/<cust_id>/history/<order_id>, so a customer with thousands of lines only gets what they look at
+@api.route('/order/<cust_id>/history')
+@jwt_required()
+def get_order_history(cust_id):
 
-        #order is the prodorder object so has a prod_id associated with it
+    args = request.args
 
+    try:
+        limit = get_limit(args, current_app.config['HISTORY_PAGE_SIZE'], current_app.config['HISTORY_MAX_PAGE_SIZE'])
 
-        product = Product.query.filter(Product.prod_id == order.prod_id).first()
+        query = db.select(*[getattr(OrderSummary, field) for field in HISTORY_FIELDS]).where(OrderSummary.cust_id == cust_id)
 
-        prod_data = product_schema.dump(product) #change this from an object to a dictionary 
+        if args.get('cursor'):
+            date_created, order_id = decode_cursor(args['cursor'], datetime, str)
+            #older than the last one we sent, same as (date_created, order_id) < (:date_created, :order_id)
+            query = query.where(db.or_(
+                OrderSummary.date_created < date_created,
+                db.and_(OrderSummary.date_created == date_created, OrderSummary.order_id < order_id)
+            ))
 
-        prod_data['quantity'] = order.quantity #coming from the prodorder table 
-        prod_data['order_id'] = order.order_id #want to associate this product with a specific order 
-        prod_data['id'] = order.prodorder_id #need to make products unique even if they are the same product 
+    except BadCursor as error:
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
 
-        data.append(prod_data)
+    #the customer's summary row changes whenever any of their orders does, so it's our version for every page
+    version = db.session.execute(
+        db.select(CustomerSummary.order_count, CustomerSummary.date_updated).where(CustomerSummary.cust_id == cust_id)
+    ).first()
+    count, last_modified = version if version else (0, None)
 
+    etag = make_etag(count, last_modified)
+    if not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
 
-    return jsonify(data)
+    #grab one extra row so we know if there is another page
+    rows = db.session.execute(query.order_by(OrderSummary.date_created.desc(), OrderSummary.order_id.desc()).limit(limit + 1)).all()
+    next_page = rows[limit:]
+    rows = rows[:limit]
 
+    response = current_app.response_class(dump_rows(rows, HISTORY_FIELDS), mimetype = 'application/json')
 
+    if next_page:
+        cursor = encode_cursor(rows[-1].date_created, rows[-1].order_id)
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{url_for("api.get_order_history", cust_id = cust_id, **{**args.to_dict(), "cursor": cursor})}>; rel="next"'
 
-#create our CREATE data request for orders, usually associated with 'POST' 
-@api.route('/order/create/<cust_id>', methods = ['POST'])
+    return set_validators(response, etag, last_modified)
+
+
+#one order from the history with its lines
+@api.route('/order/<cust_id>/history/<order_id>')
 @jwt_required()
-def create_order(cust_id):
+def get_order_details(cust_id, order_id):
 
-    data = request.json
+    summary = db.session.get(OrderSummary, order_id)
 
-    customer_order = data['order']
-    print(customer_order)
+    if summary is None or summary.cust_id != cust_id:
+        return {
+            'status': 404,
+            'message': 'This customer has no order with that id.'
+        }, 404
 
-    customer = Customer.query.filter(Customer.cust_id == cust_id).first()
-    if not customer:
-        customer = Customer(cust_id)
-        db.session.add(customer)
+    rows = db.session.execute(order_lines(ProdOrder.order_id == order_id)).all()
 
-    order = Order()
-    db.session.add(order)
+    return jsonify({
+        'status': 200,
+        **{field: getattr(summary, field) for field in HISTORY_FIELDS},
+        'items': [dict(zip(ORDER_LINE_FIELDS, row)) for row in rows]
+    })
 
-    #looping through the customer order list of dictionaries for each product
-    for product in customer_order:
 
-        prodorder = ProdOrder(product['prod_id'], product['quantity'], product['price'], order.order_id, customer.cust_id)
-        db.session.add(prodorder)
 
-        #add price from our prodorder table to increment our total order price
-        order.increment_order_total(prodorder.price)
+#create our CREATE data request for orders, usually associated with 'POST' 
+@api.route('/order/create/<cust_id>', methods = ['POST'])
+@jwt_required()
+def create_order(cust_id):
 
+    data = request.get_json(silent = True)
 
-        #decrement the available amount of that specific product in our shop
-        current_product = Product.query.filter(Product.prod_id == product['prod_id']).first()
-        current_product.decrement_quantity(product['quantity'])
+    try:
+        lines = clean_order_lines(data.get('order') if isinstance(data, dict) else None) #[(prod_id, quantity), ...]
+    except ValueError as error:
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
+
+    current_app.logger.debug("new order for %s: %s", cust_id, lines)
+
+    try:
+        if current_app.config['ASYNC_CHECKOUT']:
+            #flash sale mode: check it & get in line, a checkout queue worker creates the order (see checkout_queue.py)
+            check_products_exist(prod_id for prod_id, _ in lines)
+            queued = checkout_queue.enqueue(cust_id, lines)
+            db.session.commit()
+
+            status_url = url_for('api.get_order_status', order_id = queued.order_id)
+            return {
+                'status': 202,
+                'message': 'Your order is in line! Check on it at the status_url.',
+                'order_id': queued.order_id,
+                'status_url': status_url
+            }, 202, {'Location': status_url}
+
+        order, new_customer = place_order(cust_id, lines)
+
+    except UnknownProducts:
+        db.session.rollback()
+        return {
+            'status': 400,
+            'message': 'One or more products on this order do not exist. Please try again!'
+        }, 400
 
+    except OutOfStock as error:
+        db.session.rollback()
+        return out_of_stock(error)
 
+    adjust_shop_stats(customers = int(new_customer), sales = order.order_total)
+    order_id = order.order_id #read it before the commit expires our objects (that would be one more SELECT)
     db.session.commit()
 
 
     return {
         'status': 200,
-        'message': 'New Order was created!'
+        'message': 'New Order was created!',
+        'order_id': order_id
     }
 
 
+#where an order from the checkout queue is at: queued (with how many are ahead of it), done or failed
+@api.route('/order/status/<order_id>')
+@jwt_required()
+def get_order_status(order_id):
+
+    queued = QueuedOrder.query.filter(QueuedOrder.order_id == order_id).first()
+
+    if queued is None:
+        return {
+            'status': 404,
+            'message': 'We have no queued order with that id.'
+        }, 404
+
+    response = {
+        'status': 200,
+        'order_id': queued.order_id,
+        'order_status': queued.status
+    }
+
+    if queued.status == 'queued':
+        response['ahead'] = db.session.scalar(
+            db.select(db.func.count()).where(QueuedOrder.status == 'queued', QueuedOrder.queue_id < queued.queue_id)
+        )
+    elif queued.status == 'failed':
+        response.update(json.loads(queued.error)) #message & prod_ids
+
+    return response
+
+
 #create our UPDATE route for our order, usually associated with 'PUT' 
 
 @api.route('/order/update/<order_id>', methods = ['PUT', 'POST']) 
 @jwt_required()
 def update_order(order_id):
 
-    # try: 
+    data = request.get_json(silent = True) or {}
 
-    data = request.json
-    new_quantity = int(data['quantity'])
-    prod_id = data['prod_id']
+    try:
+        new_quantity = int(data['quantity'])
+        prod_id = str(data['prod_id'])
+    except (KeyError, TypeError, ValueError):
+        return {
+            'status': 400,
+            'message': 'An update needs a prod_id and a whole number quantity. Please try again!'
+        }, 400
+
+    if new_quantity <= 0:
+        return {
+            'status': 400,
+            'message': 'Quantities need to be more than 0, use /api/order/delete to take a product off an order.'
+        }, 400
 
 
     prodorder = ProdOrder.query.filter(ProdOrder.order_id == order_id, ProdOrder.prod_id == prod_id).first()
     order = Order.query.get(order_id) #.get() is specific for ids 
     product = Product.query.get(prod_id)
 
+    if prodorder is None or order is None or product is None:
+        return not_on_order()
+
+
+    old_price = prodorder.price
 
     #update the product price based on the new quantity
     prodorder.set_price(product.price, new_quantity)
+    delta = prodorder.price - old_price #the order total only moves by the difference, not the whole new price
 
     diff = abs(prodorder.quantity - new_quantity)
+    items = new_quantity - prodorder.quantity #for the order history summaries
 
-    #based on if the new quantity is higher or lower we either new to decrement or increment total product quantity & order cost 
+    #based on if the new quantity is higher or lower we either new to decrement or increment total product quantity
 
     if prodorder.quantity < new_quantity: 
-        product.decrement_quantity(diff) #decrease our available inventory
-        order.increment_order_total(prodorder.price) #our order total is going to be more 
+        try:
+            product.decrement_quantity(diff) #decrease our available inventory
+        except OutOfStock as error:
+            db.session.rollback()
+            return out_of_stock(error)
 
     elif prodorder.quantity > new_quantity:
         product.increment_quantity(diff) #increase our available inventory
-        order.decrement_order_total(prodorder.price) #our order total is going to be less 
 
 
     prodorder.update_quantity(new_quantity)
 
+    Order.adjust_total(order.order_id, delta) #our order total goes up or down by exactly the change
+    adjust_shop_stats(sales = delta)
+    order_history.adjust_order(order.order_id, prodorder.cust_id, items = items, total = delta)
+    Customer.touch(prodorder.cust_id)
     db.session.commit()
 
     return {
         'status': 200,
         'message': 'Order was successfully updated!'
     }
-    
-    # except:
 
-    #     return {
-    #         'status': 400,
-    #         'message': 'Unable to process your request. Please try again!'
-    #     }
 
 
+#edit a whole cart in one request & one transaction instead of one request per product, 'POST'
+#body: {"changes": [{"prod_id": ..., "quantity": 3}, ...], "remove": [prod_id, ...]}
+#send an Idempotency-Key header & a retried request gets the first answer back instead of being applied twice
+@api.route('/order/batch/<order_id>', methods = ['POST'])
+@jwt_required()
+def batch_update_order(order_id):
+
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        saved_as = (get_jwt_identity(), key) #keys are per caller, two clients can both send 'retry-1'
+        request_hash = IdempotencyKey.hash_request(order_id, request.get_data())
+        saved = db.session.get(IdempotencyKey, saved_as)
+        if saved:
+            return saved.replay(order_id, request_hash)
+
+    try:
+        changes, removals = clean_cart_changes(request.get_json(silent = True))
+    except ValueError as error:
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
+
+    order = Order.query.get(order_id) #.get() is specific for ids 
+    if not order:
+        return {
+            'status': 404,
+            'message': 'That order does not exist.'
+        }, 404
+
+    try:
+        apply_cart_changes(order, changes, removals)
+    except OutOfStock as error:
+        db.session.rollback()
+        return out_of_stock(error)
+    except ValueError as error:
+        db.session.rollback()
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
+    except KeyError as error:
+        db.session.rollback()
+        return {
+            'status': 400,
+            'message': 'One or more products are not on this order.',
+            'prod_ids': error.args[0]
+        }, 400
+
+    db.session.flush()
+    db.session.expire(order, ['order_total']) #it was changed in the database, get the new one
+    rows = db.session.execute(order_lines(ProdOrder.order_id == order_id)).all()
+
+    response = jsonify({
+        'status': 200,
+        'message': 'Order was successfully updated!',
+        'order_id': order_id,
+        'order_total': order.order_total,
+        'items': [dict(zip(ORDER_LINE_FIELDS, row)) for row in rows]
+    })
+
+    if key:
+        db.session.add(IdempotencyKey(*saved_as, order_id, request_hash, response.get_data(as_text = True), response.status_code))
+
+    try:
+        db.session.commit()
+    except IntegrityError: #the same key came in twice at the same time & the other one won, hand back its answer
+        db.session.rollback()
+        saved = db.session.get(IdempotencyKey, saved_as) if key else None
+        if saved is None: #not a key clash, something else broke
+            raise
+        return saved.replay(order_id, request_hash)
+
+    return response
+
 
 #create our DELETE route for our order, associated with 'DELETE' method
 
@@ -177,20 +698,32 @@ def update_order(order_id):
 @jwt_required()
 def delete_item_order(order_id):
 
-    data = request.json
-    prod_id = data['prod_id']
+    data = request.get_json(silent = True) or {}
+    prod_id = data.get('prod_id')
+
+    if not prod_id:
+        return {
+            'status': 400,
+            'message': 'Tell us which prod_id to take off the order. Please try again!'
+        }, 400
 
 
-    prodorder = ProdOrder.query.filter(ProdOrder.order_id == order_id, ProdOrder.prod_id == prod_id).first()
+    prodorder = ProdOrder.query.filter(ProdOrder.order_id == order_id, ProdOrder.prod_id == str(prod_id)).first()
 
     order = Order.query.get(order_id)
-    product = Product.query.get(prod_id)
+    product = Product.query.get(str(prod_id))
+
+    if prodorder is None or order is None or product is None:
+        return not_on_order()
 
 
-    order.decrement_order_total(prodorder.price) #order total is gonna be less expensive 
+    Order.adjust_total(order.order_id, -prodorder.price) #order total is gonna be less expensive 
     product.increment_quantity(prodorder.quantity) #add back to inventory 
 
     db.session.delete(prodorder)
+    adjust_shop_stats(sales = -prodorder.price)
+    order_history.adjust_order(order.order_id, prodorder.cust_id, lines = -1, items = -prodorder.quantity, total = -prodorder.price)
+    Customer.touch(prodorder.cust_id)
     db.session.commit()
 
     return {
@@ -199,3 +732,185 @@ def delete_item_order(order_id):
     }
 
 
+
+#hold some stock in a customer's cart for a little while, 'POST'
+@api.route('/reserve/<cust_id>', methods = ['POST'])
+@jwt_required()
+def reserve_item(cust_id):
+
+    data = request.get_json(silent = True)
+
+    if not isinstance(data, dict) or not data.get('prod_id') or 'quantity' not in data:
+        return {
+            'status': 400,
+            'message': 'A reservation needs a prod_id and a quantity. Please try again!'
+        }, 400
+
+    try:
+        check_products_exist([str(data['prod_id'])])
+        reservation = inventory.reserve(cust_id, str(data['prod_id']), data['quantity'])
+    except UnknownProducts:
+        return {
+            'status': 404,
+            'message': 'That product does not exist.'
+        }, 404
+    except ValueError as error:
+        db.session.rollback()
+        return {
+            'status': 400,
+            'message': str(error)
+        }, 400
+    except OutOfStock as error:
+        db.session.rollback()
+        return out_of_stock(error)
+
+    db.session.commit()
+
+    return {
+        'status': 200,
+        'reservation_id': reservation.reservation_id,
+        'expires_at': reservation.expires_at.isoformat()
+    }
+
+
+#let go of a cart reservation early, 'DELETE'
+@api.route('/reserve/delete/<reservation_id>', methods = ['DELETE'])
+@jwt_required()
+def release_item(reservation_id):
+
+    if not inventory.release(reservation_id):
+        db.session.rollback()
+        return {
+            'status': 404,
+            'message': 'That reservation has already expired or been used.'
+        }, 404
+
+    db.session.commit()
+
+    return {
+        'status': 200,
+        'message': 'Reservation was released!'
+    }
+
+
+
+#sales reports, read from the daily rollups in sales_reports.py (as fresh as the last `flask reports refresh`).
+#?start=2024-01-01&end=2024-01-31 (both included, UTC days), the last REPORT_DEFAULT_DAYS days when left out
+def report_range(args):
+
+    try:
+        end = date.fromisoformat(args['end']) if args.get('end') else datetime.utcnow().date()
+        start = date.fromisoformat(args['start']) if args.get('start') else end - timedelta(days = current_app.config['REPORT_DEFAULT_DAYS'] - 1)
+    except ValueError:
+        raise ValueError("start and end need to be dates like 2024-01-31")
+
+    if start > end:
+        raise ValueError("start needs to be on or before end")
+    if (end - start).days >= current_app.config['REPORT_MAX_DAYS']:
+        raise ValueError(f"A report can cover at most {current_app.config['REPORT_MAX_DAYS']} days")
+
+    return start, end
+
+
+#every report only changes when the rollups get refreshed, so that's our version
+def report_response(rows, fields, as_of, **extra):
+
+    response = jsonify({
+        'status': 200,
+        'as_of': as_of, #order changes after this aren't in the numbers yet
+        **extra,
+        'rows': [dict(zip(fields, row)) for row in rows]
+    })
+    return set_validators(response, make_etag(as_of), as_of)
+
+
+def bad_report(error):
+    return {
+        'status': 400,
+        'message': str(error)
+    }, 400
+
+
+#revenue per day, product or customer: GET /api/reports/revenue?group=day|product|customer&start&end&limit
+#product & customer come back best first
+@api.route('/reports/revenue')
+@jwt_required()
+@read_only
+def revenue_report():
+
+    args = request.args
+    group = args.get('group', 'day')
+
+    try:
+        if group not in REVENUE_FIELDS:
+            raise ValueError(f"group can only be: {', '.join(REVENUE_FIELDS)}")
+        start, end = report_range(args)
+        limit = get_limit(args, current_app.config['REPORT_PAGE_SIZE'], current_app.config['REPORT_MAX_PAGE_SIZE'])
+    except ValueError as error:
+        return bad_report(error)
+
+    as_of = sales_reports.refreshed_to()
+    if not_modified(make_etag(as_of), as_of):
+        return not_modified_response(make_etag(as_of), as_of)
+
+    if group == 'day':
+        rows = sales_reports.revenue_by_day(start, end)
+    elif group == 'product':
+        rows = sales_reports.revenue_by_product(start, end, limit)
+    else:
+        rows = sales_reports.revenue_by_customer(start, end, limit)
+
+    return report_response(rows, REVENUE_FIELDS[group], as_of, group = group, start = start, end = end)
+
+
+#the products that sold the most units: GET /api/reports/top-sellers?start&end&limit
+@api.route('/reports/top-sellers')
+@jwt_required()
+@read_only
+def top_sellers_report():
+
+    args = request.args
+
+    try:
+        start, end = report_range(args)
+        limit = get_limit(args, current_app.config['REPORT_PAGE_SIZE'], current_app.config['REPORT_MAX_PAGE_SIZE'])
+    except ValueError as error:
+        return bad_report(error)
+
+    as_of = sales_reports.refreshed_to()
+    if not_modified(make_etag(as_of), as_of):
+        return not_modified_response(make_etag(as_of), as_of)
+
+    rows = sales_reports.revenue_by_product(start, end, limit, sort = 'units')
+    return report_response(rows, REVENUE_FIELDS['product'], as_of, start = start, end = end)
+
+
+#products that are (nearly) out: GET /api/reports/low-stock?threshold=10&days=14&cover_days=7&limit
+#threshold or fewer left, or fewer left than cover_days worth of what they sold per day over the last `days` days
+@api.route('/reports/low-stock')
+@jwt_required()
+@read_only
+def low_stock_report():
+
+    args = request.args
+    config = current_app.config
+
+    try:
+        threshold = int(args.get('threshold', config['LOW_STOCK_THRESHOLD']))
+        days = max(1, min(int(args.get('days', config['LOW_STOCK_SALES_DAYS'])), config['REPORT_MAX_DAYS']))
+        cover_days = max(0, int(args.get('cover_days', config['LOW_STOCK_COVER_DAYS'])))
+        limit = get_limit(args, config['REPORT_PAGE_SIZE'], config['REPORT_MAX_PAGE_SIZE'])
+    except ValueError:
+        return bad_report("threshold, days, cover_days and limit need to be numbers")
+
+    #stock moves with every order so no ETag here, this one is always live
+    rows = sales_reports.low_stock(threshold, days, cover_days, limit)
+
+    return jsonify({
+        'status': 200,
+        'as_of': sales_reports.refreshed_to(), #for the sales pace, the stock is live
+        'threshold': threshold,
+        'days': days,
+        'cover_days': cover_days,
+        'rows': [dict(zip(LOW_STOCK_FIELDS, row)) for row in rows]
+    })
@@ -1,10 +1,10 @@
-from flask import Blueprint,  render_template, redirect, url_for, flash, request 
-from werkzeug.security import check_password_hash
+from flask import Blueprint,  render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_user, logout_user 
 
 #internal imports
 from rangers_shop.forms import RegisterForm, LoginForm
 from rangers_shop.models import User, db 
+from rangers_shop.passwords import PasswordCheckBusy
 
 
 
@@ -27,7 +27,7 @@ def signup():
         username = registerform.username.data
         email = registerform.email.data
         password = registerform.password.data
-        print(email, password)
+        current_app.logger.info("signup attempt for %s", email) #never log passwords
 
         #check the database for same username and/or email. Querying the database!
         if User.query.filter(User.username == username).first(): #if this comes back as something, that means user with username already exists
@@ -61,13 +61,19 @@ def signin():
     if request.method == 'POST' and loginform.validate_on_submit():
         email = loginform.email.data
         password = loginform.password.data
-        print(email,password)
+        current_app.logger.info("signin attempt for %s", email)
 
 
         user = User.query.filter(User.email == email).first()
-        print(user)
 
-        if user and check_password_hash(user.password, password): #if there is a user that matches the email & the passwords match
+        try:
+            valid = user is not None and user.check_password(password) #if there is a user that matches the email & the passwords match
+        except PasswordCheckBusy:
+            flash("Lots of people are signing in right now, please try again in a moment", category='warning')
+            return redirect('/signin')
+
+        if valid:
+            db.session.commit() #saves the upgraded hash if check_password had to redo it
             login_user(user) #This we have access to because of the UserMixin we inherited 
             #using the user_loader() function we made so now that will be the current_user of our site
             flash(f"Successfully logged in user {email}", category='success')
@@ -0,0 +1,136 @@
+import hmac
+from flask import Blueprint, request, current_app
+
+#internal imports
+from rangers_shop.pool_metrics import pool_status
+from rangers_shop.instrumentation import instrumentation
+from rangers_shop.catalog_cache import catalog_cache
+from rangers_shop.models import get_user_cache
+from rangers_shop.images import get_image_cache
+from rangers_shop.checkout_queue import queue_stats
+from rangers_shop.api_tokens import claims_cache_stats, get_token_limiter, revocations
+
+
+
+#numbers for our monitoring (grafana, datadog, a curl in a cron job...), not for customers
+metrics = Blueprint('metrics', __name__, url_prefix = '/metrics')
+
+
+#without a METRICS_TOKEN only the machine itself gets in (a prometheus sidecar, a curl on the box)
+LOCALHOST = ('127.0.0.1', '::1')
+
+
+@metrics.before_request
+def check_token():
+
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        if request.remote_addr in LOCALHOST:
+            return None
+        return {
+            'status': 403,
+            'message': 'Set METRICS_TOKEN to read the metrics from another machine'
+        }, 403
+
+    given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        return {
+            'status': 401,
+            'message': 'Missing or wrong metrics token'
+        }, 401
+
+
+#connections checked out / in, overflow & how long requests waited for one, for every database we talk to
+@metrics.route('/pool')
+def get_pool():
+
+    return {
+        'status': 200,
+        'pools': pool_status(current_app)
+    }
+
+
+#everything at once in the prometheus text format, point the prometheus scrape config at /metrics
+#(the request counters & timings need INSTRUMENTATION_ENABLED=true, the pool & cache numbers are always there)
+@metrics.route('')
+def get_metrics():
+
+    lines = instrumentation.prometheus()
+
+    pools = pool_status(current_app)
+    for name, metric, kind in [
+        ('checked_out', 'checked_out', 'gauge'),
+        ('overflow', 'overflow', 'gauge'),
+        ('size', 'size', 'gauge'),
+        ('checkouts', 'checkouts_total', 'counter'),
+        ('connects', 'connects_total', 'counter'),
+        ('invalidated', 'invalidated_total', 'counter'),
+        ('timeouts', 'timeouts_total', 'counter'),
+        ('wait_seconds_total', 'wait_seconds_total', 'counter')
+    ]:
+        lines.append(f'# TYPE shop_db_pool_{metric} {kind}')
+        lines.extend(f'shop_db_pool_{metric}{{bind="{bind}"}} {stats[name]}' for bind, stats in pools.items() if name in stats)
+
+    cache = catalog_cache.stats()
+    for name in ('hits', 'misses', 'evictions', 'invalidations'):
+        lines.append(f'# TYPE shop_catalog_cache_{name}_total counter')
+        lines.append(f'shop_catalog_cache_{name}_total {cache[name]}')
+
+    users = get_user_cache().stats() #logged in page views that didn't need the database = hits
+    for name in ('hits', 'misses', 'evictions', 'expirations'):
+        lines.append(f'# TYPE shop_user_cache_{name}_total counter')
+        lines.append(f'shop_user_cache_{name}_total {users[name]}')
+
+    images = get_image_cache(current_app).stats() #product image lookups that didn't go out to the search api
+    for name in ('hits', 'misses', 'evictions', 'expirations', 'shared_hits', 'coalesced', 'lookups'):
+        lines.append(f'# TYPE shop_image_cache_{name}_total counter')
+        lines.append(f'shop_image_cache_{name}_total {images[name]}')
+
+    claims = claims_cache_stats() #@jwt_required() requests that skipped verifying the token = hits
+    if claims is not None:
+        for name in ('hits', 'misses', 'evictions', 'expirations'):
+            lines.append(f'# TYPE shop_jwt_claims_cache_{name}_total counter')
+            lines.append(f'shop_jwt_claims_cache_{name}_total {claims[name]}')
+
+    lines.append('# TYPE shop_token_rate_limited_total counter')
+    lines.append(f'shop_token_rate_limited_total {get_token_limiter().stats()["limited"]}')
+    lines.append('# TYPE shop_revoked_tokens gauge')
+    lines.append(f'shop_revoked_tokens {len(revocations)}')
+
+    queue = queue_stats() #from the database, so the same no matter which worker answers
+    lines.append('# TYPE shop_checkout_queue_depth gauge')
+    lines.append(f'shop_checkout_queue_depth {queue["depth"]}')
+    lines.append('# TYPE shop_checkout_queue_lag_seconds gauge')
+    lines.append(f'shop_checkout_queue_lag_seconds {queue["lag_seconds"]}')
+    lines.append('# TYPE shop_checkout_queue_finished_last_minute gauge')
+    lines.extend(f'shop_checkout_queue_finished_last_minute{{status="{status}"}} {queue[status]}' for status in ('done', 'failed'))
+
+    return current_app.response_class("\n".join(lines) + "\n", mimetype = 'text/plain; version=0.0.4')
+
+
+#hit rates for our in-memory caches (this worker only)
+@metrics.route('/caches')
+def get_caches():
+
+    caches = {'catalog': catalog_cache.stats(), 'users': get_user_cache().stats(), 'images': get_image_cache(current_app).stats()}
+    if claims_cache_stats() is not None:
+        caches['jwt_claims'] = claims_cache_stats()
+    for stats in caches.values():
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+
+    return {
+        'status': 200,
+        'caches': caches,
+        'token_rate_limit': get_token_limiter().stats()
+    }
+
+
+#the checkout queue (ASYNC_CHECKOUT): how many orders are waiting, how long the oldest has waited & how fast they go
+@metrics.route('/checkout-queue')
+def get_checkout_queue():
+
+    return {
+        'status': 200,
+        'queue': queue_stats()
+    }
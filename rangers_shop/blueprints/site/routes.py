@@ -1,8 +1,12 @@
 from flask import Blueprint, render_template, request, flash, redirect
+import json
 
 #internal imports
-from rangers_shop.models import Product, Customer, ProdOrder, Order, db, product_schema, products_schema 
+from rangers_shop.models import Product, db, products_schema, read_only
 from rangers_shop.forms import ProductForm
+from rangers_shop.images import resolve_later
+from rangers_shop.stats import get_shop_stats, adjust_shop_stats
+from rangers_shop.catalog_cache import catalog_cache
 
 
 
@@ -13,6 +17,7 @@ site = Blueprint('site', __name__, template_folder='site_templates') #telling yo
 
 #create our first route
 @site.route('/')
+@read_only #products & stats can come from a read replica
 def shop():
 
     #data = request.json() #if they passed the user_id through the body 
@@ -20,16 +25,21 @@ def shop():
     #that user_id would be need to be passed to this endpoint/function
     #when were inside flask we can use current_user.user_id 
 
-    shop = Product.query.all() #grabbing all the product
-    #shop = Product.query.filter(Product.user_id = user_id).all() #to grab products on that specific user
-    customers = Customer.query.all()
-    orders = Order.query.all()
+    #the products & stats only change when a product does, so they usually come straight out of our catalog cache
+    generation = catalog_cache.generation()
+    page = catalog_cache.get('site:shop', generation)
 
-    shop_stats = {
-        'products': len(shop),
-        'sales': sum([order.order_total for order in orders]), #order totals was total cost of that specific order
-        'customers' : len(customers)
-    }
+    if page is None:
+        shop = products_schema.dump(Product.query.all()) #grabbing all the product (as dictionaries so they can be cached)
+        #shop = Product.query.filter(Product.user_id = user_id).all() #to grab products on that specific user
+
+        shop_stats = get_shop_stats() #products, sales & customers kept up to date by our order/product routes
+
+        page = {'shop': shop, 'stats': shop_stats}
+        catalog_cache.set('site:shop', page, generation, size = len(json.dumps(page, default = str)))
+
+    shop = page['shop']
+    shop_stats = page['stats']
 
     return render_template('shop.html', shop=shop, stats=shop_stats) #basically displaying our shop.html page 
 
@@ -53,8 +63,11 @@ def create():
         shop = Product(name, price, quantity, image, desc) #instantiating Product object
 
         db.session.add(shop)
+        adjust_shop_stats(products = 1)
         db.session.commit()
 
+        resolve_later(shop) #looks up the image in the background if they didn't give us one
+
         flash(f"You have successfully created product {name}", category='success')
         return redirect('/')
 
@@ -77,14 +90,14 @@ def update(id):
         try: 
             product.name = updateform.name.data
             product.description = updateform.description.data
-            product.set_image(updateform.image.data, updateform.name.data) #calling upon that set_image method to set our image!
+            product.image = product.set_image(updateform.image.data, updateform.name.data) #calling upon that set_image method to set our image!
             product.price = updateform.price.data
             product.quantity = updateform.quantity.data 
 
-            
-
             db.session.commit() #commits the changes to our objects 
 
+            resolve_later(product)
+
             flash(f"You have successfully updated product {product.name}", category='success')
             return redirect('/')
 
@@ -101,6 +114,7 @@ def delete(id):
     product = Product.query.get(id)
 
     db.session.delete(product)
+    adjust_shop_stats(products = -1)
     db.session.commit()
 
     return redirect('/')
\ No newline at end of file
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+
+#a small in-process cache that keeps at most maxsize items & forgets them after ttl seconds
+#least recently used items get kicked out first when it fills up
+class LRUCache():
+
+    def __init__(self, maxsize = 1024, ttl = None, maxbytes = None):
+        self.maxsize = maxsize
+        self.ttl = ttl #None means items never expire on their own
+        self.maxbytes = maxbytes #optional memory bound, uses the size passed to set()
+        self._data = OrderedDict() #key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock() #our gunicorn workers can run threads so guard every change
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+    def get(self, key, default = None):
+
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is None:
+                self.misses += 1
+                return default
+
+            expires_at, value, size = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key) #most recently used goes to the back of the line
+            self.hits += 1
+            return value
+
+
+    def set(self, key, value, ttl = None, size = 0):
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        if self.maxbytes is not None and size > self.maxbytes: #would push everything else out & still not fit
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                _, (_, _, evicted_size) = self._data.popitem(last = False) #the front of the line is the least recently used
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+
+    def delete(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self._bytes -= item[2]
+
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+
+    def __len__(self):
+        return len(self._data)
+
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+
+#makes sure only one thread does the work for a key at a time, everyone else asking for
+#the same key waits & gets the same answer (ex: two people creating the same product at once)
+class SingleFlight():
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {} #key -> the call that is in progress
+        self.shared = 0 #how many callers got a result without doing the work themselves
+
+
+    def do(self, key, func):
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['done'].wait()
+            with self._lock:
+                self.shared += 1
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = func()
+            return call['result']
+        except Exception as error:
+            call['error'] = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
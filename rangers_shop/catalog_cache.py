@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from sqlalchemy import event
+from requests_cache.backends.sqlite import SQLiteDict
+
+#internal imports
+from .cache import LRUCache
+from .models import Product, db
+
+
+
+#keeps the already-serialized catalog (GET /api/shop pages & the site homepage) in memory so read traffic
+#doesn't touch the database. Anything that changes a Product bumps the "generation" after it commits &
+#every entry from an older generation stops counting. Setting CATALOG_CACHE_SHARED to a file path shares
+#the generation (and the pages) between gunicorn workers, that sqlite file stands in for something like redis.
+#without it every process only hears about its own writes: the web workers see stock taken by other workers
+#or by `flask orders work` (ASYNC_CHECKOUT) up to CATALOG_CACHE_TTL seconds late. Point the checkout workers
+#at the same CATALOG_CACHE_SHARED file & their commits invalidate the web workers' pages too
+class CatalogCache():
+
+    def __init__(self):
+        self.local = LRUCache()
+        self.shared = None
+        self.enabled = False
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.shared_hits = 0
+        self.invalidations = 0
+        self._purged = 0 #time.time() we last deleted expired shared pages
+
+
+    def init_app(self, app):
+
+        self.enabled = app.config['CATALOG_CACHE_ENABLED']
+        self.local = LRUCache(
+            maxsize = app.config['CATALOG_CACHE_SIZE'],
+            ttl = app.config['CATALOG_CACHE_TTL'],
+            maxbytes = app.config['CATALOG_CACHE_MAX_BYTES']
+        )
+        self.ttl = app.config['CATALOG_CACHE_TTL']
+
+        if app.config['CATALOG_CACHE_SHARED']:
+            self.shared = SQLiteDict(app.config['CATALOG_CACHE_SHARED'], table_name = 'catalog_cache', serializer = None)
+
+        app.extensions['catalog_cache'] = self
+
+
+    #read this BEFORE querying the database, then pass it to set(). If a write lands in between,
+    #what we store is already filed under the old generation & nobody will read it
+    def generation(self):
+
+        if self.shared is not None:
+            return int(self.shared.get('generation', 0))
+        return self._generation
+
+
+    def get(self, key, generation):
+
+        if not self.enabled:
+            return None
+
+        value = self.local.get((generation, key))
+        if value is not None or self.shared is None:
+            return value
+
+        item = self.shared.get(f"{generation}:{key}")
+        if item is None:
+            return None
+
+        item = json.loads(item)
+        remaining = item['expires_at'] - time.time()
+        if remaining <= 0:
+            return None
+
+        with self._lock:
+            self.shared_hits += 1
+        self.local.set((generation, key), item['value'], ttl = remaining, size = item['size'])
+        return item['value']
+
+
+    #value has to be json friendly if the shared tier is on. size is roughly how many bytes it takes up
+    def set(self, key, value, generation, size):
+
+        if not self.enabled:
+            return
+
+        self.local.set((generation, key), value, size = size)
+
+        if self.shared is None:
+            return
+
+        expires_at = time.time() + self.ttl
+        item = json.dumps({'value': value, 'size': size, 'expires_at': expires_at}, default = str)
+
+        #the expires column is indexed, so pages from old generations can be swept once they time out
+        with self.shared.connection(commit = True) as con:
+            con.execute(f"INSERT OR REPLACE INTO {self.shared.table_name} (key, value, expires) VALUES (?, ?, ?)", (f"{generation}:{key}", item, expires_at))
+
+            if expires_at - self._purged > self.ttl: #at most once per ttl per worker
+                self._purged = expires_at
+                con.execute(f"DELETE FROM {self.shared.table_name} WHERE expires <= ?", (time.time(),))
+
+
+    #something in the catalog changed so everything we have cached is old news. Only the generation moves,
+    #entries from older ones are never read again & fall out on their own (LRU here, expires in the shared file).
+    #this runs after every commit that touches a product, checkouts included, so it stays one statement
+    def invalidate(self):
+
+        with self._lock:
+            self.invalidations += 1
+            self._generation += 1
+
+        if self.shared is not None:
+            #one atomic increment, two processes bumping at once can't both write the same number
+            with self.shared.connection(commit = True) as con:
+                con.execute(
+                    f"INSERT INTO {self.shared.table_name} (key, value) VALUES ('generation', 1) "
+                    "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+                )
+
+        self.local.clear()
+
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update({
+            'generation': self.generation(),
+            'shared_hits': self.shared_hits,
+            'invalidations': self.invalidations
+        })
+        return stats
+
+
+catalog_cache = CatalogCache()
+
+
+
+#write-through invalidation: watch every session for changes to products & clear the cache once they're committed
+#this covers the site create/update/delete routes, the stock UPDATEs in the order routes, bulk imports & background image lookups
+@event.listens_for(db.session, 'before_flush')
+def _track_product_changes(session, flush_context, instances):
+    if any(isinstance(obj, Product) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['catalog_changed'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_product_statements(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and orm_execute_state.bind_mapper is not None and orm_execute_state.bind_mapper.class_ is Product:
+        orm_execute_state.session.info['catalog_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('catalog_changed', None) #nothing actually changed
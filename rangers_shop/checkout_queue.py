@@ -0,0 +1,189 @@
+import json
+import logging
+import multiprocessing
+import signal
+import time
+import uuid
+from datetime import datetime, timedelta
+
+#internal imports
+from .models import QueuedOrder, OutOfStock, db
+from .orders import place_order, UnknownProducts
+from .stats import adjust_shop_stats
+
+
+
+#checkout for flash sales (ASYNC_CHECKOUT=true): POST /api/order/create only checks the order & saves it in the
+#queued_order table (one small INSERT), the customer gets their order id right away & `flask orders work` processes
+#drain the table in batches. Every batch is one transaction (one commit instead of one per order) & every order
+#in it gets a savepoint, so one customer running out of stock doesn't undo everyone else's order.
+#claiming a batch: postgres hands each worker different rows with FOR UPDATE SKIP LOCKED. sqlite only has one writer
+#at a time, so there the batch starts with an UPDATE (which takes the write lock) that claims the rows.
+#a worker that dies halfway never commits, so its orders simply go back to being queued
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(cust_id, lines):
+
+    queued = QueuedOrder(str(uuid.uuid4()), cust_id, json.dumps(lines))
+    db.session.add(queued)
+
+    return queued
+
+
+#the oldest batch_size queued orders, locked for this worker until it commits
+def claim_batch(batch_size):
+
+    oldest = db.select(QueuedOrder.queue_id).where(QueuedOrder.status == 'queued').order_by(QueuedOrder.queue_id).limit(batch_size)
+
+    if db.engine.dialect.name == 'postgresql':
+        claimed = db.session.scalars(db.select(QueuedOrder).where(QueuedOrder.queue_id.in_(oldest.with_for_update(skip_locked = True)))).all()
+    else:
+        claimed = db.session.scalars(
+            db.update(QueuedOrder)
+            .where(QueuedOrder.queue_id.in_(oldest.scalar_subquery()))
+            .values(status = 'working') #nobody else sees this, it turns into done/failed before we commit
+            .returning(QueuedOrder)
+        ).all()
+
+    return sorted(claimed, key = lambda queued: queued.queue_id)
+
+
+#create the orders for one batch, returns how many we took off the queue
+def process_batch(batch_size):
+
+    batch = claim_batch(batch_size)
+    if not batch:
+        db.session.rollback() #don't sit in an open transaction while we wait for more
+        return 0
+
+    customers = 0
+    sales = 0
+
+    for queued in batch:
+        try:
+            with db.session.begin_nested():
+                order, new_customer = place_order(queued.cust_id, [tuple(line) for line in json.loads(queued.lines)], queued.order_id)
+
+        except OutOfStock as error:
+            fail(queued, 'Sorry, we do not have enough of that product in stock!', error.prod_ids)
+
+        except UnknownProducts as error:
+            fail(queued, 'One or more products on this order do not exist.', error.prod_ids)
+
+        except Exception: #a bad order shouldn't come back around forever & hold up the queue
+            logger.exception("checkout queue: order %s failed", queued.order_id)
+            fail(queued, 'We were unable to process this order.', [])
+
+        else:
+            queued.status = 'done'
+            customers += int(new_customer)
+            sales += order.order_total
+
+        queued.date_finished = datetime.utcnow()
+
+    adjust_shop_stats(customers = customers, sales = sales) #one UPDATE for the whole batch
+    db.session.commit()
+
+    return len(batch)
+
+
+def fail(queued, message, prod_ids):
+    queued.status = 'failed'
+    queued.error = json.dumps({'message': message, 'prod_ids': prod_ids})
+
+
+
+#one worker process: keep taking batches, nap for poll_seconds when the queue is empty.
+#once=True stops as soon as the queue is empty instead
+def work(app, batch_size, poll_seconds, once = False):
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True)) #finish the batch we're on, then stop
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close = False) #connections we got from the parent process belong to the parent
+
+        processed = 0
+        start = time.perf_counter()
+
+        while not stopping:
+            count = process_batch(batch_size)
+            processed += count
+
+            if count:
+                logger.info("checkout queue: %s orders (%.0f/s since start)", count, processed / (time.perf_counter() - start))
+            elif once:
+                break
+            else:
+                time.sleep(poll_seconds)
+
+    return processed
+
+
+def run_workers(app, processes, batch_size, poll_seconds, once = False):
+
+    if processes <= 1:
+        work(app, batch_size, poll_seconds, once)
+        return
+
+    context = multiprocessing.get_context('fork') #each worker starts with the app we already loaded
+    workers = [
+        context.Process(target = work, args = (app, batch_size, poll_seconds, once), name = f"checkout-worker-{number}")
+        for number in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def stop(*_):
+        for worker in workers:
+            worker.terminate() #passes the SIGTERM on, they stop after their batch
+
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt: #ctrl-c reaches the workers too, just wait for them
+        for worker in workers:
+            worker.join()
+
+
+
+#how the queue is doing: depth, how long the oldest order has been waiting (lag) & what finished in the last window
+def queue_stats(window = 60):
+
+    now = datetime.utcnow()
+
+    depth, oldest = db.session.execute(
+        db.select(db.func.count(), db.func.min(QueuedOrder.date_created)).where(QueuedOrder.status == 'queued')
+    ).one()
+
+    finished = dict(db.session.execute(
+        db.select(QueuedOrder.status, db.func.count())
+        .where(QueuedOrder.date_finished >= now - timedelta(seconds = window))
+        .group_by(QueuedOrder.status)
+    ).all())
+
+    return {
+        'depth': depth,
+        'lag_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0,
+        'done': finished.get('done', 0),
+        'failed': finished.get('failed', 0),
+        'per_second': round((finished.get('done', 0) + finished.get('failed', 0)) / window, 2),
+        'window_seconds': window
+    }
+
+
+#finished orders only need to stick around for the status endpoint
+def purge_finished(hours):
+
+    result = db.session.execute(
+        db.delete(QueuedOrder)
+        .where(QueuedOrder.status.in_(['done', 'failed']), QueuedOrder.date_finished < datetime.utcnow() - timedelta(hours = hours))
+        .execution_options(synchronize_session = False)
+    )
+
+    return result.rowcount
@@ -0,0 +1,282 @@
+#our custom flask commands, these run from the terminal (ex: flask inventory release-expired)
+import os
+import time
+from contextlib import nullcontext
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+#internal imports
+from .models import ApiClient, db, replica_reads
+from . import inventory
+from .stats import rebuild_shop_stats
+from .orders import reconcile_order_totals, purge_idempotency_keys
+from . import checkout_queue, sales_reports
+from .order_history import rebuild_history, reconcile_totals as reconcile_history_totals
+from .products_io import import_products, export_products
+from .images import resolve_missing_images
+from .search import reindex_products, using_postgres
+from .api_tokens import revoke_client, purge_revocations
+
+
+
+inventory_cli = AppGroup('inventory', help = 'Manage product stock & cart reservations.')
+
+
+@inventory_cli.command('release-expired')
+def release_expired():
+    """Put the stock from expired cart reservations back in the shop."""
+
+    released = inventory.release_expired()
+    db.session.commit()
+
+    click.echo(f"Released {released} expired reservation(s)")
+
+
+
+stats_cli = AppGroup('stats', help = 'Manage the cached homepage numbers.')
+
+
+@stats_cli.command('rebuild')
+def rebuild():
+    """Recount products, customers & sales from scratch."""
+
+    stats = rebuild_shop_stats()
+    db.session.commit()
+
+    click.echo(f"{stats.products} products, {stats.customers} customers, {stats.sales} in sales")
+
+
+
+orders_cli = AppGroup('orders', help = 'Maintenance jobs for customer orders.')
+
+
+@orders_cli.command('reconcile-totals')
+def reconcile_totals():
+    """Recompute every order total from its line items (set-based UPDATEs)."""
+
+    fixed = reconcile_order_totals()
+    summaries = reconcile_history_totals() #the history pages show the same totals
+    stats = rebuild_shop_stats() #total sales is the sum of the order totals we just fixed
+    db.session.commit()
+
+    click.echo(f"Fixed {fixed} order total(s) & {summaries} history summaries, total sales is now {stats.sales}")
+
+
+@orders_cli.command('purge-idempotency-keys')
+@click.option('--hours', default = 24, show_default = True, help = 'Keep keys newer than this.')
+def purge_keys(hours):
+    """Delete saved Idempotency-Key answers older than --hours."""
+
+    purged = purge_idempotency_keys(hours)
+    db.session.commit()
+
+    click.echo(f"Deleted {purged} idempotency key(s)")
+
+
+@orders_cli.command('rebuild-history')
+@click.option('--customer', 'cust_id', help = 'Only this customer.')
+def rebuild_history_command(cust_id):
+    """Recount the order history summaries from prod_order."""
+
+    rebuild_history(cust_id)
+    db.session.commit()
+
+    click.echo("Rebuilt the order history for " + (cust_id or "every customer"))
+
+
+@orders_cli.command('work')
+@click.option('--processes', default = 1, show_default = True, help = 'Worker processes draining the queue.')
+@click.option('--batch-size', type = int, help = 'Orders per transaction (CHECKOUT_BATCH_SIZE).')
+@click.option('--once', is_flag = True, help = 'Stop when the queue is empty instead of waiting for more.')
+def work_command(processes, batch_size, once):
+    """Create the orders waiting in the checkout queue (ASYNC_CHECKOUT)."""
+
+    app = current_app._get_current_object()
+    checkout_queue.run_workers(app, processes, batch_size or app.config['CHECKOUT_BATCH_SIZE'], app.config['CHECKOUT_POLL_SECONDS'], once)
+
+    click.echo(f"Checkout queue: {checkout_queue.queue_stats()}")
+
+
+@orders_cli.command('purge-queue')
+@click.option('--hours', default = 24, show_default = True, help = 'Keep finished orders newer than this.')
+def purge_queue(hours):
+    """Delete finished checkout queue rows older than --hours."""
+
+    purged = checkout_queue.purge_finished(hours)
+    db.session.commit()
+
+    click.echo(f"Deleted {purged} finished queued order(s)")
+
+
+
+products_cli = AppGroup('products', help = 'Bulk import & export the product catalog.')
+
+
+#'-' means stdin/stdout so you can pipe catalogs in & out
+def open_path(path, mode):
+    if path == '-':
+        return nullcontext(click.get_text_stream('stdin' if mode == 'r' else 'stdout'))
+    return open(path, mode, newline = '', encoding = 'utf-8') #newline='' is what the csv module wants
+
+
+#csv or jsonl, from --format or else the file extension
+def file_format(path, format):
+    if format:
+        return format
+    return 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json', '.ndjson') else 'csv'
+
+
+@products_cli.command('import')
+@click.argument('path', type = click.Path(exists = True, dir_okay = False, allow_dash = True))
+@click.option('--format', 'format', type = click.Choice(['csv', 'jsonl']), help = 'Defaults to the file extension.')
+@click.option('--batch-size', default = 1000, show_default = True, help = 'Products saved per INSERT/UPDATE.')
+@click.option('--resolve-images', is_flag = True, help = 'Look up images for products without one once the import is done.')
+def import_command(path, format, batch_size, resolve_images):
+    """Create or update (matched by name) products from a csv/jsonl file."""
+
+    def progress(totals, seconds):
+        done = totals['inserted'] + totals['updated']
+        click.echo(f"  {done} products saved ({done / seconds:,.0f}/s)", err = True)
+
+    with open_path(path, 'r') as file:
+        totals = import_products(file, file_format(path, format), batch_size = batch_size, progress = progress)
+
+    rebuild_shop_stats() #one COUNT instead of bumping it for every product
+    db.session.commit()
+
+    for error in totals['errors']:
+        click.echo(f"  skipped {error}", err = True)
+
+    done = totals['inserted'] + totals['updated']
+    click.echo(
+        f"Imported {done} products ({totals['inserted']} new, {totals['updated']} updated, {totals['skipped']} skipped) "
+        f"in {totals['seconds']:.1f}s, {done / max(totals['seconds'], 1e-9):,.0f} products/s"
+    )
+
+    if resolve_images:
+        click.echo(f"Found images for {resolve_missing_images(current_app._get_current_object())} products")
+
+
+@products_cli.command('export')
+@click.argument('path', type = click.Path(dir_okay = False, writable = True, allow_dash = True))
+@click.option('--format', 'format', type = click.Choice(['csv', 'jsonl']), help = 'Defaults to the file extension.')
+def export_command(path, format):
+    """Write every product to a csv/jsonl file."""
+
+    def progress(count, seconds):
+        click.echo(f"  {count} products written ({count / seconds:,.0f}/s)", err = True)
+
+    with open_path(path, 'w') as file, replica_reads(): #a big read, keep it off the primary
+        count, seconds = export_products(file, file_format(path, format), progress = progress)
+
+    click.echo(f"Exported {count} products in {seconds:.1f}s, {count / max(seconds, 1e-9):,.0f} products/s", err = True)
+
+
+@products_cli.command('resolve-images')
+def resolve_images_command():
+    """Look up images for every product still using the placeholder."""
+
+    click.echo(f"Found images for {resolve_missing_images(current_app._get_current_object())} products")
+
+
+@products_cli.command('reindex')
+@click.option('--batch-size', default = 5000, show_default = True, help = 'Products indexed per commit.')
+def reindex_command(batch_size):
+    """Rebuild the search index (search_term) from every product. Postgres doesn't need this."""
+
+    def progress(count):
+        click.echo(f"  {count} products indexed", err = True)
+
+    if using_postgres():
+        click.echo("Nothing to do, postgres searches the product table itself (ix_product_search)")
+        return
+
+    count = reindex_products(batch_size = batch_size, progress = progress)
+    click.echo(f"Indexed {count} products for search")
+
+
+
+reports_cli = AppGroup('reports', help = 'Keep the sales report rollups up to date.')
+
+
+@reports_cli.command('refresh')
+@click.option('--every', type = int, help = 'Keep refreshing every this many seconds (REPORT_REFRESH_SECONDS if 0).')
+def refresh_reports_command(every):
+    """Recount the days that had orders change since the last refresh."""
+
+    if every is None:
+        click.echo(f"Refreshed {sales_reports.refresh_rollups()} day(s) of sales")
+        return
+
+    every = every or current_app.config['REPORT_REFRESH_SECONDS']
+    while True:
+        start = time.perf_counter()
+        days = sales_reports.refresh_rollups()
+        if days:
+            click.echo(f"Refreshed {days} day(s) of sales in {time.perf_counter() - start:.2f}s")
+        time.sleep(max(0, every - (time.perf_counter() - start)))
+
+
+@reports_cli.command('rebuild')
+@click.option('--batch-days', default = 31, show_default = True, help = 'Days recounted per commit.')
+def rebuild_reports_command(batch_days):
+    """Recount every day of sales from the order lines."""
+
+    def progress(done, total):
+        click.echo(f"  {done}/{total} days", err = True)
+
+    start = time.perf_counter()
+    days = sales_reports.rebuild_rollups(batch_days, progress)
+    click.echo(f"Rebuilt {days} day(s) of sales in {time.perf_counter() - start:.1f}s")
+
+
+
+clients_cli = AppGroup('clients', help = 'Apps allowed to get API tokens from /api/token.')
+
+
+@clients_cli.command('create')
+@click.argument('name')
+def create_client_command(name):
+    """Register an app & print its client id & secret (the secret is only shown this once)."""
+
+    client = ApiClient(name)
+    secret = client.new_secret()
+    db.session.add(client)
+    db.session.commit()
+
+    click.echo(f"client_id:     {client.client_id}")
+    click.echo(f"client_secret: {secret}")
+
+
+@clients_cli.command('list')
+def list_clients_command():
+    """Every registered app."""
+
+    for client in db.session.scalars(db.select(ApiClient).order_by(ApiClient.date_created)):
+        click.echo(f"{client.client_id}  {'active ' if client.active else 'revoked'}  {client.date_created:%Y-%m-%d}  {client.name}")
+
+
+@clients_cli.command('revoke')
+@click.argument('client_id')
+def revoke_client_command(client_id):
+    """Cut an app off: no new tokens & the ones it has stop working (within REVOCATION_REFRESH_SECONDS)."""
+
+    client = db.session.get(ApiClient, client_id)
+    if client is None:
+        raise click.ClickException(f"No client {client_id}")
+
+    revoke_client(client)
+    db.session.commit()
+
+    click.echo(f"Revoked {client.name}")
+
+
+@clients_cli.command('purge-revocations')
+def purge_revocations_command():
+    """Delete revocations of tokens that have expired since (they can't be used anyway)."""
+
+    purged = purge_revocations()
+    db.session.commit()
+
+    click.echo(f"Deleted {purged} revocation(s)")
@@ -1,16 +1,26 @@
 import requests
-import requests_cache
-import decimal 
-import json 
+import hashlib
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+from flask import request
+from werkzeug.http import is_resource_modified
 
+#internal imports
+from .instrumentation import external_call
 
+#image lookups are cached in images.ImageLookupCache (not for every requests call in the app)
 
-requests_cache.install_cache(cache_name = 'image_cache', backend='sqlite', expire_after=900)
 
 
 
+logger = logging.getLogger(__name__)
 
-def get_image(search):
+
+#what a product shows until the real image comes back from the search api
+PLACEHOLDER_IMAGE = "https://placehold.co/400x400?text=Image+Coming+Soon"
+
+
+def get_image(search, timeout = 5):
 
     url = "https://google-search72.p.rapidapi.com/imagesearch"
 
@@ -21,10 +31,12 @@ def get_image(search):
         "X-RapidAPI-Host": "google-search72.p.rapidapi.com"
     }
 
-    response = requests.get(url, headers=headers, params=querystring)
+    with external_call('get_image'):
+        response = requests.get(url, headers=headers, params=querystring, timeout=timeout) #never wait on them forever
+        response.raise_for_status()
 
     data = response.json()
-    print(data)
+    logger.debug("image search for %r: %s", search, data)
     img_url = ""
 
     if 'items' in data.keys():
@@ -32,8 +44,38 @@ def get_image(search):
     return img_url
 
 
-class JSONENcoder(json.JSONEncoder):
-    def default(self, obj): #our custom method to handle encoding decimal objects 
-        if isinstance(obj, decimal.Decimal):
-            return str(obj)
-        return json.JSONEncoder(JSONENcoder, self).default(obj) #if its not a decimal just pass it to the default on the json.JSONEncoder
\ No newline at end of file
+#money is always a Decimal rounded to cents, never a float (0.1 + 0.2 != 0.3 with floats)
+CENTS = Decimal('0.01')
+
+
+def to_money(value):
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value)) #str() first so a float like 19.99 doesn't become 19.989999999...
+    return value.quantize(CENTS, rounding = ROUND_HALF_UP)
+
+
+#conditional GET: the client sends back the ETag/Last-Modified we gave them last time &
+#if our data hasn't changed we answer 304 Not Modified without building the response at all
+def make_etag(*parts):
+    parts = [request.full_path] + [str(part) for part in parts] #the query string matters (different page, different filters)
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def not_modified(etag, last_modified = None):
+    return not is_resource_modified(request.environ, etag = etag, last_modified = last_modified)
+
+
+def set_validators(response, etag, last_modified = None):
+    response.set_etag(etag)
+    if isinstance(last_modified, str): #already an http date (ex: out of our catalog cache)
+        response.headers['Last-Modified'] = last_modified
+    elif last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True #it is behind a token so only the browser should keep it
+    response.cache_control.no_cache = True #always check with us before using it
+    return response
+
+
+#offline stand-in for get_image (set IMAGE_FETCHER=rangers_shop.helpers:stub_image), no network calls
+def stub_image(search, timeout = 5):
+    return "https://placehold.co/400x400?text=" + requests.utils.quote(search)
@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.utils import import_string
+from requests_cache.backends.sqlite import SQLiteDict
+
+#internal imports
+from .cache import LRUCache, SingleFlight
+from .helpers import PLACEHOLDER_IMAGE
+from .models import Product, db
+
+
+
+#cache for image lookups only (name -> image url). Checks our own memory first, then a sqlite file
+#every gunicorn worker shares, and only then calls the search api. "no image found" gets cached too
+#(for less time) so we don't keep asking about products the api knows nothing about
+class ImageLookupCache():
+
+    def __init__(self, maxsize = 1024, ttl = 86400, negative_ttl = 900, path = None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local = LRUCache(maxsize = maxsize, ttl = ttl)
+        self.shared = SQLiteDict(path, table_name = 'image_lookups', serializer = None) if path else None
+        self.flight = SingleFlight()
+        self._lock = threading.Lock() #just for our counters
+        self.shared_hits = 0
+        self.lookups = 0 #calls that actually went out to the search api
+
+
+    def key(self, name):
+        return " ".join(name.lower().split()) #"Cute  Plant" & "cute plant" are the same lookup
+
+
+    def get(self, name):
+
+        key = self.key(name)
+        image = self.local.get(key)
+        if image is not None:
+            return image
+
+        if self.shared is None:
+            return None
+
+        item = self.shared.get(key)
+        if item is None:
+            return None
+
+        item = json.loads(item)
+        remaining = item['expires_at'] - time.time()
+        if remaining <= 0:
+            return None
+
+        with self._lock:
+            self.shared_hits += 1
+        self.local.set(key, item['image'], ttl = remaining) #keep it in memory for the rest of its life
+        return item['image']
+
+
+    def set(self, name, image):
+
+        key = self.key(name)
+        ttl = self.ttl if image else self.negative_ttl
+
+        self.local.set(key, image, ttl = ttl)
+        if self.shared is not None:
+            self.shared[key] = json.dumps({'image': image, 'expires_at': time.time() + ttl})
+
+
+    #hand back the cached image or call fetch() to go get it, only one call per name at a time
+    def get_or_fetch(self, name, fetch):
+
+        image = self.get(name)
+        if image is not None:
+            return image
+
+        def lookup():
+            image = self.get(name) #someone may have finished the same lookup while we waited
+            if image is None:
+                with self._lock:
+                    self.lookups += 1
+                image = fetch()
+                self.set(name, image)
+            return image
+
+        return self.flight.do(self.key(name), lookup)
+
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update({
+            'shared_hits': self.shared_hits,
+            'coalesced': self.flight.shared,
+            'lookups': self.lookups
+        })
+        return stats
+
+
+image_cache = None
+_image_cache_lock = threading.Lock() #two background threads could both try to build it at once
+
+
+def get_image_cache(app):
+    global image_cache
+
+    with _image_cache_lock:
+        if image_cache is None:
+            image_cache = ImageLookupCache(
+                maxsize = app.config['IMAGE_CACHE_SIZE'],
+                ttl = app.config['IMAGE_CACHE_TTL'],
+                negative_ttl = app.config['IMAGE_CACHE_NEGATIVE_TTL'],
+                path = app.config['IMAGE_CACHE_PATH']
+            )
+
+    return image_cache
+
+
+
+#a small pool of background threads that look up product images so our create/update pages don't wait on the search api
+_executor = None
+_workers = 0
+
+
+def get_executor(workers):
+    global _executor, _workers
+
+    if _executor is None or _workers != workers:
+        _executor = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'image-lookup')
+        _workers = workers
+
+    return _executor
+
+
+#call this AFTER the product is committed so the background thread can find it in the database
+def resolve_later(product):
+
+    if product.image != PLACEHOLDER_IMAGE: #they gave us an image already
+        return None
+
+    app = current_app._get_current_object() #the real app object, the current_app proxy doesn't work in another thread
+
+    if app.config['IMAGE_WORKERS'] <= 0:
+        return resolve_image(app, product.prod_id, product.name)
+
+    return get_executor(app.config['IMAGE_WORKERS']).submit(resolve_image, app, product.prod_id, product.name)
+
+
+#look up the image (retrying with backoff) & save it on the product
+def resolve_image(app, prod_id, name):
+
+    fetcher = import_string(app.config['IMAGE_FETCHER'])
+
+    def fetch():
+        delay = app.config['IMAGE_BACKOFF']
+
+        for attempt in range(app.config['IMAGE_RETRIES'] + 1):
+            try:
+                return fetcher(name, timeout = app.config['IMAGE_TIMEOUT'])
+            except Exception as error: #timeouts, bad responses, the api being down...
+                app.logger.warning("image lookup for %r failed (attempt %s): %s", name, attempt + 1, error)
+                if attempt == app.config['IMAGE_RETRIES']:
+                    raise #out of tries, don't cache anything so the next product with this name tries again
+                time.sleep(delay)
+                delay *= 2
+
+    try:
+        image = get_image_cache(app).get_or_fetch(name, fetch)
+    except Exception:
+        return None
+
+    if not image:
+        return None
+
+    with app.app_context():
+        #only replace the placeholder, if someone set an image by hand in the meantime we keep theirs
+        db.session.execute(
+            db.update(Product)
+            .where(Product.prod_id == prod_id, Product.image == PLACEHOLDER_IMAGE)
+            .values(image = image)
+        )
+        db.session.commit()
+
+    return image
+
+
+#look up images for every product still showing the placeholder (ex: after a bulk import)
+#a chunk at a time so we never have a million lookups waiting in memory. Returns how many got an image
+def resolve_missing_images(app, chunk_size = 100):
+
+    executor = get_executor(max(app.config['IMAGE_WORKERS'], 1))
+    resolved = 0
+    last_id = None
+
+    while True:
+        with app.app_context():
+            query = db.select(Product.prod_id, Product.name).where(Product.image == PLACEHOLDER_IMAGE)
+            if last_id is not None:
+                query = query.where(Product.prod_id > last_id)
+
+            products = db.session.execute(query.order_by(Product.prod_id).limit(chunk_size)).all()
+
+        if not products:
+            return resolved
+
+        futures = [executor.submit(resolve_image, app, prod_id, name) for prod_id, name in products]
+        resolved += sum(1 for future in futures if future.result())
+        last_id = products[-1].prod_id
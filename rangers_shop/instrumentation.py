@@ -0,0 +1,198 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+
+
+
+#request timings for when something gets slow. Off unless INSTRUMENTATION_ENABLED is true, then every request gets:
+#  wall time, how many SQL statements it ran & how long they took
+#  a Server-Timing header (shows up in the browser's network tab) & counters for GET /metrics (prometheus)
+#calls to other apis (get_image) get their own histogram in /metrics & not a per-request number, they mostly run on
+#the image resolver threads (IMAGE_WORKERS) where there is no request to add them to
+#  PROFILE_SAMPLE_RATE of requests run under cProfile, the ones slower than PROFILE_SLOW_MS get saved to PROFILE_DIR
+#  (open them with snakeviz or turn them into a flamegraph with flameprof)
+#every gunicorn worker keeps its own counters, prometheus adds them up across the pods/workers it scrapes
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) #seconds
+
+
+#a prometheus histogram: how many observations landed at or under each bucket, plus the total & the count
+class Histogram():
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.total += seconds
+        self.count += 1
+
+
+    def lines(self, name, labels):
+        for bound, count in zip(BUCKETS, self.buckets):
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.total}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+
+class Instrumentation():
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.requests = {} #(method, endpoint, status) -> count
+        self.durations = {} #endpoint -> Histogram
+        self.queries = {} #endpoint -> [statements, seconds]
+        self.external = {} #(name, outcome) -> Histogram
+        self.profiles = 0
+
+
+    def init_app(self, app, db):
+
+        app.extensions['instrumentation'] = self
+        self.enabled = app.config['INSTRUMENTATION_ENABLED']
+        if not self.enabled:
+            return
+
+        self.slow_ms = app.config['PROFILE_SLOW_MS']
+        self.sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        self.profile_dir = app.config['PROFILE_DIR']
+
+        with app.app_context():
+            engines = list(db.engines.values())
+
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', _query_started)
+            event.listen(engine, 'after_cursor_execute', _query_finished)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+
+    def start_request(self):
+
+        g.timing = {'start': time.perf_counter(), 'queries': 0, 'db': 0.0, 'profiler': None}
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            g.timing['profiler'] = cProfile.Profile()
+            g.timing['profiler'].enable()
+
+
+    def finish_request(self, response):
+
+        timing = g.pop('timing', None)
+        if timing is None: #a before_request before ours answered already
+            return response
+
+        elapsed = time.perf_counter() - timing['start']
+        endpoint = request.endpoint or 'unknown' #route names, not urls, so we don't get a metric per product id
+
+        profiler = timing['profiler']
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= self.slow_ms:
+                self.save_profile(profiler, endpoint)
+
+        if elapsed * 1000 >= self.slow_ms:
+            current_app.logger.warning("slow request %s %s: %.0fms, %s queries (%.0fms)",
+                request.method, request.path, elapsed * 1000, timing['queries'], timing['db'] * 1000)
+
+        with self._lock:
+            key = (request.method, endpoint, response.status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.setdefault(endpoint, Histogram()).observe(elapsed)
+            queries = self.queries.setdefault(endpoint, [0, 0.0])
+            queries[0] += timing['queries']
+            queries[1] += timing['db']
+
+        #streamed responses (GET /api/order) are timed until the first byte, not the last
+        response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        response.headers.add('Server-Timing', f'db;dur={timing["db"] * 1000:.1f};desc="{timing["queries"]} queries"')
+
+        return response
+
+
+    def save_profile(self, profiler, endpoint):
+
+        os.makedirs(self.profile_dir, exist_ok = True)
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}.prof"))
+        with self._lock:
+            self.profiles += 1
+
+
+    def record_external(self, name, seconds, outcome):
+        with self._lock:
+            self.external.setdefault((name, outcome), Histogram()).observe(seconds)
+
+
+    #everything we know in the prometheus text format
+    def prometheus(self):
+
+        with self._lock:
+            lines = ['# TYPE shop_http_requests_total counter']
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'shop_http_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+
+            lines.append('# TYPE shop_http_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.durations.items()):
+                lines.extend(histogram.lines('shop_http_request_duration_seconds', f'endpoint="{endpoint}"'))
+
+            lines.append('# TYPE shop_db_queries_total counter')
+            lines.extend(f'shop_db_queries_total{{endpoint="{endpoint}"}} {count}' for endpoint, (count, _) in sorted(self.queries.items()))
+            lines.append('# TYPE shop_db_query_seconds_total counter')
+            lines.extend(f'shop_db_query_seconds_total{{endpoint="{endpoint}"}} {seconds}' for endpoint, (_, seconds) in sorted(self.queries.items()))
+
+            lines.append('# TYPE shop_external_call_duration_seconds histogram')
+            for (name, outcome), histogram in sorted(self.external.items()):
+                lines.extend(histogram.lines('shop_external_call_duration_seconds', f'name="{name}",outcome="{outcome}"'))
+
+            lines.append('# TYPE shop_profiles_saved_total counter')
+            lines.append(f'shop_profiles_saved_total {self.profiles}')
+
+        return lines
+
+
+instrumentation = Instrumentation()
+
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter() #one statement at a time per connection
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+
+    elapsed = time.perf_counter() - conn.info.pop('query_start')
+
+    if has_request_context() and 'timing' in g: #background threads & cli commands aren't a request
+        g.timing['queries'] += 1
+        g.timing['db'] += elapsed
+
+
+#wrap calls to other apis with this so their time shows up in /metrics, whichever thread makes them
+@contextmanager
+def external_call(name):
+
+    if not instrumentation.enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        instrumentation.record_external(name, time.perf_counter() - start, outcome)
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from flask import current_app
+
+#internal imports
+from .models import Product, Reservation, db
+
+
+
+#hold stock for a customer's cart. The stock comes out of the shop right away (guarded so it can't go negative)
+#& goes back in if they don't check out before the reservation expires. Raises ValueError for a quantity that
+#isn't a whole number above 0 (a negative reservation would hand out stock at checkout)
+def reserve(cust_id, prod_id, quantity, minutes = None):
+
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        raise ValueError("quantity needs to be a whole number more than 0")
+
+    minutes = minutes or current_app.config['RESERVATION_MINUTES']
+
+    release_expired([prod_id]) #give back anything that timed out so it doesn't count against this customer
+    Product.decrement_stock({prod_id: quantity}) #raises OutOfStock
+
+    reservation = Reservation(prod_id, cust_id, quantity, datetime.utcnow() + timedelta(minutes = minutes))
+    db.session.add(reservation)
+
+    return reservation
+
+
+#customer emptied their cart (or changed their mind) so put the stock back. Returns False when the
+#reservation was already gone (released twice at once, used by a checkout or expired & swept)
+def release(reservation_id):
+
+    released = take_reservations(Reservation.reservation_id == reservation_id)
+    Product.increment_stock(by_product(released))
+
+    return bool(released)
+
+
+#put expired reservations back on the shelf. prod_ids lets the order routes only sweep the products they touch
+def release_expired(prod_ids = None):
+
+    where = [Reservation.expires_at <= datetime.utcnow()]
+    if prod_ids is not None:
+        where.append(Reservation.prod_id.in_(prod_ids))
+
+    expired = take_reservations(*where)
+    Product.increment_stock(by_product(expired))
+
+    return len(expired)
+
+
+#turn a customer's active reservations into part of their order
+#returns whatever quantities still need to come out of the shop's stock
+def claim(cust_id, quantities):
+
+    remaining = {prod_id: int(quantity) for prod_id, quantity in quantities.items()}
+
+    reserved = by_product(take_reservations(
+        Reservation.cust_id == cust_id,
+        Reservation.prod_id.in_(remaining),
+        Reservation.expires_at > datetime.utcnow()
+    ))
+
+    leftover = {} #reserved more than they ordered, this goes back to the shop
+
+    for prod_id, quantity in reserved.items():
+        used = max(0, min(quantity, remaining[prod_id])) #never give stock back for a bad (negative) row
+        remaining[prod_id] -= used
+
+        if quantity > used:
+            leftover[prod_id] = quantity - used
+
+    Product.increment_stock(leftover)
+
+    return remaining
+
+
+#delete the matching reservations & return [(prod_id, quantity), ...] of the ones WE deleted, one DELETE ... RETURNING.
+#two requests going after the same reservation (two checkouts, a checkout & a sweep) can't both get it this way,
+#reading them first & deleting after could hand the same stock out twice (sqlite ignores FOR UPDATE)
+def take_reservations(*where):
+
+    return db.session.execute(
+        db.delete(Reservation).where(*where)
+        .returning(Reservation.prod_id, Reservation.quantity)
+        .execution_options(synchronize_session = False)
+    ).all()
+
+
+def by_product(reservations):
+
+    totals = {}
+    for prod_id, quantity in reservations:
+        totals[prod_id] = totals.get(prod_id, 0) + quantity
+
+    return totals
+
+
+#take the stock for an order, using the customer's reservations first
+def take_stock(cust_id, quantities):
+
+    release_expired(list(quantities))
+    Product.decrement_stock(claim(cust_id, quantities)) #raises OutOfStock
+
@@ -1,30 +1,191 @@
-from werkzeug.security import generate_password_hash #allows us to generate a hashed password
 from flask_sqlalchemy import SQLAlchemy #allows our database to read our classes/objects as tables/rows 
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
 from flask_login import UserMixin, LoginManager #allows us to load a current logged in user
 from datetime import datetime
+from contextlib import contextmanager
+from functools import wraps
+import hashlib
+import hmac
+import random
+import secrets
+import threading
 import uuid #generate a unique id (basically the same serializing last week)
 from flask_marshmallow import Marshmallow 
+from flask import current_app
 
 #internal import
-from .helpers import get_image
+from .helpers import PLACEHOLDER_IMAGE, to_money
+from .passwords import hash_password, verify_password, needs_rehash #hashing policy lives in our config (PASSWORD_HASH_METHOD)
+from .cache import LRUCache
+
+
+
+#flask-sqlalchemy's session, except reads can go to a read replica (REPLICA_BINDS in our config)
+#only inside replica_reads()/@read_only & only until the session writes something. After that every
+#query goes to the primary so we always read our own writes (a replica can be a little behind)
+class RoutingSession(Session):
+
+    def get_bind(self, mapper = None, clause = None, bind = None, **kwargs):
+
+        if bind is None and self.info.get('replica') and not self.info.get('wrote') and not self._flushing \
+                and not getattr(clause, 'is_dml', False) and getattr(clause, '_for_update_arg', None) is None:
+            replicas = current_app.config['REPLICA_BINDS']
+            if replicas:
+                return self._db.engines[random.choice(replicas)]
+
+        return super().get_bind(mapper = mapper, clause = clause, bind = bind, **kwargs)
+
+
+
+db = SQLAlchemy(session_options = {'class_': RoutingSession}) #instantiate our database
+
+
+@event.listens_for(db.session, 'after_flush')
+def _stick_to_primary(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _stick_to_primary_on_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+#send this block's reads to a replica (ex: reports, exports). Nested calls are fine
+@contextmanager
+def replica_reads():
+
+    was_on = db.session.info.get('replica', False)
+    db.session.info['replica'] = True
+    try:
+        yield
+    finally:
+        db.session.info['replica'] = was_on
+
+
+#same thing for a whole route. Only for pages that can live with data a second or two old,
+#never for checkout or anything that reads back what the customer just changed
+def read_only(view):
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+
+    return wrapper
+
+
+#the rest of this session reads from the primary, for when a replica might not have something yet
+def use_primary():
+    db.session.info['wrote'] = True
 
 
 
-db = SQLAlchemy() #instantiate our database
 login_manager = LoginManager() #instantiate our login manager
 ma = Marshmallow() #instantiating our Marshmallow class 
 
 
 
+#our ids are uuid4 strings. Postgres stores them as a native 16 byte UUID (smaller indexes, faster joins),
+#everywhere else they stay plain strings. Python always sees a str either way
+class UUIDString(db.TypeDecorator):
+
+    impl = db.String
+    cache_ok = True
+
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid = False))
+        return dialect.type_descriptor(db.String())
+
+
+    def process_bind_param(self, value, dialect):
+
+        if value is None or dialect.name != 'postgresql':
+            return value
+
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None #a made up id from a url can't match anything (instead of postgres throwing an error at us)
+
+
+
+class OutOfStock(Exception):
+    #raised when we try to take more of a product than we have available 
+    def __init__(self, prod_ids):
+        self.prod_ids = list(prod_ids)
+        super().__init__(f"Not enough stock for product(s): {', '.join(self.prod_ids)}")
+
+
+
+#what current_user is on every logged in page: just the columns our pages use (no password hash),
+#small enough to keep in memory so most page views don't have to ask the database who is logged in
+class SessionUser(UserMixin):
+
+    FIELDS = ('user_id', 'username', 'email', 'first_name', 'last_name')
+
+    def __init__(self, user_id, username, email, first_name, last_name):
+        self.user_id = user_id
+        self.username = username
+        self.email = email
+        self.first_name = first_name
+        self.last_name = last_name
+
+
+    def get_id(self):
+        return str(self.user_id)
+
+
+    def __repr__(self):
+        return f"<SESSIONUSER: {self.username}>"
+
+
+
+#user_id -> SessionUser. Each gunicorn worker has its own, so a change shows up in the other workers
+#within USER_CACHE_TTL seconds (the worker that made the change forgets the old one right away)
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+
+    with _user_cache_lock:
+        if _user_cache is None:
+            _user_cache = LRUCache(maxsize = current_app.config['USER_CACHE_SIZE'], ttl = current_app.config['USER_CACHE_TTL'])
+
+    return _user_cache
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id) #this queries our database & brings back the user with the same id
+
+    cache = get_user_cache()
+    user = cache.get(user_id)
+    if user is not None:
+        return user
+
+    #this queries our database & brings back the user with the same id (only the columns we need)
+    row = db.session.execute(
+        db.select(*[getattr(User, field) for field in SessionUser.FIELDS]).where(User.user_id == user_id)
+    ).first()
+
+    if row is None: #deleted user with an old cookie
+        return None
+
+    user = SessionUser(*row)
+    cache.set(user_id, user)
+    return user
 
 
 
 class User(db.Model, UserMixin):
     #think of this part as the CREATE TABLE 'User' 
-    user_id = db.Column(db.String, primary_key = True)
+    user_id = db.Column(UUIDString, primary_key = True)
     first_name = db.Column(db.String(30))
     last_name = db.Column(db.String(30))
     username = db.Column(db.String(30), nullable=False, unique=True)
@@ -52,22 +213,61 @@ class User(db.Model, UserMixin):
     
 
     def set_password(self, password):
-        return generate_password_hash(password)
+        return hash_password(password)
+
+
+    #does this password match? A match on a hash made under an older PASSWORD_HASH_METHOD gets redone
+    #with the current one (the caller commits), logging in is the only time we have the plain password.
+    #can raise PasswordCheckBusy when too many sign ins are being checked at once
+    def check_password(self, password):
+
+        if not verify_password(self.password, password):
+            return False
+
+        if needs_rehash(self.password):
+            self.password = self.set_password(password)
+
+        return True
     
 
     def __repr__(self):
         return f"<USER: {self.username}"
     
 
+#forget cached SessionUsers once a change to them is committed (profile edits, password changes & rehashes, deletes)
+@event.listens_for(db.session, 'before_flush')
+def _track_user_changes(session, flush_context, instances):
+    changed = {obj.user_id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('users_changed', set()).update(changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _forget_changed_users(session):
+    for user_id in session.info.pop('users_changed', ()):
+        get_user_cache().delete(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _keep_users_after_rollback(session):
+    session.info.pop('users_changed', None)
+
+
+
 class Product(db.Model):
-    prod_id = db.Column(db.String, primary_key = True)
+    prod_id = db.Column(UUIDString, primary_key = True)
     name = db.Column(db.String(100), nullable = False)
     image = db.Column(db.String, nullable = False)
     description = db.Column(db.String(200))
     price = db.Column(db.Numeric(precision=10, scale=2), nullable = False)
     quantity = db.Column(db.Integer, nullable = False)
     date_added = db.Column(db.DateTime, default = datetime.utcnow)
+    date_updated = db.Column(db.DateTime, default = datetime.utcnow, onupdate = datetime.utcnow) #changes on any UPDATE, even our stock ones
     prodord = db.relationship('ProdOrder', backref = 'product', lazy=True)
+    __table_args__ = (
+        db.Index('ix_product_date_added_prod_id', 'date_added', 'prod_id'), #keyset pagination in GET /api/shop
+        db.Index('ix_product_name', 'name', postgresql_ops = {'name': 'text_pattern_ops'}), #name LIKE 'prefix%'
+    )
     #user_id = db.Column(db.String, db.ForeignKey('user.user_id'), nullable = False) #if we wanted to make a foreign key relationship
 
 
@@ -85,20 +285,58 @@ class Product(db.Model):
 
     def set_image(self, image, name):
         if not image: #aka image is not present
-            image = get_image(name) #adding get_image function which makes an external 3rd party API callh
-            print("api image", image)
+            image = PLACEHOLDER_IMAGE #the real one gets looked up in the background (see images.resolve_later)
 
         return image
     
     def decrement_quantity(self, quantity):
 
-        self.quantity -= int(quantity)
+        Product.decrement_stock({self.prod_id: quantity}) #raises OutOfStock if we don't have enough
+        db.session.expire(self, ['quantity']) #reload the new quantity from the database next time we look at it
         return self.quantity #all methods need to return otherwise the object attribute doesnt get updated
     
     def increment_quantity(self, quantity):
 
-        self.quantity += int(quantity)
+        Product.increment_stock({self.prod_id: quantity})
+        db.session.expire(self, ['quantity'])
         return self.quantity
+
+
+    #the database does the math here (UPDATE ... SET quantity = quantity - n WHERE quantity >= n)
+    #so two checkouts racing for the last unit can't both win & our stock can never go negative
+    @staticmethod
+    def decrement_stock(quantities): #quantities is a dictionary of prod_id -> how many to take
+
+        quantities = {prod_id: int(quantity) for prod_id, quantity in quantities.items() if int(quantity) > 0}
+        if not quantities:
+            return
+
+        amount = db.case(quantities, value = Product.prod_id) #one statement for every product instead of one per product
+        stmt = db.update(Product) \
+            .where(Product.prod_id.in_(quantities), Product.quantity >= amount) \
+            .values(quantity = Product.quantity - amount) \
+            .returning(Product.prod_id) \
+            .execution_options(synchronize_session = False)
+
+        updated = {row.prod_id for row in db.session.execute(stmt)}
+        if len(updated) != len(quantities):
+            raise OutOfStock([prod_id for prod_id in quantities if prod_id not in updated])
+
+
+    @staticmethod
+    def increment_stock(quantities):
+
+        quantities = {prod_id: int(quantity) for prod_id, quantity in quantities.items() if int(quantity) > 0}
+        if not quantities:
+            return
+
+        amount = db.case(quantities, value = Product.prod_id)
+        stmt = db.update(Product) \
+            .where(Product.prod_id.in_(quantities)) \
+            .values(quantity = Product.quantity + amount) \
+            .execution_options(synchronize_session = False)
+
+        db.session.execute(stmt)
     
 
     def __repr__(self):
@@ -106,9 +344,43 @@ class Product(db.Model):
 
 
 
+#what GET /api/search matches against on postgres: the product's words, name words ranked above description words.
+#the gin index has to be built from this exact expression or postgres won't use it, so both live here
+def product_document(name, description):
+    english = db.literal('english', db.String) #literals, not columns, or the index below can't tell which table it's on
+    return db.func.setweight(db.func.to_tsvector(english, name), db.literal('A', db.String)).op('||')(
+        db.func.setweight(db.func.to_tsvector(english, db.func.coalesce(description, db.literal('', db.String))), db.literal('B', db.String))
+    )
+
+
+#postgres only, everything else searches through SearchTerm instead
+db.Index('ix_product_search', product_document(Product.name, Product.description), postgresql_using = 'gin').ddl_if(dialect = 'postgresql')
+db.Index('ix_product_name_trgm', Product.name, postgresql_using = 'gin', postgresql_ops = {'name': 'gin_trgm_ops'}).ddl_if(dialect = 'postgresql') #typos (pg_trgm)
+
+
+
+#our own inverted index for GET /api/search when we're not on postgres: one row per word per product.
+#search.py rewrites a product's rows in the same transaction that changes the product
+class SearchTerm(db.Model):
+    term = db.Column(db.String(40), primary_key = True) #term first so "which products have this word" is one index range
+    prod_id = db.Column(UUIDString, db.ForeignKey('product.prod_id'), primary_key = True)
+    weight = db.Column(db.Integer, nullable = False) #times the word shows up, words in the name count extra
+    __table_args__ = (
+        db.Index('ix_search_term_prod_id', 'prod_id'), #dropping a product's words when it changes
+        db.Index('ix_search_term_term_weight', 'term', db.text('weight DESC'), 'prod_id'), #one word searches, best matches first
+        {'sqlite_with_rowid': False} #sqlite keeps the rows inside the primary key, a word's products are read in one sweep
+    )
+
+
+    def __repr__(self):
+        return f"<SEARCHTERM: {self.term} {self.prod_id}>"
+
+
+
 class Customer(db.Model):
     cust_id = db.Column(db.String, primary_key = True)
-    date_created = db.Column(db.DateTime, default = datetime.utcnow())
+    date_created = db.Column(db.DateTime, default = datetime.utcnow)
+    date_updated = db.Column(db.DateTime, default = datetime.utcnow) #last time anything on their orders changed
     prodord  = db.relationship('ProdOrder', backref = 'customer', lazy = True) #backref is just how are these related, lazy means a Customer can exist without the ProdOrder table
 
 
@@ -116,17 +388,74 @@ class Customer(db.Model):
         self.cust_id = cust_id #we are getting their id from the front end 
 
 
+    #their first order adds them, returns whether we did. INSERT ... ON CONFLICT DO NOTHING so two first orders
+    #at the same moment don't trip over each other (the one that loses just carries on as a returning customer)
+    @staticmethod
+    def add(cust_id):
+
+        insert = postgresql.insert if db.session.get_bind(Customer).dialect.name == 'postgresql' else sqlite.insert
+        stmt = insert(Customer).values(cust_id = cust_id).on_conflict_do_nothing(index_elements = ['cust_id']).returning(Customer.cust_id)
+
+        return db.session.execute(stmt).first() is not None
+
+
+    #mark this customer's orders as changed so anyone polling GET /api/order/<cust_id> gets the new version
+    @staticmethod
+    def touch(cust_id):
+        db.session.execute(
+            db.update(Customer)
+            .where(Customer.cust_id == cust_id)
+            .values(date_updated = datetime.utcnow())
+            .execution_options(synchronize_session = False)
+        )
+
+
+
+#a cart can hold onto stock for a little while before the customer checks out
+#the stock is taken out of Product.quantity as soon as we reserve it & given back if the reservation expires
+class Reservation(db.Model):
+    reservation_id = db.Column(UUIDString, primary_key = True)
+    prod_id = db.Column(UUIDString, db.ForeignKey('product.prod_id'), nullable = False)
+    cust_id = db.Column(db.String, nullable = False) #not a foreign key because the customer doesn't exist until their first order
+    quantity = db.Column(db.Integer, nullable = False)
+    expires_at = db.Column(db.DateTime, nullable = False)
+    __table_args__ = (
+        db.Index('ix_reservation_cust_id_prod_id', 'cust_id', 'prod_id'),
+        db.Index('ix_reservation_prod_id_expires_at', 'prod_id', 'expires_at'),
+    )
+
+
+    def __init__(self, prod_id, cust_id, quantity, expires_at):
+        self.reservation_id = self.set_id()
+        self.prod_id = prod_id
+        self.cust_id = cust_id
+        self.quantity = int(quantity)
+        self.expires_at = expires_at
+
+
+    def set_id(self):
+        return str(uuid.uuid4())
+    
+
+    def __repr__(self):
+        return f"<RESERVATION: {self.prod_id} x {self.quantity}>"
+
+
 
 #Many to Many relationship with Products, Customers & Orders
 #So we need a join table
 
 class ProdOrder(db.Model):
-    prodorder_id = db.Column(db.String, primary_key = True)
-    prod_id = db.Column(db.String, db.ForeignKey('product.prod_id'), nullable = False)
+    prodorder_id = db.Column(UUIDString, primary_key = True)
+    prod_id = db.Column(UUIDString, db.ForeignKey('product.prod_id'), nullable = False)
     quantity = db.Column(db.Integer, nullable = False)
     price = db.Column(db.Numeric(precision = 10, scale = 2), nullable = False)
-    order_id = db.Column(db.String,  db.ForeignKey('order.order_id'), nullable = False)
-    cust_id = db.Column(db.String, db.ForeignKey('customer.cust_id'), nullable = False)
+    order_id = db.Column(UUIDString,  db.ForeignKey('order.order_id'), nullable = False)
+    cust_id = db.Column(db.String, db.ForeignKey('customer.cust_id'), nullable = False) #customer ids come from the front end, not always uuids
+    __table_args__ = (
+        db.Index('ix_prod_order_order_id_prod_id', 'order_id', 'prod_id'), #every cart edit looks up one product on one order
+        db.Index('ix_prod_order_cust_id', 'cust_id'), #GET /api/order/<cust_id>
+    )
 
 
     def __init__(self, prod_id, quantity, price, order_id, cust_id):
@@ -145,10 +474,7 @@ class ProdOrder(db.Model):
 
     def set_price(self, price, quantity):
 
-        quantity = float(quantity)
-        price = float(price)
-
-        self.price = quantity * price
+        self.price = to_money(to_money(price) * int(quantity)) #Decimal math, no float rounding errors
         return self.price 
     
 
@@ -160,15 +486,16 @@ class ProdOrder(db.Model):
 
 
 class Order(db.Model):
-    order_id = db.Column(db.String, primary_key = True)
+    order_id = db.Column(UUIDString, primary_key = True)
     order_total = db.Column(db.Numeric(precision = 10, scale = 2), nullable = False)
-    date_created = db.Column(db.DateTime, default = datetime.utcnow())
+    date_created = db.Column(db.DateTime, default = datetime.utcnow, index = True) #the sales reports bucket orders by this day
     prodorder = db.relationship('ProdOrder', backref = 'order', lazy = True)
 
 
     def __init__(self):
         self.order_id = self.set_id()
-        self.order_total = 0.00
+        self.order_total = to_money(0)
+        self.date_created = datetime.utcnow() #set now (not at flush) so the order summary gets the same time
 
 
     def set_id(self):
@@ -178,24 +505,311 @@ class Order(db.Model):
     #for every product's total price in prodorder table add to our order's total price 
     def increment_order_total(self, price):
 
-        self.order_total = float(self.order_total)
-        self.order_total += float(price)
+        self.order_total = to_money(to_money(self.order_total) + to_money(price))
 
         return self.order_total
     
     def decrement_order_total(self, price):
 
-        self.order_total = float(self.order_total)
-        self.order_total -= float(price)
+        self.order_total = to_money(to_money(self.order_total) - to_money(price))
 
 
         return self.order_total 
+
+
+    #change a saved order's total by delta inside the database (order_total = order_total + delta)
+    #so two requests editing the same order at once can't overwrite each other's math
+    @staticmethod
+    def adjust_total(order_id, delta):
+
+        delta = to_money(delta)
+        if not delta:
+            return
+
+        db.session.execute(
+            db.update(Order)
+            .where(Order.order_id == order_id)
+            .values(order_total = Order.order_total + delta)
+            .execution_options(synchronize_session = False)
+        )
     
     def __repr__(self):
 
         return f"<ORDER: {self.order_id}>"
     
 
+#read model for a customer's order history (see order_history.py): the numbers for each order already added up,
+#kept up to date by the order routes so the history pages never have to go through every prod_order row
+class OrderSummary(db.Model):
+    order_id = db.Column(UUIDString, db.ForeignKey('order.order_id'), primary_key = True)
+    cust_id = db.Column(db.String, nullable = False)
+    line_count = db.Column(db.Integer, nullable = False, default = 0) #prod_order rows
+    item_count = db.Column(db.Integer, nullable = False, default = 0) #their quantities added up
+    order_total = db.Column(db.Numeric(precision = 10, scale = 2), nullable = False, default = 0)
+    date_created = db.Column(db.DateTime, default = datetime.utcnow)
+    date_updated = db.Column(db.DateTime, default = datetime.utcnow, onupdate = datetime.utcnow, index = True) #sales_reports finds changed orders by this
+    __table_args__ = (
+        db.Index('ix_order_summary_cust_id_date_created', 'cust_id', 'date_created', 'order_id'), #newest first, one page at a time
+    )
+
+
+    def __init__(self, order_id, cust_id, line_count, item_count, order_total, date_created = None):
+        self.order_id = order_id
+        self.cust_id = cust_id
+        self.line_count = line_count
+        self.item_count = item_count
+        self.order_total = to_money(order_total)
+        self.date_created = date_created or datetime.utcnow()
+
+
+    def __repr__(self):
+        return f"<ORDERSUMMARY: {self.order_id} {self.line_count} lines {self.order_total}>"
+
+
+
+#the same numbers for everything a customer ever ordered, one row per customer
+class CustomerSummary(db.Model):
+    cust_id = db.Column(db.String, db.ForeignKey('customer.cust_id'), primary_key = True)
+    order_count = db.Column(db.Integer, nullable = False, default = 0)
+    line_count = db.Column(db.Integer, nullable = False, default = 0)
+    item_count = db.Column(db.Integer, nullable = False, default = 0)
+    total_spent = db.Column(db.Numeric(precision = 12, scale = 2), nullable = False, default = 0)
+    last_order_at = db.Column(db.DateTime)
+    date_updated = db.Column(db.DateTime, default = datetime.utcnow, onupdate = datetime.utcnow) #ETag/Last-Modified for the history pages
+
+
+    def __init__(self, cust_id, order_count = 0, line_count = 0, item_count = 0, total_spent = 0, last_order_at = None):
+        self.cust_id = cust_id
+        self.order_count = order_count
+        self.line_count = line_count
+        self.item_count = item_count
+        self.total_spent = to_money(total_spent)
+        self.last_order_at = last_order_at
+
+
+    def __repr__(self):
+        return f"<CUSTOMERSUMMARY: {self.cust_id} {self.order_count} orders {self.total_spent}>"
+
+
+
+#sales rollups for the report endpoints (see sales_reports.py), one row per day (UTC) & product/customer.
+#a report reads a few hundred of these instead of millions of prod_order rows
+class DailySales(db.Model):
+    day = db.Column(db.Date, primary_key = True)
+    order_count = db.Column(db.Integer, nullable = False, default = 0)
+    customer_count = db.Column(db.Integer, nullable = False, default = 0)
+    units = db.Column(db.Integer, nullable = False, default = 0)
+    revenue = db.Column(db.Numeric(precision = 14, scale = 2), nullable = False, default = 0)
+    __table_args__ = (
+        {'sqlite_with_rowid': False}, #rows live inside the primary key, a date range is one sweep
+    )
+
+
+    def __repr__(self):
+        return f"<DAILYSALES: {self.day} {self.order_count} orders {self.revenue}>"
+
+
+
+class DailyProductSales(db.Model):
+    day = db.Column(db.Date, primary_key = True)
+    prod_id = db.Column(UUIDString, primary_key = True)
+    order_count = db.Column(db.Integer, nullable = False, default = 0)
+    units = db.Column(db.Integer, nullable = False, default = 0)
+    revenue = db.Column(db.Numeric(precision = 14, scale = 2), nullable = False, default = 0)
+    __table_args__ = (
+        {'sqlite_with_rowid': False}, #reports read a range of days, the primary key (day, ...) is all they need
+    )
+
+
+    def __repr__(self):
+        return f"<DAILYPRODUCTSALES: {self.day} {self.prod_id} {self.units} units>"
+
+
+
+class DailyCustomerSales(db.Model):
+    day = db.Column(db.Date, primary_key = True)
+    cust_id = db.Column(db.String, primary_key = True)
+    order_count = db.Column(db.Integer, nullable = False, default = 0)
+    units = db.Column(db.Integer, nullable = False, default = 0)
+    revenue = db.Column(db.Numeric(precision = 14, scale = 2), nullable = False, default = 0)
+    __table_args__ = (
+        {'sqlite_with_rowid': False},
+    )
+
+
+    def __repr__(self):
+        return f"<DAILYCUSTOMERSALES: {self.day} {self.cust_id} {self.revenue}>"
+
+
+
+#how far the rollups are caught up, there is only ever one row (like ShopStats)
+class SalesRollupState(db.Model):
+    state_id = db.Column(db.Integer, primary_key = True)
+    refreshed_to = db.Column(db.DateTime) #order changes up to here are in the rollups
+
+
+    def __init__(self, refreshed_to = None):
+        self.state_id = 1
+        self.refreshed_to = refreshed_to
+
+
+    def __repr__(self):
+        return f"<SALESROLLUPSTATE: {self.refreshed_to}>"
+
+
+
+#an app allowed to get tokens from /api/token (`flask clients create`). We only keep a hash of its secret
+class ApiClient(db.Model):
+    client_id = db.Column(UUIDString, primary_key = True)
+    name = db.Column(db.String(100), nullable = False)
+    secret_hash = db.Column(db.String(64), nullable = False)
+    active = db.Column(db.Boolean, nullable = False, default = True) #false once it's revoked, no new tokens
+    date_created = db.Column(db.DateTime, default = datetime.utcnow)
+
+
+    def __init__(self, name):
+        self.client_id = str(uuid.uuid4())
+        self.name = name
+        self.active = True
+
+
+    #a fresh secret, shown once to whoever created the client
+    def new_secret(self):
+
+        secret = secrets.token_urlsafe(32)
+        self.secret_hash = self.hash(secret)
+        return secret
+
+
+    def check_secret(self, secret):
+        return hmac.compare_digest(self.secret_hash, self.hash(secret))
+
+
+    #a plain sha256 is fine here (not like user passwords), the secrets are 256 random bits nobody could guess
+    @staticmethod
+    def hash(secret):
+        return hashlib.sha256(secret.encode()).hexdigest()
+
+
+    def __repr__(self):
+        return f"<APICLIENT: {self.name} {self.client_id}>"
+
+
+
+#a token that stopped working before it expired: one token (jti) or everything a client got up to revoked_at.
+#every worker keeps these in memory, see api_tokens.revocations
+class RevokedToken(db.Model):
+    revocation_id = db.Column(db.Integer, primary_key = True)
+    jti = db.Column(db.String(36), unique = True)
+    client_id = db.Column(db.String, index = True)
+    revoked_at = db.Column(db.DateTime, nullable = False, index = True)
+    expires_at = db.Column(db.DateTime, nullable = False, index = True) #after this the token is dead anyway & the row can go
+
+
+    def __init__(self, jti = None, client_id = None, expires_at = None):
+        self.jti = jti
+        self.client_id = client_id
+        self.revoked_at = datetime.utcnow()
+        self.expires_at = expires_at
+
+
+    def __repr__(self):
+        return f"<REVOKEDTOKEN: {self.jti or self.client_id}>"
+
+
+
+#remembers the answer we gave for an Idempotency-Key so a retried request (flaky wifi, double click)
+#gets the same answer back instead of changing the order a second time
+class IdempotencyKey(db.Model):
+    identity = db.Column(db.String, primary_key = True) #whose key it is (the token identity), keys are per caller
+    key = db.Column(db.String(200), primary_key = True)
+    order_id = db.Column(db.String, nullable = False)
+    request_hash = db.Column(db.String(64), nullable = False) #sha256 of the order_id & body it was first used with
+    response = db.Column(db.Text, nullable = False) #the json we sent back
+    status_code = db.Column(db.Integer, nullable = False)
+    date_created = db.Column(db.DateTime, default = datetime.utcnow, index = True)
+
+
+    def __init__(self, identity, key, order_id, request_hash, response, status_code):
+        self.identity = identity
+        self.key = key
+        self.order_id = order_id
+        self.request_hash = request_hash
+        self.response = response
+        self.status_code = status_code
+
+
+    @staticmethod
+    def hash_request(order_id, body):
+        return hashlib.sha256(order_id.encode() + b"|" + body).hexdigest()
+
+
+    #send the saved answer again, the same key can't be reused for a different order or a different body
+    def replay(self, order_id, request_hash):
+
+        if self.order_id != order_id or self.request_hash != request_hash:
+            return {
+                'status': 422,
+                'message': 'That Idempotency-Key was already used for a different request.'
+            }, 422
+
+        return current_app.response_class(self.response, status = self.status_code, mimetype = 'application/json')
+
+
+    def __repr__(self):
+        return f"<IDEMPOTENCYKEY: {self.identity} {self.key}>"
+
+
+
+#an order waiting for a checkout queue worker (ASYNC_CHECKOUT, see checkout_queue.py). The customer gets
+#order_id right away & the worker creates the real Order with that same id
+class QueuedOrder(db.Model):
+    queue_id = db.Column(db.Integer, primary_key = True) #first come first served
+    order_id = db.Column(UUIDString, nullable = False, unique = True)
+    cust_id = db.Column(db.String, nullable = False)
+    lines = db.Column(db.Text, nullable = False) #json [[prod_id, quantity], ...]
+    status = db.Column(db.String(10), nullable = False, default = 'queued') #queued -> done or failed
+    error = db.Column(db.Text) #json {message, prod_ids} when it failed
+    date_created = db.Column(db.DateTime, default = datetime.utcnow)
+    date_finished = db.Column(db.DateTime, index = True) #throughput & lag in /metrics
+    __table_args__ = (
+        db.Index('ix_queued_order_status_queue_id', 'status', 'queue_id'), #workers grab the oldest queued orders
+    )
+
+
+    def __init__(self, order_id, cust_id, lines):
+        self.order_id = order_id
+        self.cust_id = cust_id
+        self.lines = lines
+        self.status = 'queued'
+
+
+    def __repr__(self):
+        return f"<QUEUEDORDER: {self.order_id} {self.status}>"
+
+
+
+#one row that keeps our homepage numbers so we don't have to count every product/customer/order on each visit
+#the order & product routes bump these as things change, stats.rebuild_shop_stats() recounts from scratch
+class ShopStats(db.Model):
+    stats_id = db.Column(db.Integer, primary_key = True)
+    products = db.Column(db.Integer, nullable = False, default = 0)
+    customers = db.Column(db.Integer, nullable = False, default = 0)
+    sales = db.Column(db.Numeric(precision = 12, scale = 2), nullable = False, default = 0)
+    date_updated = db.Column(db.DateTime, default = datetime.utcnow, onupdate = datetime.utcnow)
+
+
+    def __init__(self, products = 0, customers = 0, sales = 0):
+        self.stats_id = 1 #there is only ever one row
+        self.products = products
+        self.customers = customers
+        self.sales = sales
+
+
+    def __repr__(self):
+        return f"<SHOPSTATS: {self.products} products, {self.customers} customers, {self.sales} sales>"
+    
+
 #Because we are building a RESTful API this week (Representational State Transfer) 
 #json rules that world. JavaScript Object Notation aka dictionaries 
 
@@ -0,0 +1,151 @@
+from datetime import datetime
+
+#internal imports
+from .models import Order, ProdOrder, OrderSummary, CustomerSummary, db
+from .helpers import to_money
+
+
+
+#the read model behind GET /api/order/<cust_id>/summary & /history: OrderSummary (one row per order) &
+#CustomerSummary (one per customer). The order write paths call these inside the same transaction as the change
+#& the database does the math (line_count = line_count + 1), same as adjust_shop_stats, so two requests at once
+#can't overwrite each other. A missing row (an order from before these tables) gets rebuilt from prod_order
+#instead, that rebuild already includes the change. `flask orders rebuild-history` redoes everything
+
+#the columns of one order on the history pages, sorted like jsonify sorts them
+HISTORY_FIELDS = ['date_created', 'date_updated', 'item_count', 'line_count', 'order_id', 'order_total']
+
+
+#a brand new order, lines is [(prod_id, quantity), ...]
+def record_order(order_id, cust_id, lines, total, new_customer, date_created = None):
+
+    items = sum(quantity for _, quantity in lines)
+    date_created = date_created or datetime.utcnow()
+    db.session.add(OrderSummary(order_id, cust_id, len(lines), items, total, date_created))
+
+    if new_customer: #their first order, nothing to add to yet
+        db.session.add(CustomerSummary(cust_id, 1, len(lines), items, total, date_created))
+    else:
+        adjust_customer(cust_id, orders = 1, lines = len(lines), items = items, total = total, last_order_at = date_created)
+
+
+#lines/items/total changed on an order that's already saved (negative numbers for removals)
+def adjust_order(order_id, cust_id, lines = 0, items = 0, total = 0):
+
+    if not (lines or items or total):
+        return
+
+    result = db.session.execute(
+        db.update(OrderSummary)
+        .where(OrderSummary.order_id == order_id)
+        .values(
+            line_count = OrderSummary.line_count + lines,
+            item_count = OrderSummary.item_count + items,
+            order_total = OrderSummary.order_total + to_money(total)
+        )
+        .execution_options(synchronize_session = False)
+    )
+
+    if result.rowcount == 0: #an order from before the read model, redo this customer from their prod_order rows
+        rebuild_history(cust_id)
+        return
+
+    adjust_customer(cust_id, lines = lines, items = items, total = total)
+
+
+def adjust_customer(cust_id, orders = 0, lines = 0, items = 0, total = 0, last_order_at = None):
+
+    values = {
+        'order_count': CustomerSummary.order_count + orders,
+        'line_count': CustomerSummary.line_count + lines,
+        'item_count': CustomerSummary.item_count + items,
+        'total_spent': CustomerSummary.total_spent + to_money(total)
+    }
+    if last_order_at is not None:
+        values['last_order_at'] = last_order_at
+
+    result = db.session.execute(
+        db.update(CustomerSummary)
+        .where(CustomerSummary.cust_id == cust_id)
+        .values(**values)
+        .execution_options(synchronize_session = False)
+    )
+
+    if result.rowcount == 0:
+        rebuild_history(cust_id)
+
+
+#set order_summary.order_total & customer_summary.total_spent back to what the lines add up to, after
+#orders.reconcile_order_totals() fixed order.order_total the same way (`flask orders reconcile-totals`).
+#two set-based UPDATEs that only touch rows that are off, returns how many summaries were fixed
+def reconcile_totals():
+
+    line_total = db.select(db.func.coalesce(db.func.sum(ProdOrder.price), 0)) \
+        .where(ProdOrder.order_id == OrderSummary.order_id) \
+        .scalar_subquery()
+
+    orders = db.session.execute(
+        db.update(OrderSummary)
+        .where(OrderSummary.order_total != line_total)
+        .values(order_total = line_total)
+        .execution_options(synchronize_session = False)
+    )
+
+    spent = db.select(db.func.coalesce(db.func.sum(OrderSummary.order_total), 0)) \
+        .where(OrderSummary.cust_id == CustomerSummary.cust_id) \
+        .scalar_subquery()
+
+    customers = db.session.execute(
+        db.update(CustomerSummary)
+        .where(CustomerSummary.total_spent != spent)
+        .values(total_spent = spent)
+        .execution_options(synchronize_session = False)
+    )
+
+    return orders.rowcount + customers.rowcount
+
+
+#throw the summaries away & add them up again from prod_order, for one customer or (cust_id=None) everyone.
+#two INSERT ... SELECT statements inside the database, no rows come back to python.
+#an order whose last line was deleted keeps its summary with everything at 0 & still counts as one of the
+#customer's orders, same as adjust_order leaves it (prod_order doesn't know it anymore, its summary does)
+def rebuild_history(cust_id = None):
+
+    now = datetime.utcnow()
+
+    def only(column): #WHERE cust_id = :cust_id, or nothing for everyone
+        return [] if cust_id is None else [column == cust_id]
+
+    has_lines = db.select(ProdOrder.order_id).where(ProdOrder.order_id == OrderSummary.order_id).exists()
+
+    db.session.execute(
+        db.update(OrderSummary)
+        .where(*only(OrderSummary.cust_id), ~has_lines)
+        .values(line_count = 0, item_count = 0, order_total = 0, date_updated = now)
+        .execution_options(synchronize_session = False)
+    )
+    db.session.execute(db.delete(OrderSummary).where(*only(OrderSummary.cust_id), has_lines).execution_options(synchronize_session = False))
+    db.session.execute(db.delete(CustomerSummary).where(*only(CustomerSummary.cust_id)).execution_options(synchronize_session = False))
+
+    orders = db.select(
+            ProdOrder.order_id, db.func.min(ProdOrder.cust_id), db.func.count(), db.func.sum(ProdOrder.quantity),
+            db.func.sum(ProdOrder.price), Order.date_created, db.literal(now, db.DateTime)
+        ) \
+        .join(Order, Order.order_id == ProdOrder.order_id) \
+        .where(*only(ProdOrder.cust_id)) \
+        .group_by(ProdOrder.order_id, Order.date_created)
+
+    db.session.execute(db.insert(OrderSummary).from_select(
+        ['order_id', 'cust_id', 'line_count', 'item_count', 'order_total', 'date_created', 'date_updated'], orders
+    ))
+
+    customers = db.select(
+            OrderSummary.cust_id, db.func.count(), db.func.sum(OrderSummary.line_count), db.func.sum(OrderSummary.item_count),
+            db.func.sum(OrderSummary.order_total), db.func.max(OrderSummary.date_created), db.literal(now, db.DateTime)
+        ) \
+        .where(*only(OrderSummary.cust_id)) \
+        .group_by(OrderSummary.cust_id)
+
+    db.session.execute(db.insert(CustomerSummary).from_select(
+        ['cust_id', 'order_count', 'line_count', 'item_count', 'total_spent', 'last_order_at', 'date_updated'], customers
+    ))
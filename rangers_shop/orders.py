@@ -0,0 +1,229 @@
+from datetime import datetime, timedelta
+
+#internal imports
+from .models import Order, ProdOrder, Product, Customer, IdempotencyKey, db
+from .stats import adjust_shop_stats
+from .helpers import to_money
+from . import inventory, order_history
+
+
+
+#the columns of one line item the way GET /api/order/<cust_id> sends it (sorted like jsonify sorts them)
+#quantity comes from the prodorder table, order_id associates this product with a specific order,
+#id makes products unique even if they are the same product
+ORDER_LINE_FIELDS = ['description', 'id', 'image', 'name', 'order_id', 'price', 'prod_id', 'quantity']
+
+
+#one SELECT joining each line item to its product, only the columns we send back, as plain tuples
+def order_lines(*where):
+    return db.select(
+            Product.description, ProdOrder.prodorder_id, Product.image, Product.name,
+            ProdOrder.order_id, Product.price, Product.prod_id, ProdOrder.quantity
+        ) \
+        .join(Product, Product.prod_id == ProdOrder.prod_id) \
+        .where(*where)
+
+
+class UnknownProducts(ValueError):
+    #one or more products on an order aren't in our shop (anymore)
+    def __init__(self, prod_ids):
+        super().__init__(f"unknown products: {', '.join(prod_ids)}")
+        self.prod_ids = prod_ids
+
+
+#the "order" list a client sends us -> [(prod_id, quantity), ...], raises ValueError when it's not one
+def clean_order_lines(customer_order):
+
+    if not isinstance(customer_order, list) or not customer_order:
+        raise ValueError("order needs to be a list of {prod_id, quantity}")
+
+    lines = []
+    for product in customer_order:
+        try:
+            prod_id, quantity = str(product['prod_id']), int(product['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("every product on an order needs a prod_id & a whole number quantity")
+        if quantity <= 0:
+            raise ValueError("quantities need to be more than 0")
+        lines.append((prod_id, quantity))
+
+    return lines
+
+
+#the body of POST /api/order/batch: {"changes": [{"prod_id": ..., "quantity": 3}, ...], "remove": [prod_id, ...]}
+#returns ({prod_id: quantity}, [prod_id, ...]), raises ValueError with what's wrong so the route can send a 400
+def clean_cart_changes(data):
+
+    if not isinstance(data, dict):
+        raise ValueError("send a json object with changes and/or remove")
+
+    changes, removals = data.get('changes', []), data.get('remove', [])
+    if not isinstance(changes, list) or not isinstance(removals, list):
+        raise ValueError("changes & remove need to be lists")
+
+    cleaned = {}
+    for change in changes:
+        if not isinstance(change, dict) or not isinstance(change.get('prod_id'), str) \
+                or not isinstance(change.get('quantity'), int) or isinstance(change['quantity'], bool):
+            raise ValueError("every change needs a prod_id & a whole number quantity")
+        cleaned[change['prod_id']] = change['quantity']
+
+    if not all(isinstance(prod_id, str) for prod_id in removals):
+        raise ValueError("remove needs to be a list of prod_ids")
+
+    return cleaned, removals
+
+
+#raises UnknownProducts unless every prod_id is in the shop, one IN (...) query
+def check_products_exist(prod_ids):
+
+    prod_ids = set(prod_ids)
+    found = set(db.session.scalars(db.select(Product.prod_id).where(Product.prod_id.in_(prod_ids))))
+    if found != prod_ids:
+        raise UnknownProducts(sorted(prod_ids - found))
+
+
+#create one order for cust_id out of [(prod_id, quantity), ...] in the current transaction, used by
+#POST /api/order/create & the checkout queue workers. Raises UnknownProducts & OutOfStock (caller rolls back).
+#the shop stats are left to the caller (the workers add them up for a whole batch), returns (order, new customer?)
+def place_order(cust_id, lines, order_id = None):
+
+    #grab every product on this order in one IN (...) query
+    #(no row locks here, the stock UPDATE below is what keeps two checkouts from overselling)
+    prod_ids = {prod_id for prod_id, _ in lines}
+    products = {product.prod_id: product for product in Product.query.filter(Product.prod_id.in_(prod_ids)).all()}
+
+    if len(products) != len(prod_ids):
+        raise UnknownProducts(sorted(prod_ids - set(products)))
+
+    new_customer = Customer.add(cust_id) #their first order?
+
+    order = Order()
+    if order_id is not None:
+        order.order_id = order_id #the checkout queue handed this id to the customer already
+    db.session.add(order)
+
+    quantities = {} #prod_id -> how many of that product are on this order
+
+    for prod_id, quantity in lines:
+        product = products[prod_id]
+
+        #price comes from our database, not from whatever the frontend sent us
+        prodorder = ProdOrder(product.prod_id, quantity, product.price, order.order_id, cust_id)
+        db.session.add(prodorder)
+        order.increment_order_total(prodorder.price)
+
+        quantities[prod_id] = quantities.get(prod_id, 0) + quantity
+
+    #decrement all of the products in one guarded UPDATE, using up any cart reservations first
+    inventory.take_stock(cust_id, quantities) #raises OutOfStock
+
+    order_history.record_order(order.order_id, cust_id, lines, order.order_total, new_customer, order.date_created)
+    Customer.touch(cust_id)
+
+    return order, new_customer
+
+
+#apply a whole cart edit to one order in the current transaction:
+#  changes = {prod_id: new quantity} (0 means remove), removals = [prod_id, ...]
+#one query for the order's lines, one for the products' prices, then one stock pass & one total update.
+#raises OutOfStock (caller rolls back), KeyError if a product isn't on this order & ValueError for a negative quantity
+def apply_cart_changes(order, changes, removals):
+
+    changes = {prod_id: int(quantity) for prod_id, quantity in changes.items()}
+    if any(quantity < 0 for quantity in changes.values()):
+        raise ValueError("quantities can't be negative, 0 or remove takes a product off the order") #same as PUT /api/order/update
+
+    for prod_id in removals:
+        changes[prod_id] = 0
+
+    if not changes:
+        return to_money(0)
+
+    lines = ProdOrder.query.filter(ProdOrder.order_id == order.order_id, ProdOrder.prod_id.in_(changes)).all()
+    lines_by_product = {}
+    for line in lines:
+        lines_by_product.setdefault(line.prod_id, []).append(line)
+
+    missing = [prod_id for prod_id in changes if prod_id not in lines_by_product]
+    if missing:
+        raise KeyError(missing)
+
+    prices = dict(db.session.execute(
+        db.select(Product.prod_id, Product.price).where(Product.prod_id.in_(changes))
+    ).all())
+
+    take = {} #stock we need to take out of the shop
+    give_back = {} #stock that goes back in the shop
+    delta = to_money(0) #how much the order total moves
+    removed = 0 #lines deleted from the order
+    items = 0 #how much the order's quantities move
+
+    for prod_id, new_quantity in changes.items():
+        first = lines_by_product[prod_id][0]
+
+        if new_quantity == 0: #remove the product (every line of it) from the order
+            for line in lines_by_product[prod_id]:
+                give_back[prod_id] = give_back.get(prod_id, 0) + line.quantity
+                delta -= line.price
+                removed += 1
+                items -= line.quantity
+                db.session.delete(line)
+            continue
+
+        #same as PUT /api/order/update, the change goes on the first line for that product
+        old_price = first.price
+        diff = new_quantity - first.quantity
+
+        if diff > 0:
+            take[prod_id] = diff
+        elif diff < 0:
+            give_back[prod_id] = -diff
+
+        first.set_price(prices[prod_id], new_quantity)
+        first.update_quantity(new_quantity)
+        delta += first.price - old_price
+        items += diff
+
+    Product.increment_stock(give_back)
+    Product.decrement_stock(take) #raises OutOfStock
+
+    Order.adjust_total(order.order_id, delta)
+    adjust_shop_stats(sales = delta)
+    if lines:
+        order_history.adjust_order(order.order_id, lines[0].cust_id, lines = -removed, items = items, total = delta)
+        Customer.touch(lines[0].cust_id)
+
+    return delta
+
+
+
+#recompute every Order.order_total from its ProdOrder rows in ONE statement inside the database:
+#  UPDATE order SET order_total = COALESCE((SELECT SUM(price) FROM prod_order WHERE ...), 0) WHERE it's different
+#no rows come back to python, so this is fine for millions of orders. Returns how many totals were fixed
+def reconcile_order_totals():
+
+    line_total = db.select(db.func.coalesce(db.func.sum(ProdOrder.price), 0)) \
+        .where(ProdOrder.order_id == Order.order_id) \
+        .scalar_subquery()
+
+    result = db.session.execute(
+        db.update(Order)
+        .where(Order.order_total != line_total)
+        .values(order_total = line_total)
+        .execution_options(synchronize_session = False)
+    )
+
+    return result.rowcount
+
+
+#saved Idempotency-Key answers only need to live as long as a client might retry
+def purge_idempotency_keys(hours):
+
+    result = db.session.execute(
+        db.delete(IdempotencyKey)
+        .where(IdempotencyKey.date_created < datetime.utcnow() - timedelta(hours = hours))
+        .execution_options(synchronize_session = False)
+    )
+
+    return result.rowcount
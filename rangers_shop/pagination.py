@@ -0,0 +1,56 @@
+import base64
+import json
+import math
+from datetime import datetime
+
+
+
+#keyset (cursor) pagination: instead of OFFSET we remember the last row we sent (ex: its date_added & id)
+#and ask for rows that come after it, so page 1000 is just as cheap as page 1
+class BadCursor(ValueError):
+    pass
+
+
+#turn the sort values of the last row into an opaque string the frontend hands back to us
+def encode_cursor(*values):
+
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+#the values back as the given types (datetime, float, str...), BadCursor if they aren't. It's user input, ["x", [1]]
+#shouldn't make it to the query. Only a datetime can be None (rows that don't have one)
+def decode_cursor(cursor, *types):
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return [as_type(value, kind) for value, kind in zip(values, types, strict = True)]
+    except (ValueError, TypeError) as error:
+        raise BadCursor("That cursor is not valid. Use the one from the X-Next-Cursor header.") from error
+
+
+def as_type(value, kind):
+
+    if kind is datetime:
+        return None if value is None else datetime.fromisoformat(value)
+
+    if isinstance(value, (bool, list, dict)) or value is None:
+        raise TypeError(f"{value!r} is not a {kind.__name__}")
+
+    value = kind(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"{value!r} is not a number")
+
+    return value
+
+
+#read ?limit= from the request, falling back to our default & never going over the max
+def get_limit(args, default, maximum):
+
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        raise BadCursor("limit needs to be a number")
+
+    return max(1, min(limit, maximum))
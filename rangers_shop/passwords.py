@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+
+#how we hash passwords comes from PASSWORD_HASH_METHOD (ex: pbkdf2:sha256:600000 or scrypt:32768:8:1).
+#write out every number, that exact string is saved at the front of each hash & it's how we know
+#a stored hash was made with an older policy & should be redone (see User.check_password)
+
+class PasswordCheckBusy(Exception):
+    #every verification slot is taken & the wait ran out, better to say "try again" than pile up more work
+    pass
+
+
+
+def hash_password(password):
+    return generate_password_hash(
+        password,
+        method = current_app.config['PASSWORD_HASH_METHOD'],
+        salt_length = current_app.config['PASSWORD_SALT_LENGTH']
+    )
+
+
+def needs_rehash(stored):
+    return stored.split('$', 1)[0] != current_app.config['PASSWORD_HASH_METHOD']
+
+
+
+#checking a password is on purpose slow (it's what makes stolen hashes useless). hashlib lets go of the GIL
+#while it works, so a small pool of threads does the hashing & everything else in the worker keeps running.
+#at most PASSWORD_VERIFY_WORKERS checks run at once & PASSWORD_VERIFY_QUEUE more can wait for a turn
+_executor = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(app):
+    global _executor, _slots
+
+    with _pool_lock:
+        if _executor is None:
+            workers = app.config['PASSWORD_VERIFY_WORKERS']
+            _executor = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'password-check')
+            _slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_VERIFY_QUEUE'])
+
+    return _executor, _slots
+
+
+def verify_password(stored, password):
+
+    app = current_app._get_current_object()
+    executor, slots = get_pool(app)
+
+    if not slots.acquire(timeout = app.config['PASSWORD_VERIFY_WAIT']):
+        raise PasswordCheckBusy()
+
+    try:
+        future = executor.submit(check_password_hash, stored, password)
+    except Exception:
+        slots.release()
+        raise
+
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
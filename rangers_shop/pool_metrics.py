@@ -0,0 +1,133 @@
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+#internal imports
+from .models import db
+
+
+
+#counters for one connection pool. Lives on the pool so it survives engine.dispose() (which builds a new pool)
+class PoolStats():
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0 #brand new connections to the database
+        self.invalidated = 0 #connections thrown away (failed pre-ping, server went away...)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0 #gave up after pool_timeout, the request got an error
+
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidated': self.invalidated,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'wait_seconds_avg': round(self.wait_seconds / self.waits, 6) if self.waits else 0.0,
+                'wait_seconds_max': round(self.max_wait, 6)
+            }
+
+
+
+#the regular QueuePool, it just times how long every checkout waits for a connection
+#(that includes opening a new one when the pool isn't full yet)
+class TimedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+
+    def _do_get(self):
+
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            self.stats.add(timeouts = 1)
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats #keep counting where we left off
+        return pool
+
+
+
+#call BEFORE db.init_app(app) so our engines get built with the timed pool
+#(flask-sqlalchemy swaps in its own pool for in-memory sqlite, that one just won't report waits)
+def use_timed_pool(app):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': TimedQueuePool, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    #the replicas (SQLALCHEMY_BINDS) are configured one by one
+    app.config['SQLALCHEMY_BINDS'] = {
+        key: {'poolclass': TimedQueuePool, **({'url': value} if isinstance(value, str) else value)}
+        for key, value in app.config.get('SQLALCHEMY_BINDS', {}).items()
+    }
+
+
+#call AFTER db.init_app(app), starts counting connections for every engine (the default one & any binds)
+def init_app(app):
+
+    with app.app_context():
+        engines = dict(db.engines)
+
+    pools = {}
+
+    for name, engine in engines.items():
+        stats = getattr(engine.pool, 'stats', None) or PoolStats()
+        pools[name] = (engine, stats)
+
+        event.listen(engine, 'checkout', lambda *args, stats = stats: stats.add(checkouts = 1))
+        event.listen(engine, 'connect', lambda *args, stats = stats: stats.add(connects = 1))
+        event.listen(engine, 'invalidate', lambda *args, stats = stats: stats.add(invalidated = 1))
+
+    app.extensions['pool_metrics'] = pools
+
+
+#what every pool looks like right now, keyed by bind name (None is the default database)
+def pool_status(app):
+
+    status = {}
+
+    for name, (engine, stats) in app.extensions['pool_metrics'].items():
+        pool = engine.pool
+        stats = stats.snapshot()
+
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0), #sqlalchemy counts down from -pool_size until the pool is full
+                'max_overflow': pool._max_overflow
+            })
+
+        stats['pool'] = type(pool).__name__
+        status[name or 'default'] = stats
+
+    return status
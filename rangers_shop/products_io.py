@@ -0,0 +1,140 @@
+import csv
+import json
+import time
+import uuid
+from decimal import InvalidOperation
+
+#internal imports
+from .helpers import PLACEHOLDER_IMAGE, to_money
+from .models import Product, db
+from .search import index_products
+
+
+
+#the columns we read & write, in this order
+EXPORT_FIELDS = ['prod_id', 'name', 'description', 'price', 'quantity', 'image']
+
+
+#read products one at a time from a csv or jsonl file (never the whole file at once)
+def read_products(file, format):
+
+    if format == 'csv':
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+#turn one row from the file into the columns we save, raises ValueError if something is off
+def clean_product(row):
+
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+
+    try:
+        price = to_money(row['price'])
+        quantity = int(row['quantity'])
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise ValueError("price & quantity need to be numbers")
+
+    product = {
+        'name': name[:100],
+        'description': (row.get('description') or '')[:200],
+        'price': price,
+        'quantity': quantity
+    }
+    if row.get('image'): #no image keeps the one we have, new products get the placeholder in save_batch
+        product['image'] = row['image']
+
+    return product
+
+
+#save one batch: products we already have (same name) get updated, the rest get inserted
+#two statements per batch no matter how big it is, instead of one INSERT + commit per product
+def save_batch(batch):
+
+    batch = {product['name']: product for product in batch} #same name twice in one batch, the last one wins
+
+    existing = db.session.execute(
+        db.select(Product.name, Product.prod_id).where(Product.name.in_(list(batch)))
+    ).all()
+    existing = {name: prod_id for name, prod_id in existing}
+
+    updates = [{**product, 'prod_id': existing[name]} for name, product in batch.items() if name in existing]
+    #no image yet, looked up later (flask products resolve-images)
+    inserts = [{'image': PLACEHOLDER_IMAGE, **product, 'prod_id': str(uuid.uuid4())} for name, product in batch.items() if name not in existing]
+
+    if updates:
+        db.session.execute(db.update(Product), updates) #bulk UPDATE by primary key, rows without an image skip that column
+    if inserts:
+        db.session.execute(db.insert(Product), inserts) #one multi-row INSERT
+
+    index_products((product['prod_id'], product['name'], product['description']) for product in updates + inserts)
+    db.session.commit()
+
+    return len(inserts), len(updates)
+
+
+#stream a catalog file into the database in batches. progress gets called after every batch
+def import_products(file, format, batch_size = 1000, progress = None):
+
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    batch = []
+    start = time.perf_counter()
+
+    def flush():
+        inserted, updated = save_batch(batch)
+        totals['inserted'] += inserted
+        totals['updated'] += updated
+        batch.clear()
+        if progress:
+            progress(totals, time.perf_counter() - start)
+
+    for line, row in enumerate(read_products(file, format), start = 1):
+        try:
+            batch.append(clean_product(row))
+        except ValueError as error:
+            totals['skipped'] += 1
+            if len(totals['errors']) < 20: #don't keep a million error messages around
+                totals['errors'].append(f"row {line}: {error}")
+            continue
+
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    totals['seconds'] = time.perf_counter() - start
+    return totals
+
+
+#stream every product out to a csv or jsonl file, a few thousand rows in memory at a time
+def export_products(file, format, progress = None, progress_every = 10000):
+
+    rows = db.session.execute(
+        db.select(*[getattr(Product, field) for field in EXPORT_FIELDS])
+        .order_by(Product.date_added, Product.prod_id)
+        .execution_options(yield_per = 2000)
+    )
+
+    writer = csv.writer(file) if format == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    count = 0
+    start = time.perf_counter()
+
+    for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            file.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), default = str) + "\n")
+
+        count += 1
+        if progress and count % progress_every == 0:
+            progress(count, time.perf_counter() - start)
+
+    return count, time.perf_counter() - start
@@ -0,0 +1,55 @@
+import threading
+import time
+
+#internal imports
+from .cache import LRUCache
+
+
+
+#a token bucket per key (an ip, a client id...): everyone starts with `limit` tries & gets them back at
+#limit/window per second, so bursts are fine but a steady flood isn't. The buckets live in an LRUCache so a
+#million different ips can't eat our memory. Every gunicorn worker keeps its own buckets
+class RateLimiter():
+
+    def __init__(self, limit, window, maxsize = 10000):
+        self.limit = limit
+        self.rate = limit / window #tries we get back per second
+        self._buckets = LRUCache(maxsize = maxsize, ttl = window) #an idle bucket is full again after window anyway
+        self._lock = threading.Lock()
+        self.limited = 0
+
+
+    #take one try for every key, returns 0 when that's fine or how many seconds until it would be
+    def hit(self, *keys):
+
+        keys = [key for key in keys if key]
+        now = time.monotonic()
+
+        with self._lock:
+            buckets = [self._refill(key, now) for key in keys]
+
+            empty = [tokens for tokens in buckets if tokens < 1]
+            if empty:
+                self.limited += 1
+                return (1 - min(empty)) / self.rate
+
+            for key, tokens in zip(keys, buckets):
+                self._buckets.set(key, (tokens - 1, now))
+
+        return 0
+
+
+    def _refill(self, key, now):
+
+        tokens, last = self._buckets.get(key, (self.limit, now))
+        tokens = min(self.limit, tokens + (now - last) * self.rate)
+        self._buckets.set(key, (tokens, now))
+
+        return tokens
+
+
+    def stats(self):
+        return {
+            'keys': len(self._buckets),
+            'limited': self.limited
+        }
@@ -0,0 +1,211 @@
+from datetime import date, datetime, time, timedelta
+
+#internal imports
+from .models import Order, ProdOrder, Product, OrderSummary, DailySales, DailyProductSales, DailyCustomerSales, SalesRollupState, db
+
+
+
+#the numbers behind GET /api/reports/...: sales rolled up per day (UTC) into daily_sales, daily_product_sales &
+#daily_customer_sales, so a report adds up a few hundred rollup rows instead of millions of prod_order rows.
+#keeping them up to date: every order write bumps order_summary.date_updated (order_history.py), so
+#refresh_rollups() asks which days had orders change since last time & recounts just those days with
+#INSERT ... SELECT inside the database. `flask reports refresh --every 60` keeps doing that,
+#`flask reports rebuild` recounts every day
+
+#re-read this much before our last refresh, a transaction that was still open back then has committed by now
+OVERLAP = timedelta(minutes = 5)
+
+
+#sqlite hands date() back as a string, postgres as a date
+def as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def get_state():
+
+    state = db.session.get(SalesRollupState, 1)
+    if state is None:
+        state = SalesRollupState()
+        db.session.add(state)
+
+    return state
+
+
+#throw away one day of rollups & add it up again from prod_order, 3 DELETEs & 3 INSERT ... SELECTs
+def refresh_day(day):
+
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days = 1)
+
+    for model in (DailySales, DailyProductSales, DailyCustomerSales):
+        db.session.execute(db.delete(model).where(model.day == day).execution_options(synchronize_session = False))
+
+    def lines(*columns): #that day's order lines, found through ix_order_date_created
+        return db.select(db.literal(day, db.Date), *columns) \
+            .join(Order, Order.order_id == ProdOrder.order_id) \
+            .where(Order.date_created >= start, Order.date_created < end)
+
+    db.session.execute(db.insert(DailyProductSales).from_select(
+        ['day', 'prod_id', 'order_count', 'units', 'revenue'],
+        lines(ProdOrder.prod_id, db.func.count(db.distinct(ProdOrder.order_id)), db.func.sum(ProdOrder.quantity), db.func.sum(ProdOrder.price))
+        .group_by(ProdOrder.prod_id)
+    ))
+
+    db.session.execute(db.insert(DailyCustomerSales).from_select(
+        ['day', 'cust_id', 'order_count', 'units', 'revenue'],
+        lines(ProdOrder.cust_id, db.func.count(db.distinct(ProdOrder.order_id)), db.func.sum(ProdOrder.quantity), db.func.sum(ProdOrder.price))
+        .group_by(ProdOrder.cust_id)
+    ))
+
+    #the day's totals out of the customer rows we just wrote (an order only ever has one customer)
+    db.session.execute(db.insert(DailySales).from_select(
+        ['day', 'order_count', 'customer_count', 'units', 'revenue'],
+        db.select(
+            DailyCustomerSales.day, db.func.sum(DailyCustomerSales.order_count), db.func.count(),
+            db.func.sum(DailyCustomerSales.units), db.func.sum(DailyCustomerSales.revenue)
+        )
+        .where(DailyCustomerSales.day == day)
+        .group_by(DailyCustomerSales.day)
+    ))
+
+
+#recount the days that had orders change since the last refresh, returns how many days that was
+def refresh_rollups():
+
+    started = datetime.utcnow()
+    state = get_state()
+
+    if state.refreshed_to is None: #never built, do everything
+        return rebuild_rollups()
+
+    days = sorted({as_date(day) for day in db.session.scalars(
+        db.select(db.func.date(OrderSummary.date_created))
+        .where(OrderSummary.date_updated >= state.refreshed_to - OVERLAP, OrderSummary.date_created.is_not(None))
+        .distinct()
+    )})
+
+    for day in days:
+        refresh_day(day)
+
+    state.refreshed_to = started
+    db.session.commit()
+
+    return len(days)
+
+
+#recount every day that has orders, committing every batch_days days
+def rebuild_rollups(batch_days = 31, progress = None):
+
+    started = datetime.utcnow()
+
+    for model in (DailySales, DailyProductSales, DailyCustomerSales):
+        db.session.execute(db.delete(model))
+
+    days = sorted(as_date(day) for day in db.session.scalars(
+        db.select(db.func.date(Order.date_created)).where(Order.date_created.is_not(None)).distinct()
+    ))
+
+    for number, day in enumerate(days, start = 1):
+        refresh_day(day)
+        if number % batch_days == 0:
+            db.session.commit()
+            if progress:
+                progress(number, len(days))
+
+    get_state().refreshed_to = started
+    db.session.commit()
+
+    return len(days)
+
+
+#when the rollups were last brought up to date, None if they never were
+def refreshed_to():
+    return db.session.scalar(db.select(SalesRollupState.refreshed_to).where(SalesRollupState.state_id == 1))
+
+
+
+#the reports, start & end are dates & both days are included
+
+REVENUE_FIELDS = {
+    'day': ['day', 'order_count', 'customer_count', 'units', 'revenue'],
+    'product': ['prod_id', 'name', 'order_count', 'units', 'revenue', 'quantity'], #quantity = stock left
+    'customer': ['cust_id', 'order_count', 'units', 'revenue'],
+}
+
+
+LOW_STOCK_FIELDS = ['prod_id', 'name', 'quantity', 'sold', 'days_left']
+
+
+def revenue_by_day(start, end):
+
+    return db.session.execute(
+        db.select(DailySales.day, DailySales.order_count, DailySales.customer_count, DailySales.units, DailySales.revenue)
+        .where(DailySales.day.between(start, end))
+        .order_by(DailySales.day)
+    ).all()
+
+
+#the best selling products by revenue or units (top sellers), the ranking happens on the rollup before we look up names
+def revenue_by_product(start, end, limit, sort = 'revenue'):
+
+    totals = db.select(
+            DailyProductSales.prod_id,
+            db.func.sum(DailyProductSales.order_count).label('order_count'),
+            db.func.sum(DailyProductSales.units).label('units'),
+            db.func.sum(DailyProductSales.revenue).label('revenue')
+        ) \
+        .where(DailyProductSales.day.between(start, end)) \
+        .group_by(DailyProductSales.prod_id)
+    totals = totals.order_by(db.desc(sort), DailyProductSales.prod_id).limit(limit).subquery()
+
+    return db.session.execute(
+        db.select(totals.c.prod_id, Product.name, totals.c.order_count, totals.c.units, totals.c.revenue, Product.quantity)
+        .outerjoin(Product, Product.prod_id == totals.c.prod_id) #a deleted product still shows up, just without a name
+        .order_by(totals.c[sort].desc(), totals.c.prod_id)
+    ).all()
+
+
+def revenue_by_customer(start, end, limit):
+
+    return db.session.execute(
+        db.select(
+            DailyCustomerSales.cust_id,
+            db.func.sum(DailyCustomerSales.order_count).label('order_count'),
+            db.func.sum(DailyCustomerSales.units).label('units'),
+            db.func.sum(DailyCustomerSales.revenue).label('revenue')
+        )
+        .where(DailyCustomerSales.day.between(start, end))
+        .group_by(DailyCustomerSales.cust_id)
+        .order_by(db.desc('revenue'), DailyCustomerSales.cust_id)
+        .limit(limit)
+    ).all()
+
+
+#products with threshold or fewer left, plus the ones that will sell out within cover_days at the pace
+#they sold over the last `days` days. Returns (prod_id, name, quantity, sold, days_left) lowest stock first
+def low_stock(threshold, days, cover_days, limit, today = None):
+
+    since = (today or datetime.utcnow().date()) - timedelta(days = days - 1)
+
+    #added up once (a cte), then every product looks its number up
+    sold = db.select(DailyProductSales.prod_id, db.func.sum(DailyProductSales.units).label('units')) \
+        .where(DailyProductSales.day >= since) \
+        .group_by(DailyProductSales.prod_id) \
+        .cte('sold')
+    units = db.func.coalesce(sold.c.units, 0)
+
+    rows = db.session.execute(
+        db.select(Product.prod_id, Product.name, Product.quantity, units)
+        .outerjoin(sold, sold.c.prod_id == Product.prod_id)
+        .where(db.or_(
+            Product.quantity <= threshold,
+            Product.quantity * days < units * cover_days #quantity / (units per day) < cover_days
+        ))
+        .order_by(Product.quantity, Product.prod_id)
+        .limit(limit)
+    ).all()
+
+    return [
+        (prod_id, name, quantity, units, round(quantity * days / units, 1) if units else None)
+        for prod_id, name, quantity, units in rows
+    ]
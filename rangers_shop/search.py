@@ -0,0 +1,225 @@
+import math
+import re
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import aliased
+
+#internal imports
+from .models import Product, SearchTerm, ShopStats, db, product_document
+
+
+
+#GET /api/search. Two ways to find products depending on the database we're on:
+#  postgres: full text search over product_document (gin index, ranked with ts_rank_cd) plus pg_trgm similarity
+#            on the name so "iphnoe" still finds "iPhone". Nothing to keep up to date, postgres does it
+#  anything else: our own inverted index in search_term, every word must match, rarer words count more (idf).
+#            the session events below keep it up to date for products changed through the ORM, bulk statements
+#            (products_io) call index_products themselves & flask products reindex rebuilds it
+#both hand back rows of (*columns, rank, prod_id) sorted by rank, best first, so pages can use a keyset cursor
+
+WORD = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with'])
+NAME_WEIGHT = 3 #a word in the name is worth this many in the description
+MAX_WORDS = 8 #more words than this in one search are ignored
+COMMON_SHARE = 0.05
+
+
+def tokenize(text):
+    return [stem(word)[:40] for word in WORD.findall((text or '').lower()) if word not in STOP_WORDS]
+
+
+#just enough stemming that "shoes" finds "shoe" (postgres' english config does the real thing)
+def stem(word):
+
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+#word -> weight for one product
+def product_terms(name, description):
+
+    terms = {}
+    for word in tokenize(name):
+        terms[word] = terms.get(word, 0) + NAME_WEIGHT
+    for word in tokenize(description):
+        terms[word] = terms.get(word, 0) + 1
+
+    return terms
+
+
+def using_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+
+#(prod_id, name, description) for every product that was created or changed, call before the commit
+def index_products(products):
+
+    if using_postgres():
+        return
+
+    products = list(products)
+    if not products:
+        return
+
+    unindex_products([prod_id for prod_id, _, _ in products])
+
+    rows = [
+        {'term': term, 'prod_id': prod_id, 'weight': weight}
+        for prod_id, name, description in products
+        for term, weight in product_terms(name, description).items()
+    ]
+    if rows:
+        db.session.execute(db.insert(SearchTerm), rows)
+
+
+#call before deleting products (search_term points at them)
+def unindex_products(prod_ids):
+
+    if using_postgres() or not prod_ids:
+        return
+
+    db.session.execute(db.delete(SearchTerm).where(SearchTerm.prod_id.in_(prod_ids)).execution_options(synchronize_session = False))
+
+
+#products added, renamed or deleted through the ORM (the site routes, the seed, a flask shell) get their words
+#written in the same flush, the same way catalog_cache watches the session. Stock & image changes don't touch the index
+@event.listens_for(db.session, 'before_flush')
+def _unindex_deleted_products(session, flush_context, instances):
+    unindex_products([obj.prod_id for obj in session.deleted if isinstance(obj, Product)]) #before the product's DELETE
+
+
+@event.listens_for(db.session, 'after_flush')
+def _index_changed_products(session, flush_context):
+
+    def words_changed(product):
+        attrs = inspect(product).attrs
+        return attrs.name.history.has_changes() or attrs.description.history.has_changes()
+
+    index_products(
+        (product.prod_id, product.name, product.description)
+        for product in (*session.new, *session.dirty)
+        if isinstance(product, Product) and (product in session.new or words_changed(product))
+    )
+
+
+#throw away search_term & fill it again from the product table, batch_size products at a time
+def reindex_products(batch_size = 5000, progress = None):
+
+    if using_postgres():
+        return 0
+
+    db.session.execute(db.delete(SearchTerm))
+
+    count = 0
+    last_id = None
+    while True:
+        query = db.select(Product.prod_id, Product.name, Product.description).order_by(Product.prod_id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Product.prod_id > last_id)
+
+        batch = db.session.execute(query).all()
+        if not batch:
+            break
+
+        index_products(batch)
+        db.session.commit()
+
+        count += len(batch)
+        last_id = batch[-1].prod_id
+        if progress:
+            progress(count)
+
+    return count
+
+
+
+#one page of results for the words in text. after is the (rank, prod_id) of the last row on the previous page
+def search_products(text, columns, limit, after = None):
+
+    if using_postgres():
+        return postgres_search(text, columns, limit, after)
+    return inverted_index_search(text, columns, limit, after)
+
+
+#rounded so the rank we put in a cursor compares equal to the one the database works out next time
+def rounded(rank):
+    return db.cast(db.func.round(db.cast(rank, db.Numeric), 6), db.Float)
+
+
+#rows "after" the last one we sent when rank goes high -> low, same as (-rank, prod_id) > (-:rank, :prod_id)
+def after_cursor(query, rank, prod_id, after):
+
+    if after is None:
+        return query
+    return query.where(db.or_(rank < after[0], db.and_(rank == after[0], prod_id > after[1])))
+
+
+def postgres_search(text, columns, limit, after):
+
+    if not tokenize(text):
+        return []
+
+    document = product_document(Product.name, Product.description)
+    words = db.func.websearch_to_tsquery(db.literal_column("'english'"), text)
+    rank = rounded(db.func.ts_rank_cd(document, words) + db.func.similarity(Product.name, text))
+
+    query = db.select(*columns, rank.label('rank'), Product.prod_id).where(db.or_(
+        document.op('@@')(words),
+        Product.name.op('%')(text) #similar enough names (pg_trgm.similarity_threshold, 0.3 by default), typos included
+    ))
+    query = after_cursor(query, rank, Product.prod_id, after)
+
+    return db.session.execute(query.order_by(rank.desc(), Product.prod_id).limit(limit)).all()
+
+
+def inverted_index_search(text, columns, limit, after):
+
+    words = list(dict.fromkeys(tokenize(text)))[:MAX_WORDS]
+    if not words:
+        return []
+
+    total = db.session.scalar(db.select(ShopStats.products).where(ShopStats.stats_id == 1)) or 0
+
+    #how many products have each word, a word nobody has means nothing matches all of them.
+    #we stop counting at COMMON_SHARE of the catalog, past that a word is about as useful as "the" anyway
+    cap = max(1000, int(total * COMMON_SHARE))
+    counts = {}
+    for word in words:
+        counts[word] = db.session.scalar(
+            db.select(db.func.count()).select_from(db.select(SearchTerm.prod_id).where(SearchTerm.term == word).limit(cap).subquery())
+        )
+        if not counts[word]:
+            return []
+
+    total = max(total, *counts.values())
+    idf = {word: math.log(1 + total / counts[word]) for word in words} #rarer words count more
+
+    if len(words) == 1:
+        #one word: rank is weight * idf, so ix_search_term_term_weight hands us the page already sorted (no big sort)
+        word = words[0]
+        matches = db.select(SearchTerm.prod_id, rounded(SearchTerm.weight * idf[word]).label('rank')).where(SearchTerm.term == word)
+        if after is not None:
+            matches = after_cursor(matches, SearchTerm.weight, SearchTerm.prod_id, (round(after[0] / idf[word]), after[1]))
+        matches = matches.order_by(SearchTerm.weight.desc(), SearchTerm.prod_id).limit(limit).subquery()
+
+    else:
+        #start from the rarest word (fewest rows to look at) & look the rest up by (term, prod_id), our primary key
+        words.sort(key = counts.get)
+        terms = [aliased(SearchTerm) for _ in words]
+
+        rank = rounded(sum(term.weight * idf[word] for term, word in zip(terms, words)))
+        matches = db.select(terms[0].prod_id, rank.label('rank')).where(terms[0].term == words[0])
+        for term, word in zip(terms[1:], words[1:]):
+            matches = matches.join(term, db.and_(term.prod_id == terms[0].prod_id, term.term == word))
+
+        matches = after_cursor(matches, rank, terms[0].prod_id, after).order_by(rank.desc(), terms[0].prod_id).limit(limit).subquery()
+
+    #the page gets ranked & cut out of search_term alone, only then do we fetch its products
+    return db.session.execute(
+        db.select(*columns, matches.c.rank, matches.c.prod_id)
+        .join(matches, matches.c.prod_id == Product.prod_id)
+        .order_by(matches.c.rank.desc(), matches.c.prod_id)
+    ).all()
@@ -0,0 +1,65 @@
+import decimal
+import json
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+#internal imports
+from .models import ProductSchema
+
+
+
+#the fields we send for a product, sorted so our json keys come out in the same order jsonify used to give us
+PRODUCT_FIELDS = sorted(ProductSchema.Meta.fields)
+
+
+#turns Decimal prices into exact strings ("19.99", never 19.990000000000002) & dates into iso strings
+def encode_default(obj):
+
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+#one encoder for the whole app instead of building one for every response
+_encoder = json.JSONEncoder(default = encode_default, separators = (',', ':'))
+
+
+#registered on the app with app.json = ShopJSONProvider(app), so jsonify() uses it too
+class ShopJSONProvider(DefaultJSONProvider):
+
+    @staticmethod
+    def default(obj):
+        return encode_default(obj)
+
+
+#plain tuples straight from the database (no Product objects, no marshmallow) -> json objects
+#fields are the names of the tuple's columns in order
+def dump_rows(rows, fields):
+    return "[" + ",".join(dump_row(row, fields) for row in rows) + "]"
+
+
+def dump_row(row, fields):
+    return _encoder.encode(dict(zip(fields, row)))
+
+
+#same thing but handed out a chunk at a time, so a huge result never has to sit in memory as one string
+def stream_rows(rows, fields, chunk_size = 500):
+
+    yield "["
+    chunk = []
+    first = True
+
+    for row in rows:
+        chunk.append(dump_row(row, fields))
+
+        if len(chunk) >= chunk_size:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+            chunk = []
+
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+
+    yield "]"
@@ -0,0 +1,61 @@
+#internal imports
+from .models import Product, Customer, Order, ShopStats, db, use_primary
+from .helpers import to_money
+
+
+
+#the numbers on our homepage, read from the one ShopStats row instead of loading every row in the database
+def get_shop_stats():
+
+    stats = db.session.get(ShopStats, 1)
+    if stats is None:
+        use_primary() #a replica might just not have the row yet, either way we count on the primary
+        stats = rebuild_shop_stats()
+        db.session.commit()
+
+    return {
+        'products': stats.products,
+        'sales': stats.sales,
+        'customers': stats.customers
+    }
+
+
+#bump the counters in the database itself (sales = sales + x) so two orders at once can't overwrite each other
+#call this inside the same transaction as the change it is counting
+def adjust_shop_stats(products = 0, customers = 0, sales = 0):
+
+    if not (products or customers or sales):
+        return
+
+    result = db.session.execute(
+        db.update(ShopStats)
+        .where(ShopStats.stats_id == 1)
+        .values(
+            products = ShopStats.products + products,
+            customers = ShopStats.customers + customers,
+            sales = ShopStats.sales + to_money(sales)
+        )
+        .execution_options(synchronize_session = False)
+    )
+
+    if result.rowcount == 0: #no stats row yet, count everything (this includes the change we were adjusting for)
+        rebuild_shop_stats()
+
+
+#recount everything with COUNT/SUM in the database, used the first time & whenever the numbers look off
+def rebuild_shop_stats():
+
+    products = db.session.scalar(db.select(db.func.count()).select_from(Product))
+    customers = db.session.scalar(db.select(db.func.count()).select_from(Customer))
+    sales = db.session.scalar(db.select(db.func.coalesce(db.func.sum(Order.order_total), 0)))
+
+    stats = db.session.get(ShopStats, 1)
+    if stats is None:
+        stats = ShopStats()
+        db.session.add(stats)
+
+    stats.products = products
+    stats.customers = customers
+    stats.sales = sales
+
+    return stats
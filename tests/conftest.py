@@ -0,0 +1,86 @@
+#shared fixtures: the app on a throwaway sqlite file, an empty database for every test & a few helpers
+#run from the project folder:  python -m pytest
+import os
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + tempfile.mktemp(suffix = '.db') #never touch the real database
+os.environ['JWT_SECRET_KEY'] = 'test'
+os.environ['IMAGE_CACHE_PATH'] = ''
+os.environ['IMAGE_FETCHER'] = 'rangers_shop.helpers:stub_image' #no network
+os.environ['IMAGE_WORKERS'] = '0'
+os.environ['APP_CONFIG'] = 'development'
+os.environ.pop('CATALOG_CACHE_SHARED', None)
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from rangers_shop import app as shop_app
+from rangers_shop.models import Product, db, get_user_cache
+from rangers_shop.catalog_cache import catalog_cache
+from rangers_shop.api_tokens import revocations
+
+
+
+@pytest.fixture
+def app():
+
+    shop_app.config['TESTING'] = True
+
+    with shop_app.app_context():
+        db.drop_all()
+        db.create_all()
+        catalog_cache.local.clear()
+        get_user_cache().clear()
+        revocations.clear()
+
+        yield shop_app
+
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(app):
+    return {'Authorization': f"Bearer {create_access_token(identity = 'test')}"}
+
+
+#make_products(3) -> [prod_id, ...], all priced 10.00 with plenty of stock unless told otherwise
+@pytest.fixture
+def make_products(app):
+
+    def make(count, price = Decimal('10.00'), quantity = 1000):
+        products = [Product(f"Product {number}", price, quantity) for number in range(count)]
+        db.session.add_all(products)
+        db.session.commit()
+        return [product.prod_id for product in products]
+
+    return make
+
+
+#with count_queries() as queries: ... then queries['n'] is how many SQL statements ran inside the block
+@pytest.fixture
+def count_queries(app):
+
+    @contextmanager
+    def counting():
+        queries = {'n': 0}
+
+        def count(*args):
+            queries['n'] += 1
+
+        #the revocation list re-reads its table every REVOCATION_REFRESH_SECONDS, do it now & not inside the block
+        revocations.refresh(force = True)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            yield queries
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+    return counting
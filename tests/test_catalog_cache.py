@@ -0,0 +1,97 @@
+#the catalog cache: a product change makes every cached page stale, across workers when CATALOG_CACHE_SHARED is set
+import sys
+import threading
+
+import pytest
+
+from rangers_shop import checkout_queue
+from rangers_shop.catalog_cache import CatalogCache, catalog_cache
+from rangers_shop.models import db
+
+
+
+@pytest.fixture
+def shared_path(tmp_path):
+    return str(tmp_path / 'catalog_cache.sqlite')
+
+
+def shared_cache(app, path):
+
+    cache = CatalogCache()
+    app.config['CATALOG_CACHE_SHARED'] = path
+    try:
+        cache.init_app(app)
+    finally:
+        app.config['CATALOG_CACHE_SHARED'] = None
+        app.extensions['catalog_cache'] = catalog_cache
+
+    return cache
+
+
+def test_invalidate_only_bumps_the_generation(app, shared_path):
+
+    cache = shared_cache(app, shared_path)
+    generation = cache.generation()
+    cache.set('/api/shop', 'page', generation, size = 4)
+
+    cache.invalidate()
+
+    assert cache.generation() == generation + 1
+    assert cache.get('/api/shop', cache.generation()) is None
+    assert cache.shared.count() == 2 #the old page is still there (its ttl cleans it up), next to the generation
+
+
+def test_a_bump_in_one_worker_reaches_the_others(app, shared_path):
+
+    web, worker = shared_cache(app, shared_path), shared_cache(app, shared_path)
+    generation = web.generation()
+    web.set('/api/shop', 'page', generation, size = 4)
+    assert web.get('/api/shop', web.generation()) == 'page'
+
+    worker.invalidate()
+
+    assert web.get('/api/shop', web.generation()) is None
+
+
+def test_concurrent_bumps_are_not_lost(app, shared_path):
+
+    caches = [shared_cache(app, shared_path) for _ in range(4)] #one connection each, like separate processes
+    start = caches[0].generation()
+
+    def bump(cache):
+        for _ in range(25):
+            cache.invalidate()
+
+    threads = [threading.Thread(target = bump, args = (cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert caches[0].generation() == start + 100
+
+
+def test_expired_pages_get_swept(app, shared_path):
+
+    cache = shared_cache(app, shared_path)
+    cache.ttl = -1 #everything is expired the moment it's written
+    cache.set('/api/shop?page=1', 'old', 0, size = 3)
+    cache.invalidate()
+    cache._purged = 0
+    cache.set('/api/shop?page=1', 'new', cache.generation(), size = 3)
+
+    assert cache.shared.count() == 1 #just the generation, both pages were past their expiry
+
+
+def test_checkout_queue_workers_invalidate_the_shared_cache(app, shared_path, make_products, monkeypatch):
+
+    cache = shared_cache(app, shared_path)
+    monkeypatch.setattr(sys.modules['rangers_shop.catalog_cache'], 'catalog_cache', cache) #the one the session hooks bump
+    prod_id, = make_products(1)
+    generation = cache.generation()
+
+    checkout_queue.enqueue('customer', [(prod_id, 2)])
+    db.session.commit()
+    checkout_queue.process_batch(10) #what `flask orders work` runs, its stock UPDATE is a product change
+
+    assert cache.generation() > generation
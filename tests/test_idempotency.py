@@ -0,0 +1,72 @@
+#Idempotency-Key on POST /api/order/batch/<order_id>: a retry gets the first answer back & is only applied once
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy.exc import IntegrityError
+
+from rangers_shop.models import Order, db
+
+
+
+@pytest.fixture
+def order(client, headers, make_products):
+    prod_ids = make_products(2)
+    response = client.post("/api/order/create/idempotent", json = {'order': [{'prod_id': prod_id, 'quantity': 1} for prod_id in prod_ids]}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['order_id'], prod_ids
+
+
+def batch(client, headers, order_id, prod_id, quantity, key = 'retry-1'):
+    return client.post(f"/api/order/batch/{order_id}", json = {'changes': [{'prod_id': prod_id, 'quantity': quantity}]},
+                       headers = {**headers, 'Idempotency-Key': key})
+
+
+def total(order_id):
+    db.session.expire_all()
+    return db.session.get(Order, order_id).order_total
+
+
+def test_retry_gets_the_same_answer(client, headers, order):
+
+    order_id, (prod_id, _) = order
+    first = batch(client, headers, order_id, prod_id, 3)
+    again = batch(client, headers, order_id, prod_id, 3)
+
+    assert first.status_code == again.status_code == 200
+    assert first.get_json() == again.get_json()
+    assert total(order_id) == 40
+
+
+def test_same_key_different_body_is_422(client, headers, order):
+
+    order_id, (prod_id, other_id) = order
+    assert batch(client, headers, order_id, prod_id, 3).status_code == 200
+
+    for response in (batch(client, headers, order_id, prod_id, 5), batch(client, headers, order_id, other_id, 3)):
+        assert response.status_code == 422, response.get_json()
+    assert total(order_id) == 40 #only the first one was applied
+
+
+def test_keys_belong_to_one_caller(app, client, headers, order):
+
+    order_id, (prod_id, _) = order
+    assert batch(client, headers, order_id, prod_id, 3).status_code == 200
+
+    #someone else picked the same key, they get their own answer (not ours & not a 422)
+    other = {'Authorization': f"Bearer {create_access_token(identity = 'someone-else')}"}
+    response = batch(client, other, order_id, prod_id, 4)
+    assert response.status_code == 200, response.get_json()
+    assert total(order_id) == 50
+
+
+@pytest.mark.parametrize('key', [None, 'retry-1'])
+def test_integrity_error_without_a_saved_key_is_raised(monkeypatch, client, headers, order, key):
+
+    order_id, (prod_id, _) = order
+
+    def commit():
+        raise IntegrityError('INSERT', {}, Exception('something else broke'))
+    monkeypatch.setattr(db.session, 'commit', commit)
+
+    request_headers = {**headers, 'Idempotency-Key': key} if key else headers
+    with pytest.raises(IntegrityError):
+        client.post(f"/api/order/batch/{order_id}", json = {'changes': [{'prod_id': prod_id, 'quantity': 2}]}, headers = request_headers)
@@ -0,0 +1,136 @@
+#cart reservations & the guarded stock UPDATEs: bad input gets a 4xx & stock never goes negative or goes missing
+import random
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from rangers_shop.models import Product, ProdOrder, Reservation, db
+
+
+
+def stock(prod_id):
+    db.session.expire_all()
+    return db.session.get(Product, prod_id).quantity
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'quantity': -5}, 400),
+    ({'quantity': 0}, 400),
+    ({'quantity': 1.5}, 400),
+    ({'quantity': 'lots'}, 400),
+    ({'quantity': True}, 400),
+    ({}, 400),
+])
+def test_reserve_rejects_bad_quantities(client, headers, make_products, body, status):
+
+    prod_id, = make_products(1, quantity = 10)
+
+    response = client.post('/api/reserve/customer', json = {'prod_id': prod_id, **body}, headers = headers)
+
+    assert response.status_code == status
+    assert stock(prod_id) == 10
+    assert Reservation.query.count() == 0
+
+
+def test_reserve_unknown_product_is_404(client, headers):
+
+    response = client.post('/api/reserve/customer', json = {'prod_id': 'nope', 'quantity': 1}, headers = headers)
+    assert response.status_code == 404
+
+
+def test_reserve_without_a_body_is_400(client, headers):
+
+    response = client.post('/api/reserve/customer', data = 'not json', headers = headers)
+    assert response.status_code == 400
+
+
+def test_reservation_is_used_by_the_order(client, headers, make_products):
+
+    prod_id, = make_products(1, quantity = 10)
+
+    assert client.post('/api/reserve/customer', json = {'prod_id': prod_id, 'quantity': 4}, headers = headers).status_code == 200
+    assert stock(prod_id) == 6
+
+    response = client.post('/api/order/create/customer', json = {'order': [{'prod_id': prod_id, 'quantity': 3}]}, headers = headers)
+    assert response.status_code == 200
+    assert stock(prod_id) == 7 #3 came out of the reservation, the 1 left over went back
+    assert Reservation.query.count() == 0
+
+
+def test_claim_ignores_a_negative_reservation(client, headers, make_products):
+
+    prod_id, = make_products(1, quantity = 10)
+    db.session.add(Reservation(prod_id, 'customer', -5, datetime.utcnow() + timedelta(minutes = 15))) #written before the checks existed
+    db.session.commit()
+
+    response = client.post('/api/order/create/customer', json = {'order': [{'prod_id': prod_id, 'quantity': 3}]}, headers = headers)
+
+    assert response.status_code == 200
+    assert stock(prod_id) == 7
+
+
+@pytest.mark.parametrize('method, url', [('POST', '/api/order/update/{order_id}'), ('DELETE', '/api/order/delete/{order_id}')])
+def test_update_and_delete_a_missing_line_is_404(client, headers, make_products, method, url):
+
+    on_order, not_on_order = make_products(2)
+    order_id = client.post('/api/order/create/customer', json = {'order': [{'prod_id': on_order, 'quantity': 1}]}, headers = headers).get_json()['order_id']
+
+    for order, prod_id in [(order_id, not_on_order), ('no-such-order', on_order), (order_id, 'no-such-product')]:
+        response = client.open(url.format(order_id = order), method = method, json = {'prod_id': prod_id, 'quantity': 2}, headers = headers)
+        assert response.status_code == 404, (order, prod_id)
+
+
+@pytest.mark.parametrize('body', [{}, {'prod_id': 'x'}, {'prod_id': 'x', 'quantity': 'two'}, {'prod_id': 'x', 'quantity': 0}])
+def test_update_bad_input_is_400(client, headers, body):
+
+    response = client.post('/api/order/update/some-order', json = body, headers = headers)
+    assert response.status_code == 400
+
+
+#lots of customers reserving, checking out & letting go of the same few products at once. Whatever order
+#it happens in, every unit is either still in stock, held by a reservation or on an order
+def test_concurrent_reservations_and_orders_keep_stock_whole(app, headers, make_products):
+
+    start_stock = 40
+    prod_ids = make_products(2, quantity = start_stock)
+    errors = []
+    statuses = []
+
+    def shopper(number):
+        rng = random.Random(number)
+        client = app.test_client()
+        cust_id = f"customer-{number % 5}" #a few customers share carts so orders claim each other's reservations
+
+        for _ in range(15):
+            prod_id = rng.choice(prod_ids)
+            action = rng.random()
+
+            if action < 0.5:
+                response = client.post(f"/api/reserve/{cust_id}", json = {'prod_id': prod_id, 'quantity': rng.randint(1, 3)}, headers = headers)
+                if response.status_code == 200 and rng.random() < 0.3:
+                    response = client.delete(f"/api/reserve/delete/{response.get_json()['reservation_id']}", headers = headers)
+            else:
+                response = client.post(f"/api/order/create/{cust_id}", json = {'order': [{'prod_id': prod_id, 'quantity': rng.randint(1, 3)}]}, headers = headers)
+
+            statuses.append(response.status_code)
+            if response.status_code not in (200, 404, 409):
+                errors.append((response.status_code, response.get_data(as_text = True)))
+
+    threads = [threading.Thread(target = shopper, args = (number,)) for number in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors[:3]
+    assert 409 in statuses #we really did run out & got turned away
+
+    db.session.expire_all()
+    for prod_id in prod_ids:
+        left = db.session.get(Product, prod_id).quantity
+        reserved = db.session.scalar(db.select(db.func.coalesce(db.func.sum(Reservation.quantity), 0)).where(Reservation.prod_id == prod_id))
+        ordered = db.session.scalar(db.select(db.func.coalesce(db.func.sum(ProdOrder.quantity), 0)).where(ProdOrder.prod_id == prod_id))
+
+        assert left >= 0
+        assert left + reserved + ordered == start_stock
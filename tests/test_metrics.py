@@ -0,0 +1,38 @@
+#GET /metrics/...: localhost only unless METRICS_TOKEN is set, then a bearer token from anywhere
+import pytest
+
+from rangers_shop.images import get_image_cache
+
+
+
+def get_pool(client, ip, headers = None):
+    return client.get("/metrics/pool", headers = headers, environ_base = {'REMOTE_ADDR': ip}).status_code
+
+
+@pytest.mark.parametrize('ip, status', [('127.0.0.1', 200), ('::1', 200), ('10.0.0.5', 403)])
+def test_without_a_token_only_localhost_gets_in(client, ip, status):
+    assert get_pool(client, ip) == status
+
+
+def test_with_a_token_anyone_who_has_it_gets_in(app, client, monkeypatch):
+
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-me')
+
+    assert get_pool(client, '10.0.0.5', {'Authorization': 'Bearer scrape-me'}) == 200
+    assert get_pool(client, '10.0.0.5', {'Authorization': 'Bearer wrong'}) == 401
+    assert get_pool(client, '127.0.0.1') == 401
+
+
+def test_image_cache_numbers_are_exported(app, client):
+
+    cache = get_image_cache(app)
+    cache.get_or_fetch('Brass Compass', lambda: 'https://img.example/compass.png') #a miss & a lookup
+    cache.get_or_fetch('brass  compass', lambda: None) #a hit
+
+    caches = client.get("/metrics/caches").get_json()['caches']
+    assert caches['images']['hits'] >= 1 and caches['images']['lookups'] >= 1
+    assert caches['images']['hit_rate'] is not None
+
+    text = client.get("/metrics").get_data(as_text = True)
+    for name in ('hits', 'misses', 'evictions', 'lookups'):
+        assert f'shop_image_cache_{name}_total ' in text
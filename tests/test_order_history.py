@@ -0,0 +1,87 @@
+#the history summaries (OrderSummary & CustomerSummary) agree with prod_order, whichever path wrote them
+from datetime import datetime
+from decimal import Decimal
+
+from rangers_shop.models import Customer, Order, ProdOrder, db
+from rangers_shop.order_history import rebuild_history
+
+
+
+def place(client, headers, cust_id, prod_ids, quantity = 1):
+    response = client.post(f"/api/order/create/{cust_id}", json = {'order': [{'prod_id': prod_id, 'quantity': quantity} for prod_id in prod_ids]}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['order_id']
+
+
+def summary(client, headers, cust_id):
+    response = client.get(f"/api/order/{cust_id}/summary", headers = headers)
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    return body['order_count'], body['line_count'], body['item_count'], Decimal(str(body['total_spent']))
+
+
+def history(client, headers, cust_id):
+    response = client.get(f"/api/order/{cust_id}/history", headers = headers)
+    assert response.status_code == 200
+    return {row['order_id']: (row['line_count'], row['item_count'], Decimal(str(row['order_total']))) for row in response.get_json()}
+
+
+def rebuilt(client, headers, cust_id):
+    rebuild_history(cust_id)
+    db.session.commit()
+    return summary(client, headers, cust_id), history(client, headers, cust_id)
+
+
+def test_reconcile_totals_fixes_the_summaries(app, client, headers, make_products):
+
+    prod_ids = make_products(3)
+    order_id = place(client, headers, 'reconciled', prod_ids)
+    place(client, headers, 'reconciled', prod_ids[:1])
+
+    #a line price that was fixed by hand in the database, nothing else knows about it
+    db.session.execute(
+        db.update(ProdOrder)
+        .where(ProdOrder.order_id == order_id, ProdOrder.prod_id == prod_ids[0])
+        .values(price = Decimal('99.00'))
+    )
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args = ['orders', 'reconcile-totals'])
+    assert result.exit_code == 0, result.output
+    assert '2 history summaries' in result.output #the order's summary & the customer's
+
+    assert db.session.get(Order, order_id).order_total == Decimal('119.00')
+    assert history(client, headers, 'reconciled')[order_id][2] == Decimal('119.00')
+    assert summary(client, headers, 'reconciled')[3] == Decimal('129.00')
+
+    #same numbers as adding everything up from scratch
+    before = summary(client, headers, 'reconciled'), history(client, headers, 'reconciled')
+    assert rebuilt(client, headers, 'reconciled') == before
+
+
+def test_new_customers_get_the_time_they_signed_up(client, headers, make_products):
+
+    started = datetime.utcnow() #after the app was imported, an import-time default would be older
+    place(client, headers, 'brand-new', make_products(1))
+
+    assert db.session.get(Customer, 'brand-new').date_created >= started
+
+
+def test_emptied_orders_count_the_same_after_a_rebuild(client, headers, make_products):
+
+    prod_ids = make_products(3)
+    place(client, headers, 'emptied', prod_ids[:2])
+    deleted = place(client, headers, 'emptied', prod_ids[2:])
+    removed = place(client, headers, 'emptied', prod_ids[2:])
+
+    #the last line of one order goes through DELETE, of another through a batch edit
+    response = client.delete(f"/api/order/delete/{deleted}", json = {'prod_id': prod_ids[2]}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+    response = client.post(f"/api/order/batch/{removed}", json = {'changes': [{'prod_id': prod_ids[2], 'quantity': 0}]}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+
+    before = summary(client, headers, 'emptied'), history(client, headers, 'emptied')
+    assert before[0] == (3, 2, 2, Decimal('20.00'))
+    assert before[1][deleted] == before[1][removed] == (0, 0, Decimal('0'))
+
+    assert rebuilt(client, headers, 'emptied') == before
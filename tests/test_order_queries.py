@@ -0,0 +1,50 @@
+#the order endpoints run the same number of SQL statements no matter how many lines an order has (no N+1)
+import pytest
+
+
+
+def place(client, headers, cust_id, prod_ids):
+    response = client.post(f"/api/order/create/{cust_id}", json = {'order': [{'prod_id': prod_id, 'quantity': 1} for prod_id in prod_ids]}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['order_id']
+
+
+def create_queries(client, headers, count_queries, prod_ids):
+    with count_queries() as queries:
+        place(client, headers, 'returning-customer', prod_ids)
+    return queries['n']
+
+
+def get_queries(client, headers, count_queries, cust_id):
+    with count_queries() as queries:
+        response = client.get(f"/api/order/{cust_id}", headers = headers)
+        body = response.get_json() #the body is streamed, read all of it inside the block
+    assert response.status_code == 200
+    return queries['n'], len(body)
+
+
+def test_create_order_queries_do_not_grow_with_lines(client, headers, make_products, count_queries):
+
+    prod_ids = make_products(50)
+    place(client, headers, 'returning-customer', prod_ids[:1]) #first order also creates the customer
+
+    counts = {lines: create_queries(client, headers, count_queries, prod_ids[:lines]) for lines in (1, 5, 50)}
+
+    assert len(set(counts.values())) == 1, counts
+
+
+@pytest.mark.parametrize('orders', [1, 10])
+def test_get_order_queries_do_not_grow_with_lines(client, headers, make_products, count_queries, orders):
+
+    prod_ids = make_products(20)
+
+    counts = {}
+    for round_number in range(2):
+        cust_id = f"customer-{round_number}"
+        for _ in range(orders * (1 + round_number * 4)): #the second customer has 5x the lines
+            place(client, headers, cust_id, prod_ids)
+        counts[cust_id] = get_queries(client, headers, count_queries, cust_id)
+
+    (small, small_lines), (big, big_lines) = counts.values()
+    assert big_lines == 5 * small_lines
+    assert small == big, counts
@@ -0,0 +1,49 @@
+#malformed order bodies get a 400, never a 500
+import pytest
+
+
+
+@pytest.mark.parametrize('body', ['[]', '[{"prod_id": "x", "quantity": 1}]', '"order"', '3', 'null', '{"order": "x"}', 'not json'])
+def test_create_order_bad_body_is_400(client, headers, body):
+
+    response = client.post("/api/order/create/someone", data = body, content_type = 'application/json', headers = headers)
+    assert response.status_code == 400, response.get_json()
+
+
+def batch(client, headers, order_id, body):
+    return client.post(f"/api/order/batch/{order_id}", data = body, content_type = 'application/json', headers = headers)
+
+
+@pytest.fixture
+def order(client, headers, make_products):
+    prod_ids = make_products(2)
+    response = client.post("/api/order/create/batcher", json = {'order': [{'prod_id': prod_id, 'quantity': 2} for prod_id in prod_ids]}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['order_id'], prod_ids
+
+
+@pytest.mark.parametrize('body', [
+    '[]', '"changes"', 'not json',
+    '{"changes": {"prod_id": "x", "quantity": 1}}', '{"changes": ["x"]}',
+    '{"changes": [{"quantity": 1}]}', '{"changes": [{"prod_id": "PROD", "quantity": "lots"}]}',
+    '{"changes": [{"prod_id": "PROD", "quantity": 1.5}]}', '{"changes": [{"prod_id": "PROD", "quantity": true}]}',
+    '{"remove": "PROD"}', '{"remove": [1]}'
+])
+def test_batch_bad_body_is_400(client, headers, order, body):
+
+    order_id, (prod_id, _) = order
+    response = batch(client, headers, order_id, body.replace('PROD', prod_id))
+    assert response.status_code == 400, response.get_json()
+
+
+def test_batch_negative_quantity_is_400_like_update(client, headers, order):
+
+    order_id, (prod_id, _) = order
+    response = batch(client, headers, order_id, f'{{"changes": [{{"prod_id": "{prod_id}", "quantity": -1}}]}}')
+    assert response.status_code == 400, response.get_json()
+
+    response = client.put(f"/api/order/update/{order_id}", json = {'prod_id': prod_id, 'quantity': -1}, headers = headers)
+    assert response.status_code == 400
+
+    lines = client.get("/api/order/batcher", headers = headers).get_json()
+    assert len(lines) == 2 #nothing was taken off the order
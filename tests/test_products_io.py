@@ -0,0 +1,39 @@
+#bulk catalog import: new products get inserted, products we already have (same name) get updated
+import io
+
+from rangers_shop.helpers import PLACEHOLDER_IMAGE
+from rangers_shop.models import Product, db
+from rangers_shop.products_io import import_products
+
+
+
+def run_import(text, format = 'csv'):
+    totals = import_products(io.StringIO(text), format)
+    db.session.expire_all()
+    return totals
+
+
+def image_of(name):
+    return db.session.execute(db.select(Product.image).where(Product.name == name)).scalar_one()
+
+
+def test_reimport_without_image_keeps_the_resolved_image(app):
+
+    totals = run_import("name,price,quantity\nLantern,12.50,4\nRope,3.00,10\n")
+    assert (totals['inserted'], totals['updated']) == (2, 0)
+    assert image_of('Lantern') == PLACEHOLDER_IMAGE #new products without an image get the placeholder
+
+    #what flask products resolve-images does
+    db.session.execute(db.update(Product).where(Product.name == 'Lantern').values(image = 'https://img.example/lantern.png'))
+    db.session.commit()
+
+    #same products again, no image column at all & a blank one, plus one row that does bring an image
+    totals = run_import("name,price,quantity\nLantern,15.00,4\n")
+    assert totals['updated'] == 1
+    totals = run_import('{"name": "Lantern", "price": "16.00", "quantity": 2, "image": ""}\n'
+                        '{"name": "Rope", "price": "3.50", "quantity": 9, "image": "https://img.example/rope.png"}\n', 'jsonl')
+    assert totals['updated'] == 2
+
+    assert image_of('Lantern') == 'https://img.example/lantern.png'
+    assert image_of('Rope') == 'https://img.example/rope.png'
+    assert db.session.execute(db.select(Product.price).where(Product.name == 'Lantern')).scalar_one() == 16
@@ -0,0 +1,47 @@
+#products changed through the models (not just the site routes) show up in GET /api/search right away
+from decimal import Decimal
+
+import pytest
+
+from rangers_shop.models import Product, db
+from rangers_shop.pagination import encode_cursor
+
+
+
+def found(client, headers, text):
+    response = client.get("/api/search", query_string = {'q': text}, headers = headers)
+    assert response.status_code == 200, response.get_json()
+    return {row['prod_id'] for row in response.get_json()}
+
+
+def test_products_saved_through_the_models_are_searchable(client, headers):
+
+    product = Product('Brass Compass', Decimal('25.00'), 5, 'https://img.example/compass.png', 'points north')
+    db.session.add(product)
+    db.session.commit()
+    prod_id = product.prod_id
+
+    assert prod_id in found(client, headers, 'compass')
+    assert prod_id in found(client, headers, 'north')
+
+    product = db.session.get(Product, prod_id)
+    product.name = 'Brass Sextant'
+    db.session.commit()
+
+    assert prod_id not in found(client, headers, 'compass')
+    assert prod_id in found(client, headers, 'sextant')
+
+    db.session.delete(db.session.get(Product, prod_id))
+    db.session.commit()
+
+    assert prod_id not in found(client, headers, 'sextant')
+
+
+@pytest.mark.parametrize('values', [('x', 'y'), (1.5, ['a']), (None, 'a'), (True, 'a'), ('nan', 'a'), (1.5,), (1.5, 'a', 'b')])
+def test_a_made_up_cursor_is_400(client, headers, values):
+
+    db.session.add(Product('Brass Compass', Decimal('25.00'), 5, 'https://img.example/compass.png', 'points north'))
+    db.session.commit()
+
+    response = client.get("/api/search", query_string = {'q': 'compass', 'cursor': encode_cursor(*values)}, headers = headers)
+    assert response.status_code == 400, response.get_json()
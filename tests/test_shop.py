@@ -0,0 +1,19 @@
+#GET /api/shop filters
+import pytest
+
+
+
+@pytest.mark.parametrize('param', ['min_price', 'max_price'])
+@pytest.mark.parametrize('value', ['nan', 'NaN', 'inf', '-inf', 'Infinity', 'sNaN', 'cheap'])
+def test_price_filters_need_a_real_number(client, headers, make_products, param, value):
+
+    make_products(2)
+    response = client.get("/api/shop", query_string = {param: value}, headers = headers)
+    assert response.status_code == 400, response.get_json()
+
+
+def test_price_filters(client, headers, make_products):
+
+    make_products(2)
+    assert len(client.get("/api/shop", query_string = {'min_price': '5', 'max_price': '10.00'}, headers = headers).get_json()) == 2
+    assert len(client.get("/api/shop", query_string = {'min_price': '10.01'}, headers = headers).get_json()) == 0
@@ -0,0 +1,62 @@
+#POST /api/token & /api/token/refresh
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import decode_token
+
+from rangers_shop import api_tokens
+from rangers_shop.api_tokens import revocations
+from rangers_shop.models import ApiClient, RevokedToken, db
+
+
+
+@pytest.fixture
+def api_client(app, monkeypatch):
+
+    monkeypatch.setitem(app.config, 'TOKEN_RATE_LIMIT', 3)
+    monkeypatch.setattr(api_tokens, '_token_limiter', None) #a fresh limiter with that limit
+
+    client = ApiClient('test app')
+    secret = client.new_secret()
+    db.session.add(client)
+    db.session.commit()
+
+    return client.client_id, secret
+
+
+def get_token(client, client_id, secret, ip):
+    return client.post("/api/token", json = {'client_id': client_id, 'client_secret': secret}, environ_base = {'REMOTE_ADDR': ip})
+
+
+def test_wrong_secrets_do_not_use_up_the_clients_tries(client, api_client):
+
+    client_id, secret = api_client
+
+    codes = [get_token(client, client_id, 'guess', '10.0.0.66').status_code for _ in range(5)]
+    assert codes == [401, 401, 401, 429, 429] #the guessing ip is cut off
+
+    response = get_token(client, client_id, secret, '10.0.0.1')
+    assert response.status_code == 200, response.get_json()
+
+
+def test_a_client_is_limited_once_its_secret_checks_out(client, api_client):
+
+    client_id, secret = api_client
+
+    codes = [get_token(client, client_id, secret, f"10.0.0.{number}").status_code for number in range(5)]
+    assert codes == [200, 200, 200, 429, 429]
+
+
+def test_refresh_token_used_twice_at_once_is_401(client, api_client):
+
+    client_id, secret = api_client
+    refresh_token = get_token(client, client_id, secret, '10.0.0.1').get_json()['refresh_token']
+
+    #the other request already swapped it & committed, this worker's revocation list hasn't heard yet
+    revocations.refresh(force = True)
+    claims = decode_token(refresh_token)
+    db.session.add(RevokedToken(jti = claims['jti'], expires_at = datetime.utcfromtimestamp(claims['exp'])))
+    db.session.commit()
+
+    response = client.post("/api/token/refresh", headers = {'Authorization': f"Bearer {refresh_token}"})
+    assert response.status_code == 401, response.get_json()